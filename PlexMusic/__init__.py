@@ -1,14 +1,19 @@
 import asyncio
+import time
 
 from redbot.core.bot import Red
 from redbot.core.utils import get_end_user_data_statement
 
 __red_end_user_data_statement__ = get_end_user_data_statement(__file__)
 
+_import_started = time.perf_counter()
 from .plex_music import PlexMusic
 
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
 
 async def setup(bot: Red):
     cog = PlexMusic(bot)
+    cog.startup.import_seconds = IMPORT_SECONDS
     bot.add_cog(cog)
     asyncio.create_task(cog._init())
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import quote_plus
+
+import aiohttp
+from plexapi.server import PlexServer
+
+from .async_plex import PlexExecutorPool
+from .scheduling import Priority
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.artwork")
+
+# Embed thumbnails are displayed at 80x80, this leaves room for high DPI screens.
+ART_SIZE = 300
+MEMORY_LIMIT = 16 * 1024 * 1024
+DISK_LIMIT = 256 * 1024 * 1024
+
+# Matches thumb/art/composite paths, e.g. `/library/metadata/123/thumb/1612345678`.
+_ART_PATH_RE = re.compile(r"/(\d+)/(thumb|art|composite)/(\d+)")
+
+
+class ArtworkCache:
+    """Two tier cache of resized artwork, a byte bounded LRU in memory backed by a capped folder.
+
+    Art is requested through Plex's image transcoder so only small images are
+    ever downloaded, concurrent requests for the same art share one download.
+    With `executors` downloads wait for a slot of the server's scheduler behind
+    every other kind of request.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        path: Path,
+        memory_limit: int = MEMORY_LIMIT,
+        disk_limit: int = DISK_LIMIT,
+        size: int = ART_SIZE,
+        executors: Optional[PlexExecutorPool] = None,
+    ):
+        self.session = session
+        self.executors = executors
+        self.path = path
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.size = size
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def cache_key(path: str) -> str:
+        """Key art by the ratingKey and timestamp in its path, both change with the art."""
+        if match := _ART_PATH_RE.search(path):
+            rating_key, kind, timestamp = match.groups()
+            return f"{kind}-{rating_key}-{timestamp}"
+        return hashlib.sha1(path.encode()).hexdigest()
+
+    @classmethod
+    def key(cls, server: PlexServer, path: str) -> str:
+        """Key of the art at `path` on `server`, unique across servers."""
+        return f"{server.machineIdentifier}-{cls.cache_key(path)}"
+
+    async def get(self, server: PlexServer, path: Optional[str]) -> Optional[bytes]:
+        """
+        Get resized art from the cache, downloading it if needed
+        Args:
+            server: The PlexServer the art belongs to.
+            path: The thumb/composite path of the item.
+        Returns:
+            The image bytes or None if it couldn't be fetched.
+        """
+        if not path:
+            return None
+        key = self.key(server, path)
+        if (data := self._memory.get(key)) is not None:
+            self._memory.move_to_end(key)
+            return data
+        if (task := self._inflight.get(key)) is None:
+            # The download runs in its own task, so a caller giving up doesn't fail everyone else.
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(server, path, key))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, server: PlexServer, path: str, key: str) -> Optional[bytes]:
+        try:
+            data = await self._load(server, path, key)
+        except Exception as exc:
+            log.debug("Unable to fetch art %s", path, exc_info=exc)
+            return None
+        if data is not None:
+            self._remember(key, data)
+        return data
+
+    async def _load(self, server: PlexServer, path: str, key: str) -> Optional[bytes]:
+        loop = asyncio.get_running_loop()
+        file = self.path / f"{key}.jpg"
+        if (data := await loop.run_in_executor(None, self._read, file)) is not None:
+            return data
+        url = server.transcodeImage(quote_plus(path), self.size, self.size)
+        if self.executors is None:
+            data = await self._download(url)
+        else:
+            scheduler = self.executors.get(server._baseurl).scheduler
+            async with scheduler.slot(Priority.COSMETIC):
+                data = await self._download(url)
+        if data is not None:
+            await loop.run_in_executor(None, self._write, file, data)
+        return data
+
+    async def _download(self, url: str) -> Optional[bytes]:
+        async with self.session.get(url + "&minSize=1&upscale=1") as resp:
+            if resp.status != 200:
+                return None
+            return await resp.read()
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_limit:
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # Disk tier, these run in the default executor.
+
+    @staticmethod
+    def _read(file: Path) -> Optional[bytes]:
+        try:
+            data = file.read_bytes()
+        except OSError:
+            return None
+        # Refresh the mtime so eviction drops the least recently used files first.
+        os.utime(file)
+        return data
+
+    def _write(self, file: Path, data: bytes):
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(f.stat().st_size for f in self.path.glob("*.jpg"))
+        tmp = file.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(file)
+        self._disk_bytes += len(data)
+        if self._disk_bytes > self.disk_limit:
+            self._evict()
+
+    def _evict(self):
+        files = sorted(
+            ((f.stat().st_mtime, f.stat().st_size, f) for f in self.path.glob("*.jpg")),
+            key=lambda entry: entry[0],
+        )
+        self._disk_bytes = sum(size for _, size, _ in files)
+        # Trim down to 90% of the cap so every new file doesn't trigger a scan.
+        for _, size, file in files:
+            if self._disk_bytes <= self.disk_limit * 0.9:
+                break
+            try:
+                file.unlink()
+            except OSError:
+                continue
+            self._disk_bytes -= size
@@ -0,0 +1,270 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TypeVar
+
+import plexapi.audio
+import plexapi.playlist
+import requests
+from plexapi.library import MusicSection
+from plexapi.server import PlexServer
+
+from .exceptions import PlexTimeoutError
+from .instrumentation import Metrics
+from .scheduling import FairScheduler
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.async_plex")
+
+T = TypeVar("T")
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_TIMEOUT = 30.0
+PLEX_TV = "https://plex.tv"
+# Items requested per page when walking large albums and playlists.
+PAGE_SIZE = 200
+
+
+class PlexExecutor:
+    """A bounded thread pool dedicated to a single Plex server.
+
+    Every blocking PlexAPI call made against a server goes through its executor,
+    so a slow server can only ever tie up its own threads and never the event loop.
+    Calls wait for a slot of its `FairScheduler` rather than in the thread pool's
+    own queue, so they start by priority and guilds take turns.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        timeout: float = DEFAULT_TIMEOUT,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.metrics = metrics
+        self.scheduler = FairScheduler(name, max_workers, metrics)
+        self.last_used = time.monotonic()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"PlexMusic-{name}"
+        )
+
+    async def run(
+        self, func: Callable[..., T], *args: Any, timeout: Optional[float] = None, **kwargs: Any
+    ) -> T:
+        """
+        Run a blocking callable in this server's thread pool
+        Args:
+            func: The blocking callable.
+            timeout: Seconds to wait before giving up, defaults to the executor timeout.
+        Returns:
+            Whatever `func` returns.
+        Raises:
+            PlexTimeoutError: The call did not complete in time.
+        """
+        start = time.perf_counter()
+        self.last_used = time.monotonic()
+        try:
+            # Cancelling the awaiting task, or hitting the timeout, drops calls
+            # that are still waiting for a slot.
+            return await asyncio.wait_for(
+                self._call(functools.partial(func, *args, **kwargs)), timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            log.warning("%s timed out after %ss on %s", func, timeout or self.timeout, self.name)
+            raise PlexTimeoutError(f"Plex call to {self.name} timed out") from None
+        finally:
+            if self.metrics is not None:
+                name = getattr(func, "__qualname__", None) or type(func).__name__
+                self.metrics.observe(
+                    "plex_call_seconds", name, time.perf_counter() - start, "call"
+                )
+
+    async def _call(self, call: Callable[[], T]) -> T:
+        await self.scheduler.acquire()
+        try:
+            future = self._pool.submit(call)
+        except BaseException:
+            self.scheduler.release()
+            raise
+        loop = asyncio.get_running_loop()
+        # The slot is only free once the thread is, a call that timed out keeps running.
+        future.add_done_callback(lambda _: self._release_soon(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release_soon(self, loop: asyncio.AbstractEventLoop):
+        """Release a slot of the scheduler from any thread."""
+        try:
+            loop.call_soon_threadsafe(self.scheduler.release)
+        except RuntimeError:
+            # The loop is closed, nothing waits for the slot anymore.
+            pass
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+class PlexExecutorPool:
+    """Hands out one `PlexExecutor` per Plex server base url."""
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        timeout: float = DEFAULT_TIMEOUT,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.metrics = metrics
+        self._executors: Dict[str, PlexExecutor] = {}
+
+    @property
+    def executors(self) -> List[PlexExecutor]:
+        return list(self._executors.values())
+
+    def get(self, baseurl: str) -> PlexExecutor:
+        baseurl = baseurl.rstrip("/")
+        if baseurl not in self._executors:
+            self._executors[baseurl] = PlexExecutor(
+                baseurl, self.max_workers, self.timeout, self.metrics
+            )
+        return self._executors[baseurl]
+
+    async def run_for(self, item, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking call in the executor of the server `item` was loaded from."""
+        return await self.get(item._server._baseurl).run(func, *args, **kwargs)
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown()
+        self._executors.clear()
+
+
+class AsyncMusicSection:
+    """Awaitable facade over a `plexapi.library.MusicSection`."""
+
+    def __init__(self, section: MusicSection, server: "AsyncPlexServer"):
+        self.section = section
+        self.server = server
+
+    @property
+    def key(self) -> str:
+        return self.section.key
+
+    @property
+    def title(self) -> str:
+        return self.section.title
+
+    @property
+    def name(self) -> str:
+        return f"{self.title} on {self.server.name}"
+
+    async def search_tracks(self, **kwargs) -> List[plexapi.audio.Track]:
+        return await self.server.run(self.section.searchTracks, **kwargs)
+
+    async def search_albums(self, **kwargs) -> List[plexapi.audio.Album]:
+        return await self.server.run(self.section.searchAlbums, **kwargs)
+
+
+class AsyncPlexServer:
+    """Awaitable facade over a `plexapi.server.PlexServer`.
+
+    Nothing on this class blocks, calls that need the network are sent
+    to the executor of the server.
+    """
+
+    def __init__(self, server: PlexServer, executor: PlexExecutor):
+        self.server = server
+        self.executor = executor
+        self._sections: Optional[List[AsyncMusicSection]] = None
+
+    @classmethod
+    async def connect(
+        cls,
+        url: str,
+        token: str,
+        executor: PlexExecutor,
+        session: Optional[requests.Session] = None,
+    ) -> "AsyncPlexServer":
+        server = await executor.run(PlexServer, url, token, session=session)
+        return cls(server, executor)
+
+    @property
+    def baseurl(self) -> str:
+        return self.server._baseurl
+
+    @property
+    def last_used(self) -> float:
+        """When a call was last made to the server, through this object or its executor."""
+        return self.executor.last_used
+
+    @property
+    def name(self) -> str:
+        return self.server.friendlyName
+
+    @property
+    def machine_identifier(self) -> str:
+        return self.server.machineIdentifier
+
+    def url(self, key: str, include_token: bool = False) -> str:
+        return self.server.url(key, includeToken=include_token)
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await self.executor.run(func, *args, **kwargs)
+
+    async def music_sections(self, refresh: bool = False) -> List[AsyncMusicSection]:
+        """The music sections of the server, looked up once and then cached."""
+        if self._sections is None or refresh:
+            # `PlexServer.library` performs a request the first time it's accessed.
+            sections = await self.run(lambda: self.server.library.sections())
+            self._sections = [AsyncMusicSection(s, self) for s in sections if s.type == "artist"]
+        return self._sections
+
+    async def music_section(self) -> Optional[AsyncMusicSection]:
+        return next(iter(await self.music_sections()), None)
+
+    async def playlist(self, title: str) -> plexapi.playlist.Playlist:
+        return await self.run(self.server.playlist, title)
+
+    async def playlists(self) -> List[plexapi.playlist.Playlist]:
+        return await self.run(self.server.playlists, playlistType="audio")
+
+    async def fetch_item(self, key):
+        return await self.run(self.server.fetchItem, key)
+
+    async def stream_url(self, item, **params) -> str:
+        return await self.run(item.getStreamURL, **params)
+
+
+async def iter_pages(
+    executors: PlexExecutorPool, container, page_size: int = PAGE_SIZE
+) -> AsyncIterator[List]:
+    """
+    Page through the tracks of an album or the items of a playlist
+    Every page is a single `X-Plex-Container-Start/Size` request made in the
+    executor of the server, so the first items are available long before
+    a large container has been read in full.
+    Args:
+        executors: The executor pool to make the requests in.
+        container: plexapi.audio.Album or plexapi.playlist.Playlist to walk.
+        page_size: The number of items requested at once.
+    Returns:
+        Async iterator of lists of items.
+    """
+    if isinstance(container, plexapi.playlist.Playlist):
+        key = f"{container.key}/items"
+    else:
+        key = f"/library/metadata/{container.ratingKey}/children"
+    total = getattr(container, "leafCount", None)
+    start = 0
+    while total is None or start < total:
+        page = await executors.run_for(
+            container, container.fetchItems, key, container_start=start, container_size=page_size
+        )
+        if page:
+            yield page
+        if not page or (total is None and len(page) < page_size):
+            return
+        start += page_size
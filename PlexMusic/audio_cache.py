@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+import plexapi.audio
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.audio_cache")
+
+DEFAULT_BUDGET = 1024 * 1024 * 1024
+# Tracks are only downloaded once they were played this many times.
+ADMIT_AFTER = 3
+# A single track may take at most this share of the budget.
+MAX_TRACK_SHARE = 0.1
+DOWNLOAD_CONCURRENCY = 2
+CHUNK_SIZE = 256 * 1024
+# Play counts of tracks that aren't cached are forgotten after this many seconds without a play.
+PLAY_WINDOW = 30 * 24 * 60 * 60
+PRUNE_EVERY = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    key TEXT PRIMARY KEY,
+    plays INTEGER NOT NULL,
+    played_at INTEGER NOT NULL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS tracks_cached ON tracks (plays, played_at) WHERE size IS NOT NULL;
+"""
+
+
+class CachedTrack(NamedTuple):
+    key: str
+    plays: int
+    played_at: int
+    size: int
+
+
+class AudioCache:
+    """Byte bounded folder of the media files of frequently played tracks.
+
+    Every play is counted per media part, a track is downloaded in the
+    background once it was played `admit_after` times so one-off plays never
+    churn the cache. When the cache is over budget the least played tracks
+    are evicted, the least recently played first among equals. Play counts
+    and sizes are kept in SQLite so they survive restarts.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        path: Path,
+        budget: int = DEFAULT_BUDGET,
+        admit_after: int = ADMIT_AFTER,
+    ):
+        self.session = session
+        self.path = path
+        self.budget = budget
+        self.admit_after = admit_after
+        self.stats = Counter()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PlexMusic-audio")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._downloads: Dict[str, asyncio.Task] = {}
+        self._download_limit = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    @staticmethod
+    def key(track: plexapi.audio.Track) -> Optional[str]:
+        """Key of the media file of a track, None if it has none."""
+        if not track.media or not track.media[0].parts:
+            return None
+        part = track.media[0].parts[0]
+        return f"{track._server.machineIdentifier}-{track.ratingKey}-{part.id}"
+
+    def file(self, key: str) -> Path:
+        return self.path / f"{key}.audio"
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def initialize(self):
+        await self._run(self._open)
+
+    async def lookup(self, track: plexapi.audio.Track) -> Optional[Path]:
+        """
+        Count a play of a track and get its cached file
+        Args:
+            track: plexapi.audio.Track about to be played.
+        Returns:
+            Path of the cached media file, None if it isn't cached. Tracks played
+            often enough are downloaded in the background for their next play.
+        """
+        if self.budget <= 0 or (key := self.key(track)) is None:
+            return None
+        plays, size = await self._run(self._played, key)
+        if size is not None:
+            self.stats["hits"] += 1
+            self.stats["bytes_saved"] += size
+            return self.file(key)
+        self.stats["misses"] += 1
+        if plays >= self.admit_after:
+            self.download(track)
+        return None
+
+    def download(self, track: plexapi.audio.Track) -> Optional[asyncio.Task]:
+        """Download a track into the cache in the background, None if it can't be cached."""
+        if (key := self.key(track)) is None:
+            return None
+        if (size := track.media[0].parts[0].size or 0) > self.budget * MAX_TRACK_SHARE:
+            log.debug("%s is too large to cache (%d bytes)", track.title, size)
+            return None
+        if key not in self._downloads:
+            self._downloads[key] = asyncio.create_task(self._download(track, key))
+        return self._downloads[key]
+
+    async def prewarm(self, tracks: List[plexapi.audio.Track]) -> int:
+        """
+        Download tracks into the cache regardless of how often they were played
+        Args:
+            tracks: The plexapi.audio.Track objects to cache.
+        Returns:
+            How many of them are cached once done, a playlist larger than the budget
+            evicts some of its own tracks.
+        """
+        downloads = [task for track in tracks if (task := self.download(track)) is not None]
+        await asyncio.gather(*downloads)
+        keys = {key for track in tracks if (key := self.key(track)) is not None}
+        return sum([await self._run(self._cached_size, key) is not None for key in keys])
+
+    async def usage(self) -> Tuple[int, int]:
+        """Number of cached tracks and their size in bytes."""
+        return await self._run(self._usage)
+
+    async def top(self, count: int) -> List[CachedTrack]:
+        """The most played cached tracks."""
+        return await self._run(self._top, count)
+
+    async def resize(self, budget: int):
+        self.budget = budget
+        await self._run(self._evict)
+
+    async def clear(self):
+        self.budget, budget = 0, self.budget
+        try:
+            await self._run(self._evict)
+        finally:
+            self.budget = budget
+
+    def close(self):
+        for task in self._downloads.values():
+            task.cancel()
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+    async def _download(self, track: plexapi.audio.Track, key: str) -> bool:
+        part = track.media[0].parts[0]
+        url = track._server.url(part.key, includeToken=True)
+        temporary = self.file(key).with_suffix(".part")
+        try:
+            async with self._download_limit:
+                if await self._run(self._cached_size, key) is not None:
+                    return True
+                size = 0
+                async with self.session.get(url) as resp:
+                    if resp.status != 200:
+                        log.debug("Unable to download %s, status %d", track.title, resp.status)
+                        return False
+                    with temporary.open("wb") as file:
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > self.budget * MAX_TRACK_SHARE:
+                                return False
+                            await self._run(file.write, chunk)
+                await self._run(self._admit, key, temporary, size)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as exc:
+            log.debug("Unable to download %s", track.title, exc_info=exc)
+            return False
+        finally:
+            del self._downloads[key]
+            if temporary.exists():
+                temporary.unlink()
+        self.stats["admitted"] += 1
+        self.stats["bytes_downloaded"] += size
+        log.debug("Cached %s (%d bytes)", track.title, size)
+        return True
+
+    # Everything below runs on the cache thread.
+
+    def _open(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path / "cache.sqlite3"))
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_SCHEMA)
+        # Files left behind by downloads cut short by a restart.
+        for temporary in self.path.glob("*.part"):
+            temporary.unlink()
+
+    def _close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _played(self, key: str) -> Tuple[int, Optional[int]]:
+        now = int(time.time())
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO tracks (key, plays, played_at) VALUES (?, 1, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "plays = plays + 1, played_at = excluded.played_at",
+                (key, now),
+            )
+        plays, size = self._conn.execute(
+            "SELECT plays, size FROM tracks WHERE key = ?", (key,)
+        ).fetchone()
+        if size is not None and not self.file(key).exists():
+            # Deleted from outside the cog.
+            with self._conn:
+                self._conn.execute("UPDATE tracks SET size = NULL WHERE key = ?", (key,))
+            size = None
+        self.stats["plays"] += 1
+        if self.stats["plays"] % PRUNE_EVERY == 0:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM tracks WHERE size IS NULL AND played_at < ?",
+                    (now - PLAY_WINDOW,),
+                )
+        return plays, size
+
+    def _cached_size(self, key: str) -> Optional[int]:
+        row = self._conn.execute("SELECT size FROM tracks WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _admit(self, key: str, temporary: Path, size: int):
+        os.replace(temporary, self.file(key))
+        # Prewarmed tracks count as played enough to be admitted, so they aren't evicted first.
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO tracks (key, plays, played_at, size) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "plays = MAX(plays, excluded.plays), size = excluded.size",
+                (key, self.admit_after, int(time.time()), size),
+            )
+        self._evict()
+
+    def _usage(self) -> Tuple[int, int]:
+        count, size = self._conn.execute(
+            "SELECT COUNT(*), TOTAL(size) FROM tracks WHERE size IS NOT NULL"
+        ).fetchone()
+        return count, int(size)
+
+    def _top(self, count: int) -> List[CachedTrack]:
+        rows = self._conn.execute(
+            "SELECT key, plays, played_at, size FROM tracks WHERE size IS NOT NULL "
+            "ORDER BY plays DESC, played_at DESC LIMIT ?",
+            (count,),
+        )
+        return [CachedTrack(*row) for row in rows]
+
+    def _evict(self):
+        _, used = self._usage()
+        if used <= self.budget:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM tracks WHERE size IS NOT NULL ORDER BY plays, played_at"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if used <= self.budget:
+                break
+            try:
+                self.file(key).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Still open for playback on Windows, it goes on a later pass.
+                continue
+            evicted.append((key,))
+            used -= size
+        with self._conn:
+            self._conn.executemany("UPDATE tracks SET size = NULL WHERE key = ?", evicted)
+        self.stats["evicted"] += len(evicted)
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Optional
+
+import aiohttp
+from discord import FFmpegOpusAudio, FFmpegPCMAudio
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.buffering")
+
+# Seconds of audio downloaded ahead of FFmpeg.
+DEFAULT_READ_AHEAD = 20
+MAX_READ_AHEAD = 120
+# Lossless originals would otherwise take tens of megabytes per stream.
+MAX_BUFFER = 16 * 1024 * 1024
+MIN_BUFFER = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 10
+# Attempts in a row that received nothing before the stream is given up on.
+MAX_RETRIES = 5
+RETRY_DELAY = 0.5
+# Reads of a frame taking longer than the frame lasts are heard as a gap.
+FRAME_LENGTH = 0.02
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-\d+/(\d+)")
+
+
+class ReadAheadStream:
+    """Audio downloaded ahead of playback into a bounded buffer, which FFmpeg reads through a pipe.
+
+    The download runs on the event loop with the cog's aiohttp session and
+    pauses whenever the buffer is full, a thread writes the buffer into the
+    pipe as fast as FFmpeg reads it. A dropped connection is resumed where it
+    stopped with a range request, so a stall of Plex or its uplink drains the
+    buffer instead of starving the voice client.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        bitrate: int,
+        read_ahead: float = DEFAULT_READ_AHEAD,
+        stats: Optional[Counter] = None,
+    ):
+        self.session = session
+        self.url = url
+        # Bytes per second of audio.
+        self.byte_rate = max(bitrate, 1) * 125
+        self.capacity = min(max(int(read_ahead * self.byte_rate), MIN_BUFFER), MAX_BUFFER)
+        self.stats = stats if stats is not None else Counter()
+        self.received = 0
+        self.size: Optional[int] = None
+        self.failed = False
+        self._chunks: Deque[bytes] = deque()
+        self._buffered = 0
+        self._finished = False
+        self._closed = False
+        self._retries = 0
+        self._condition = threading.Condition()
+        self._space = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._reader: Optional[int]
+        self._reader, self._writer = os.pipe()
+        self._task = asyncio.create_task(self._download())
+        threading.Thread(target=self._feed, name="PlexMusic-readahead", daemon=True).start()
+
+    @property
+    def buffered(self) -> int:
+        return self._buffered
+
+    @property
+    def fill(self) -> float:
+        """Share of the buffer that is filled."""
+        return min(self._buffered / self.capacity, 1.0)
+
+    @property
+    def seconds(self) -> float:
+        """Seconds of audio in the buffer."""
+        return self._buffered / self.byte_rate
+
+    @property
+    def reader(self) -> int:
+        """Read end of the pipe, FFmpeg's stdin."""
+        return self._reader
+
+    def release_reader(self):
+        """Close the read end in this process once FFmpeg inherited it."""
+        if self._reader is not None:
+            os.close(self._reader)
+            self._reader = None
+
+    def close(self):
+        """Stop downloading and feeding FFmpeg, from any thread."""
+        if self._closed:
+            return
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.release_reader()
+        try:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        except RuntimeError:
+            # The loop is closed, so is the task.
+            pass
+
+    async def _download(self):
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT
+        )
+        try:
+            while True:
+                try:
+                    await self._request(timeout)
+                    if self.size is None or self.received >= self.size:
+                        break
+                    raise aiohttp.ClientPayloadError("The response ended early")
+                except (
+                    aiohttp.ClientPayloadError,
+                    aiohttp.ClientConnectionError,
+                    asyncio.TimeoutError,
+                ) as exc:
+                    error = exc
+                self._retries += 1
+                if self._retries > MAX_RETRIES:
+                    raise error
+                self.stats["reconnects"] += 1
+                log.debug("Resuming a stream at byte %d after %r", self.received, error)
+                await asyncio.sleep(RETRY_DELAY * self._retries)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # Errors of aiohttp hold the url and the Plex token in it, only their type is logged.
+            log.warning(
+                "Gave up on a stream after %d bytes: %s %s",
+                self.received,
+                type(exc).__name__,
+                getattr(exc, "status", ""),
+            )
+            self.failed = True
+            self.stats["failed"] += 1
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    async def _request(self, timeout: aiohttp.ClientTimeout):
+        headers = {"Range": f"bytes={self.received}-"} if self.received else {}
+        async with self.session.get(self.url, headers=headers, timeout=timeout) as resp:
+            if resp.status == 416 and self.received:
+                # Everything was received, the server just didn't say how much there was.
+                self.size = self.received
+                return
+            resp.raise_for_status()
+            if resp.status == 206 and (
+                match := _CONTENT_RANGE_RE.match(resp.headers.get("Content-Range", ""))
+            ):
+                skip = self.received - int(match.group(1))
+                self.size = int(match.group(2))
+            else:
+                # No range support, transcodes start over and the received part is skipped.
+                skip = self.received
+                if resp.content_length is not None:
+                    self.size = resp.content_length
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk, skip = chunk[skip:], 0
+                await self._put(chunk)
+
+    async def _put(self, chunk: bytes):
+        while self._buffered >= self.capacity:
+            self._space.clear()
+            await self._space.wait()
+        with self._condition:
+            self._chunks.append(chunk)
+            self._buffered += len(chunk)
+            self._condition.notify()
+        self.received += len(chunk)
+        self._retries = 0
+        self.stats["bytes"] += len(chunk)
+
+    # Everything below runs on the feeding thread.
+
+    def _feed(self):
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._chunks or self._finished or self._closed
+                    )
+                    if self._closed or not self._chunks:
+                        break
+                    chunk = self._chunks.popleft()
+                    self._buffered -= len(chunk)
+                self._loop.call_soon_threadsafe(self._space.set)
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(self._writer, view) :]
+        except (OSError, RuntimeError):
+            # FFmpeg exited or the loop closed.
+            pass
+        finally:
+            os.close(self._writer)
+
+
+class ReadAheadAudio:
+    """FFmpeg audio source reading a `ReadAheadStream` from its stdin."""
+
+    def __init__(self, stream: ReadAheadStream, **kwargs):
+        self.stream = stream
+        self._playing = False
+        try:
+            super().__init__(stream.reader, pipe=True, **kwargs)
+        except Exception:
+            stream.close()
+            raise
+        stream.release_reader()
+
+    def read(self) -> bytes:
+        started = time.perf_counter()
+        data = super().read()
+        # Waiting for the first frame is buffering, any later wait is audible.
+        if self._playing and data and time.perf_counter() - started > FRAME_LENGTH:
+            self.stream.stats["underruns"] += 1
+        self._playing = True
+        return data
+
+    def cleanup(self):
+        # FFmpeg is killed first, so the feeding thread isn't stuck writing to it.
+        super().cleanup()
+        self.stream.close()
+
+
+class ReadAheadPCMAudio(ReadAheadAudio, FFmpegPCMAudio):
+    pass
+
+
+class ReadAheadOpusAudio(ReadAheadAudio, FFmpegOpusAudio):
+    pass
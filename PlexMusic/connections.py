@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Collection, Dict, List, Tuple
+
+import requests
+from plexapi.server import PlexServer
+from requests.adapters import HTTPAdapter
+
+from .async_plex import AsyncPlexServer, PlexExecutorPool
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.connections")
+
+DEFAULT_POOL_SIZE = 4
+# Connections that haven't been used for this many seconds are closed.
+IDLE_TIMEOUT = 30 * 60
+
+
+class PlexConnectionManager:
+    """Shares one PlexServer and one keep-alive HTTP pool per (url, token).
+
+    Users pointing at the same server with the same token reuse a single
+    connection, which keeps the number of sockets and TLS handshakes flat.
+    """
+
+    def __init__(
+        self,
+        executors: PlexExecutorPool,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ):
+        self.executors = executors
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self._servers: Dict[Tuple[str, str], AsyncPlexServer] = {}
+        self._pinned: Dict[Tuple[str, str], bool] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def _session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    async def connect(self, url: str, token: str, pinned: bool = False) -> AsyncPlexServer:
+        """
+        Get the shared connection for a server, connecting if there is none yet
+        Args:
+            url: The base url of the server.
+            token: The auth token to connect with.
+            pinned: Pinned connections are never evicted for being idle.
+        Returns:
+            AsyncPlexServer shared by everyone using this url and token.
+        """
+        key = (url.rstrip("/"), token)
+        async with self._locks[key]:
+            if (server := self._servers.get(key)) is None:
+                session = self._session()
+                try:
+                    server = await AsyncPlexServer.connect(
+                        url, token, self.executors.get(url), session=session
+                    )
+                except BaseException:
+                    session.close()
+                    raise
+                self._servers[key] = server
+                log.debug("Opened Plex connection to %s", key[0])
+            self._pinned[key] = self._pinned.get(key, False) or pinned
+        return server
+
+    def evict_idle(self, in_use: Collection[PlexServer] = ()) -> List[AsyncPlexServer]:
+        """
+        Close the connections that have been idle for too long and return them
+        Args:
+            in_use: Servers tracks are playing or queued from, whose connections are kept
+                however long ago they were last called.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        evicted = []
+        for key, server in list(self._servers.items()):
+            if self._pinned.get(key) or server.last_used > cutoff or server.server in in_use:
+                continue
+            del self._servers[key]
+            self._pinned.pop(key, None)
+            server.server._session.close()
+            evicted.append(server)
+            log.debug("Closed idle Plex connection to %s", key[0])
+        return evicted
+
+    def close(self):
+        for server in self._servers.values():
+            server.server._session.close()
+        self._servers.clear()
+        self._pinned.clear()
@@ -0,0 +1,86 @@
+import logging
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from redbot.core import Config
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.credentials")
+
+# Credentials are re-read from Config after this many seconds, in case it was edited elsewhere.
+POSITIVE_TTL = 6 * 60 * 60
+NEGATIVE_TTL = 10 * 60
+# Failing servers are retried after BACKOFF_BASE * 2 ** (failures - 1) seconds, up to BACKOFF_MAX.
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+
+
+class Credentials(NamedTuple):
+    url: str
+    token: str
+
+
+class CredentialCache:
+    """In-memory copy of the user Plex credentials stored in Config.
+
+    Every user's credentials are loaded once at startup, users without any
+    are remembered as such, and servers that fail to authenticate are
+    backed off exponentially instead of being retried on every command.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._entries: Dict[int, Tuple[float, Optional[Credentials]]] = {}
+        self._failures: Dict[Credentials, Tuple[int, float]] = {}
+
+    async def load(self):
+        """Prime the cache with the credentials of every user."""
+        now = time.monotonic()
+        for user_id, data in (await self.config.all_users()).items():
+            self._entries[user_id] = (now + POSITIVE_TTL, self._from_data(data))
+
+    @staticmethod
+    def _from_data(data: dict) -> Optional[Credentials]:
+        if data.get("url") and data.get("token"):
+            return Credentials(data["url"], data["token"])
+        return None
+
+    async def get(self, user_id: int) -> Optional[Credentials]:
+        """
+        Get the credentials of a user
+        Args:
+            user_id: The Discord ID of the user.
+        Returns:
+            Credentials or None if the user hasn't set any.
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        credentials = self._from_data(await self.config.user_from_id(user_id).all())
+        self.set(user_id, credentials)
+        return credentials
+
+    def set(self, user_id: int, credentials: Optional[Credentials]):
+        ttl = POSITIVE_TTL if credentials else NEGATIVE_TTL
+        self._entries[user_id] = (time.monotonic() + ttl, credentials)
+        if credentials:
+            self._failures.pop(credentials, None)
+
+    def invalidate(self, user_id: int):
+        if entry := self._entries.pop(user_id, None):
+            if entry[1]:
+                self._failures.pop(entry[1], None)
+
+    def is_backing_off(self, credentials: Credentials) -> bool:
+        failure = self._failures.get(credentials)
+        return failure is not None and failure[1] > time.monotonic()
+
+    def record_failure(self, credentials: Credentials):
+        failures = self._failures.get(credentials, (0, 0.0))[0] + 1
+        delay = min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX)
+        self._failures[credentials] = (failures, time.monotonic() + delay)
+        log.debug(
+            "Plex server %s failed %d times, retrying in %ss", credentials.url, failures, delay
+        )
+
+    def record_success(self, credentials: Credentials):
+        self._failures.pop(credentials, None)
@@ -8,3 +8,9 @@ class VoiceChannelError(Exception):
     """Raised when user is not connected to a voice channel."""
 
     pass
+
+
+class PlexTimeoutError(Exception):
+    """Raised when a call to a Plex server does not complete in time."""
+
+    pass
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional, Sequence, TypeVar
+
+from .exceptions import MediaNotFoundError, PlexTimeoutError
+from .instrumentation import Metrics
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.federated")
+
+T = TypeVar("T")
+
+# Seconds every source gets to answer before results are returned without it.
+DEFAULT_BUDGET = 1.5
+
+
+class Source(NamedTuple):
+    """A named lookup against a single music section or server."""
+
+    name: str
+    lookup: Callable[[], Awaitable]
+
+
+class FederatedResult(NamedTuple):
+    """The best match across all sources and the sources that didn't answer in time."""
+
+    item: Any
+    source: str
+    slow: List[str]
+
+
+def relevance(query: str, title: Optional[str]) -> float:
+    """How well `title` matches `query`, exact matches first, then prefixes, then the rest."""
+    query = query.casefold().strip()
+    title = (title or "").casefold().strip()
+    if title == query:
+        return 3.0
+    ratio = SequenceMatcher(None, query, title).ratio()
+    if title.startswith(query):
+        return 2.0 + ratio
+    if query in title:
+        return 1.0 + ratio
+    return ratio
+
+
+class FederatedSearch:
+    """Runs one lookup per source concurrently and merges their results by relevance.
+
+    Every source gets `budget` seconds. Once it's spent the results found so
+    far are returned and the sources still running are reported as slow, so
+    one slow server can't hold up a search. If nothing has been found by then
+    the search keeps waiting for the first source to answer.
+    """
+
+    def __init__(self, budget: float = DEFAULT_BUDGET, metrics: Optional[Metrics] = None):
+        self.budget = budget
+        self.metrics = metrics
+        self.stats = Counter()
+        self.slow_sources = Counter()
+
+    async def search(
+        self, sources: Sequence[Source], score: Callable[[T], float]
+    ) -> FederatedResult:
+        """
+        Look up every source and pick the most relevant result
+        Args:
+            sources: The lookups to run, earlier sources win ties.
+            score: Relevance of a result, higher is better.
+        Returns:
+            FederatedResult with the best match.
+        Raises:
+            MediaNotFoundError: No source answering in time found anything.
+        """
+        self.stats["searches"] += 1
+        tasks = {
+            asyncio.ensure_future(self._timed(source)): (order, source)
+            for order, source in enumerate(sources)
+        }
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=self.budget)
+            while pending and not any(self._found(task) for task in done):
+                more, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                done |= more
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        slow = [tasks[task][1].name for task in pending]
+        candidates = []
+        for task in done:
+            order, source = tasks[task]
+            if task.cancelled():
+                continue
+            if isinstance(error := task.exception(), PlexTimeoutError):
+                slow.append(source.name)
+            elif error is not None and not isinstance(error, MediaNotFoundError):
+                log.debug("Search of %s failed", source.name, exc_info=error)
+            elif error is None:
+                candidates.append((-score(task.result()), order, task.result(), source.name))
+        for name in slow:
+            self.slow_sources[name] += 1
+        if slow:
+            self.stats["partial"] += 1
+            log.debug("Search returned without %s", ", ".join(slow))
+        if not candidates:
+            raise MediaNotFoundError("Nothing found in any source")
+        *_, item, name = min(candidates, key=lambda c: c[:2])
+        return FederatedResult(item, name, sorted(slow))
+
+    @staticmethod
+    def _found(task: asyncio.Future) -> bool:
+        return not task.cancelled() and task.exception() is None
+
+    async def _timed(self, source: Source):
+        start = time.perf_counter()
+        try:
+            return await source.lookup()
+        except asyncio.CancelledError:
+            # Left behind after the budget, its time says nothing about the source.
+            start = None
+            raise
+        finally:
+            if self.metrics is not None and start is not None:
+                self.metrics.observe(
+                    "search_source_seconds", source.name, time.perf_counter() - start, "source"
+                )
@@ -0,0 +1,190 @@
+import asyncio
+import bisect
+import contextlib
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.instrumentation")
+
+# Upper bounds of the histogram buckets in seconds, the last bucket is +Inf.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# The loop checks in this often, a late check in is loop lag.
+HEARTBEAT = 0.05
+DEFAULT_STALL_THRESHOLD = 0.25
+
+METRIC_HELP = {
+    "loop_lag_seconds": "How late the event loop ran a callback scheduled by the cog.",
+    "command_seconds": "Time from a command being invoked until it returned.",
+    "plex_call_seconds": "Time of blocking PlexAPI calls, including waiting for a thread.",
+    "embed_seconds": "Time spent building now playing and queue embeds.",
+    "search_source_seconds": "Time a music section or server took to answer a search.",
+}
+
+
+class Histogram:
+    """Cumulative bucket counts of observations, in the Prometheus model."""
+
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class Metrics:
+    """Histograms keyed by metric name and an optional single label value."""
+
+    def __init__(self, prefix: str = "plexmusic"):
+        self.prefix = prefix
+        self.histograms: Dict[str, Dict[str, Histogram]] = defaultdict(
+            lambda: defaultdict(Histogram)
+        )
+        self.labels: Dict[str, str] = {}
+
+    def observe(self, metric: str, label: str, seconds: float, label_name: str = "name"):
+        """Record `seconds` in the histogram of `metric`, an empty label means no label."""
+        self.labels.setdefault(metric, label_name)
+        self.histograms[metric][label].observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, metric: str, label: str, label_name: str = "name") -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, label, time.perf_counter() - start, label_name)
+
+    def summary(self, metric: str) -> List[Tuple[str, Histogram]]:
+        return sorted(self.histograms.get(metric, {}).items())
+
+    def prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric, series in sorted(self.histograms.items()):
+            name = f"{self.prefix}_{metric}"
+            label_name = self.labels.get(metric, "name")
+            lines.append(f"# HELP {name} {METRIC_HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {name} histogram")
+            for label, histogram in sorted(series.items()):
+                if label:
+                    label = label.replace("\\", "\\\\").replace('"', '\\"')
+                    label = f'{label_name}="{label}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = f"{label},le" if label else "le"
+                    lines.append(f'{name}_bucket{{{bucket_labels}="{le}"}} {cumulative}')
+                label = f"{{{label}}}" if label else ""
+                lines.append(f"{name}_sum{label} {histogram.sum}")
+                lines.append(f"{name}_count{label} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def timed(metric: str, label: str):
+    """Record the duration of an async method in `self.metrics`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with self.metrics.timer(metric, label):
+                return await func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class LoopMonitor:
+    """Measures event loop lag and dumps the stack of whatever holds the loop too long.
+
+    A callback is scheduled on the loop every `HEARTBEAT` seconds, how late
+    it runs is the lag. A watchdog thread checks the last heartbeat and logs
+    the stack of the loop thread once per stall longer than the threshold.
+    """
+
+    def __init__(self, metrics: Metrics, stall_threshold: float = DEFAULT_STALL_THRESHOLD):
+        self.metrics = metrics
+        self.stall_threshold = stall_threshold
+        self.stalls = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._expected = 0.0
+        self._beat = 0.0
+        self._stalled_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start monitoring the running loop, must be called from the loop."""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._schedule()
+        self._stop.clear()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="PlexMusic-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        self._loop = None
+
+    def _schedule(self):
+        self._expected = time.monotonic() + HEARTBEAT
+        self._handle = self._loop.call_later(HEARTBEAT, self._tick)
+
+    def _tick(self):
+        now = time.monotonic()
+        self.metrics.observe("loop_lag_seconds", "", max(now - self._expected, 0.0))
+        self._beat = now
+        if self._stalled_at is not None:
+            log.warning("Event loop recovered after %.0f ms", (now - self._stalled_at) * 1000)
+            self._stalled_at = None
+        self._schedule()
+
+    def _watch(self):
+        while not self._stop.wait(min(self.stall_threshold / 2, HEARTBEAT * 2)):
+            held = time.monotonic() - self._beat - HEARTBEAT
+            if held < self.stall_threshold or self._stalled_at is not None:
+                continue
+            self._stalled_at = self._beat + HEARTBEAT
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unavailable"
+            log.warning(
+                "Event loop blocked for more than %.0f ms, it is running:\n%s",
+                held * 1000,
+                stack,
+            )
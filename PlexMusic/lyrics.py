@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.lyrics")
+
+STORE_LIMIT = 64 * 1024 * 1024
+# Songs Genius had no lyrics for are looked up again after this many seconds.
+MISS_TTL = 7 * 24 * 60 * 60
+POOL_SIZE = 4
+TIMEOUT = 15
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lyrics (
+    guid TEXT PRIMARY KEY,
+    data BLOB,
+    size INTEGER NOT NULL,
+    stored_at INTEGER NOT NULL,
+    accessed_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lyrics_accessed_at ON lyrics (accessed_at);
+"""
+
+_MISSING = object()
+
+
+def _genius_client(token: str):
+    # Imported on first use, it pulls in BeautifulSoup which is slow to import.
+    import lyricsgenius
+
+    return lyricsgenius.Genius(token, timeout=TIMEOUT, verbose=False)
+
+
+class LyricsStore:
+    """Persistent, size capped LRU store of zlib compressed lyrics keyed by track guid."""
+
+    def __init__(self, path: Path, limit: int = STORE_LIMIT):
+        self.path = path
+        self.limit = limit
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PlexMusic-lyrics")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def initialize(self):
+        await self._run(self._open)
+
+    async def get(self, guid: str):
+        """Get the lyrics of a track, None if Genius had none and `_MISSING` if unknown."""
+        return await self._run(self._get, guid)
+
+    async def put(self, guid: str, lyrics: Optional[str]):
+        await self._run(self._put, guid, lyrics)
+
+    def close(self):
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+    # Everything below runs on the store thread.
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _get(self, guid: str):
+        row = self._conn.execute(
+            "SELECT data, stored_at FROM lyrics WHERE guid = ?", (guid,)
+        ).fetchone()
+        if row is None:
+            return _MISSING
+        data, stored_at = row
+        now = int(time.time())
+        if data is None and now - stored_at > MISS_TTL:
+            return _MISSING
+        with self._conn:
+            self._conn.execute("UPDATE lyrics SET accessed_at = ? WHERE guid = ?", (now, guid))
+        return zlib.decompress(data).decode() if data is not None else None
+
+    def _put(self, guid: str, lyrics: Optional[str]):
+        data = zlib.compress(lyrics.encode(), 9) if lyrics else None
+        now = int(time.time())
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lyrics (guid, data, size, stored_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (guid, data, len(data) if data else 0, now, now),
+            )
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM lyrics").fetchone()
+            if total <= self.limit:
+                return
+            # Drop the least recently read lyrics until the store fits again.
+            for old_guid, size in self._conn.execute(
+                "SELECT guid, size FROM lyrics ORDER BY accessed_at"
+            ).fetchall():
+                if total <= self.limit * 0.9:
+                    break
+                self._conn.execute("DELETE FROM lyrics WHERE guid = ?", (old_guid,))
+                total -= size
+
+
+class LyricsProvider:
+    """Looks lyrics up on Genius off the event loop, caching every answer in a `LyricsStore`.
+
+    Concurrent lookups of the same track share a single Genius search.
+    """
+
+    def __init__(self, store: LyricsStore, pool_size: int = POOL_SIZE):
+        self.store = store
+        self.genius = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="PlexMusic-genius"
+        )
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.genius is not None
+
+    async def set_token(self, token: Optional[str]):
+        """Set the Genius token, None disables lyrics."""
+        if not token:
+            self.genius = None
+            return
+        try:
+            genius = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _genius_client, token
+            )
+        except ImportError:
+            log.warning("lyricsgenius isn't installed, lyrics disabled")
+            self.genius = None
+            return
+        # The Genius client shares one class level session, give it a pooled one of its own.
+        self._session.headers.update(genius._session.headers)
+        genius._session = self._session
+        self.genius = genius
+
+    @staticmethod
+    def key(track) -> str:
+        return track.guid or f"{track._server.machineIdentifier}:{track.ratingKey}"
+
+    async def get(self, track, artist: str) -> Optional[str]:
+        """
+        Get the lyrics of a track
+        Args:
+            track: plexapi.audio.Track to look up.
+            artist: The artist title of the track.
+        Returns:
+            The lyrics or None if Genius doesn't have any.
+        Raises:
+            TypeError: Genius rejected the token.
+        """
+        key = self.key(track)
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        if (lyrics := await self.store.get(key)) is not _MISSING:
+            return lyrics
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            lyrics = await self._search(track.title, artist)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved in case nobody else was waiting.
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(lyrics)
+        await self.store.put(key, lyrics)
+        return lyrics
+
+    async def _search(self, title: str, artist: str) -> Optional[str]:
+        genius = self.genius
+        song = await asyncio.get_running_loop().run_in_executor(
+            self._executor, genius.search_song, title, artist
+        )
+        return song.lyrics if song else None
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._session.close()
+        self.store.close()
@@ -0,0 +1,137 @@
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .async_plex import PlexExecutorPool
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.metadata")
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 20_000
+# Plex accepts a comma separated list of ratingKeys, keep the urls a reasonable length.
+BATCH_SIZE = 100
+
+
+class ItemMetadata(NamedTuple):
+    rating_key: int
+    title: str
+    parent_title: Optional[str]
+    grandparent_title: Optional[str]
+    thumb: Optional[str]
+
+
+class MetadataCache:
+    """TTL and size bounded cache of item titles keyed by server and ratingKey.
+
+    Titles the item already carries (`parentTitle`, `grandparentTitle`) are
+    used as is, only missing parents are requested, several at a time.
+    """
+
+    def __init__(
+        self,
+        executors: PlexExecutorPool,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.executors = executors
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, ItemMetadata]]" = OrderedDict()
+
+    def get(self, server, rating_key: int) -> Optional[ItemMetadata]:
+        key = (server.machineIdentifier, int(rating_key))
+        if (entry := self._entries.get(key)) is None:
+            return None
+        expires, metadata = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return metadata
+
+    def put(self, item) -> ItemMetadata:
+        metadata = ItemMetadata(
+            int(item.ratingKey),
+            item.title,
+            getattr(item, "parentTitle", None),
+            getattr(item, "grandparentTitle", None),
+            item.thumb,
+        )
+        key = (item._server.machineIdentifier, metadata.rating_key)
+        self._entries[key] = (time.monotonic() + self.ttl, metadata)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return metadata
+
+    async def fetch_many(self, server, rating_keys: Iterable[int]) -> Dict[int, ItemMetadata]:
+        """
+        Get the metadata of several items of a server
+        Items missing from the cache are fetched in batched
+        `/library/metadata/{id1,id2,...}` requests.
+        Args:
+            server: The PlexServer the items belong to.
+            rating_keys: The ratingKeys to look up.
+        Returns:
+            Dict of ratingKey to ItemMetadata for every item that could be found.
+        """
+        found = {}
+        missing = []
+        for rating_key in {int(k) for k in rating_keys if k}:
+            if (metadata := self.get(server, rating_key)) is not None:
+                found[rating_key] = metadata
+            else:
+                missing.append(rating_key)
+        executor = self.executors.get(server._baseurl)
+        for i in range(0, len(missing), BATCH_SIZE):
+            batch = ",".join(str(k) for k in missing[i : i + BATCH_SIZE])
+            for item in await executor.run(server.fetchItems, f"/library/metadata/{batch}"):
+                metadata = self.put(item)
+                found[metadata.rating_key] = metadata
+        return found
+
+    async def prefetch(self, items: List):
+        """Warm the cache with the parents of many items in as few requests as possible."""
+        wanted = defaultdict(set)
+        servers = {}
+        for item in items:
+            server = item._server
+            servers[server.machineIdentifier] = server
+            if not getattr(item, "parentTitle", None) and getattr(item, "parentRatingKey", None):
+                wanted[server.machineIdentifier].add(item.parentRatingKey)
+            if not getattr(item, "grandparentTitle", None) and getattr(
+                item, "grandparentRatingKey", None
+            ):
+                wanted[server.machineIdentifier].add(item.grandparentRatingKey)
+        for machine_identifier, keys in wanted.items():
+            await self.fetch_many(servers[machine_identifier], keys)
+
+    async def track_titles(self, track) -> Tuple[str, str]:
+        """
+        Get the album and artist title of a track
+        Args:
+            track: plexapi.audio.Track
+        Returns:
+            Tuple of album title and artist title.
+        """
+        album, artist = track.parentTitle, track.grandparentTitle
+        if album and artist:
+            return album, artist
+        found = await self.fetch_many(
+            track._server, (track.parentRatingKey, track.grandparentRatingKey)
+        )
+        if not album and (parent := found.get(track.parentRatingKey)):
+            album = parent.title
+        if not artist and (grandparent := found.get(track.grandparentRatingKey)):
+            artist = grandparent.title
+        return album or "Unknown album", artist or "Unknown artist"
+
+    async def album_artist(self, album) -> str:
+        """Get the artist title of an album."""
+        if album.parentTitle:
+            return album.parentTitle
+        found = await self.fetch_many(album._server, (album.parentRatingKey,))
+        if parent := found.get(album.parentRatingKey):
+            return parent.title
+        return "Unknown artist"
@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import Counter, OrderedDict
+from pathlib import PurePath
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import discord
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.nowplaying")
+
+# Discord signs attachment urls for about a day, reuse them for half of that.
+ART_URL_TTL = 12 * 60 * 60
+ART_URL_LIMIT = 4096
+# Track changes within this many seconds are shown as a single update.
+DEBOUNCE = 1.0
+
+Card = Tuple[Optional[discord.Embed], Optional[discord.File]]
+# Builds the card of what plays, without reusing art urls of the message with the given id.
+Render = Callable[[Optional[int]], Awaitable[Card]]
+
+
+class ArtUrlCache:
+    """Discord CDN urls of art that was already uploaded, keyed by artwork key.
+
+    Art files are uploaded named after their artwork key, so the url of every
+    attachment of a sent message can be remembered without any bookkeeping.
+    Urls are forgotten when the message holding them is deleted.
+    """
+
+    def __init__(self, ttl: float = ART_URL_TTL, max_entries: int = ART_URL_LIMIT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._urls: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+
+    def get(self, key: Optional[str], exclude: Optional[int] = None) -> Optional[str]:
+        """The url of uploaded art, unless it's attached to the message with id `exclude`."""
+        if key is None or (entry := self._urls.get(key)) is None:
+            return None
+        url, owner, expires = entry
+        if expires < time.monotonic():
+            del self._urls[key]
+            return None
+        if owner == exclude:
+            return None
+        self._urls.move_to_end(key)
+        return url
+
+    def remember(self, message: Optional[discord.Message]):
+        """Remember the urls of the art attached to a message the cog sent."""
+        if message is None:
+            return
+        expires = time.monotonic() + self.ttl
+        for attachment in message.attachments:
+            key = PurePath(attachment.filename).stem
+            self._urls[key] = (attachment.url, message.id, expires)
+            self._urls.move_to_end(key)
+        while len(self._urls) > self.max_entries:
+            self._urls.popitem(last=False)
+
+    def forget_message(self, message_id: int):
+        for key in [k for k, (_, owner, _) in self._urls.items() if owner == message_id]:
+            del self._urls[key]
+
+
+class NowPlaying:
+    """Keeps one now playing message per guild up to date.
+
+    Updates edit the existing message, which costs a single API call and
+    no upload. A new message is only sent when the art hasn't been uploaded
+    before, the message went to another channel or it's asked to be moved
+    to the bottom, the old one is then deleted. Updates scheduled while one
+    is pending are merged into it, so skipping through tracks quickly only
+    shows the track that ends up playing.
+    """
+
+    def __init__(self, art_urls: ArtUrlCache, debounce: float = DEBOUNCE):
+        self.art_urls = art_urls
+        self.debounce = debounce
+        self.messages: Dict[int, discord.Message] = {}
+        self.stats = Counter()
+        self._pending: Dict[int, asyncio.Task] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def schedule(
+        self,
+        guild_id: int,
+        render: Render,
+        destination: Callable[[], Optional[discord.abc.Messageable]],
+    ):
+        """
+        Update the message of a guild `debounce` seconds from now, unless already scheduled
+        Args:
+            guild_id: The guild to update.
+            render: Builds the card of what plays once the update happens.
+            destination: Where the message should be once the update happens.
+        """
+        self.stats["scheduled"] += 1
+        if (task := self._pending.get(guild_id)) is not None and not task.done():
+            self.stats["merged"] += 1
+            return
+        self._pending[guild_id] = asyncio.create_task(
+            self._update_later(guild_id, render, destination)
+        )
+
+    async def _update_later(self, guild_id: int, render, destination):
+        await asyncio.sleep(self.debounce)
+        del self._pending[guild_id]
+        try:
+            await self.update(guild_id, render, destination())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Unable to update the now playing message of %s", guild_id)
+
+    async def update(
+        self,
+        guild_id: int,
+        render: Render,
+        destination: Optional[discord.abc.Messageable],
+        repost: bool = False,
+    ):
+        """
+        Update the now playing message of a guild right away
+        Args:
+            guild_id: The guild to update.
+            render: Builds the embed and the art file to upload, a None embed removes the message.
+            destination: Where the message should be.
+            repost: Send the message again even if it could be edited, e.g. to move it down.
+        """
+        async with self._locks.setdefault(guild_id, asyncio.Lock()):
+            if destination is None:
+                await self.remove(guild_id)
+                return
+            message = self.messages.get(guild_id)
+            channel = getattr(destination, "channel", destination)
+            editable = message is not None and not repost and message.channel.id == channel.id
+            # A message that gets replaced is deleted, art attached to it can't be reused.
+            embed, file = await render(None if editable or message is None else message.id)
+            if embed is None:
+                await self.remove(guild_id)
+                return
+            if editable and file is None:
+                with contextlib.suppress(discord.NotFound):
+                    await message.edit(embed=embed)
+                    self.stats["edits"] += 1
+                    return
+            with contextlib.suppress(discord.HTTPException):
+                self.messages[guild_id] = await destination.send(embed=embed, file=file)
+                self.art_urls.remember(self.messages[guild_id])
+                self.stats["sends"] += 1
+                self.stats["uploads"] += file is not None
+            if message is not None and message is not self.messages.get(guild_id):
+                await self._delete(message)
+
+    async def remove(self, guild_id: int):
+        if (message := self.messages.pop(guild_id, None)) is not None:
+            await self._delete(message)
+
+    def cancel(self, guild_id: int):
+        if (task := self._pending.pop(guild_id, None)) is not None:
+            task.cancel()
+
+    def shutdown(self):
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+
+    async def _delete(self, message: discord.Message):
+        self.art_urls.forget_message(message.id)
+        with contextlib.suppress(discord.HTTPException):
+            await message.delete()
+            self.stats["deletes"] += 1
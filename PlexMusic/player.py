@@ -0,0 +1,289 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import math
+import statistics
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from .queue import PlayQueue
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.player")
+
+# Seconds to wait before restarting a player task that crashed.
+RESTART_DELAY = 1.0
+# Seconds before the end of a track at which the next one is prepared.
+LOOKAHEAD = 5.0
+# Prepared sources older than this are thrown away, e.g. if playback was paused.
+PREPARED_MAX_AGE = 60.0
+GAP_SAMPLES = 100
+FIRST_AUDIO_SAMPLES = 100
+
+
+class GuildPlayer:
+    """Plays the queue of a single guild.
+
+    The player sleeps on its queue while it's empty and on the finished
+    event while a track plays, so it only wakes up when there is work to do.
+    A few seconds before a track ends the next item is taken off the queue
+    and prepared, so it can be handed to the voice client straight away.
+    Large albums and playlists are fed into the queue a page at a time by
+    background tasks, which are cancelled along with the queue. When an item
+    can't be played because there is nothing to play it on, it's put back in
+    front of the queue and the player stops until it's started again.
+    """
+
+    def __init__(self, guild_id: int, manager: "PlayerManager"):
+        self.guild_id = guild_id
+        self.manager = manager
+        self.queue = PlayQueue()
+        self.current = None
+        self.task: Optional[asyncio.Task] = None
+        self.active = False
+        self.gaps: Deque[float] = deque(maxlen=GAP_SAMPLES)
+        self.first_audio: Deque[float] = deque(maxlen=FIRST_AUDIO_SAMPLES)
+        self._feeders: Set[asyncio.Task] = set()
+        self._requested: Optional[Tuple[Any, float]] = None
+        self._next: Optional[Tuple[Any, Any, float]] = None
+        self._ended_at: Optional[float] = None
+        # Bumped whenever the queue is cleared, an item prepared meanwhile isn't played.
+        self._generation = 0
+        self._finished = asyncio.Event()
+        self._loop = asyncio.get_event_loop()
+
+    def notify_finished(self):
+        """Wake the player up once the current track is done, safe to call from any thread."""
+        self._ended_at = time.perf_counter()
+        self._loop.call_soon_threadsafe(self._finished.set)
+
+    def clear(self):
+        self._generation += 1
+        self.cancel_feeders()
+        self.queue.clear()
+        self._discard_next()
+
+    @property
+    def next_item(self):
+        """The item taken off the queue and prepared to play next, if any."""
+        return self._next[0] if self._next is not None else None
+
+    @property
+    def idle(self) -> bool:
+        return self.current is None and self._next is None and self.queue.empty()
+
+    def expect(self, item, requested_at: float):
+        """Record the time from `requested_at` until `item` starts playing."""
+        self._requested = (item, requested_at)
+
+    def feed(self, pages: AsyncIterator[Iterable]) -> asyncio.Task:
+        """Queue every item of `pages` in the background, in order."""
+        task = asyncio.create_task(self._feed(pages))
+        self._feeders.add(task)
+        task.add_done_callback(self._feeders.discard)
+        return task
+
+    def cancel_feeders(self):
+        for task in self._feeders:
+            task.cancel()
+        self._feeders.clear()
+
+    async def _feed(self, pages: AsyncIterator[Iterable]):
+        try:
+            async for page in pages:
+                for item in page:
+                    self.queue.put_nowait(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Stopped queuing items in %s", self.guild_id)
+
+    async def run(self):
+        while True:
+            ready = self._next is not None or not self.queue.empty()
+            item, prepared = await self._get_next()
+            self.current = item
+            self._finished.clear()
+            try:
+                await self.manager.play(self.guild_id, item, prepared)
+            except asyncio.CancelledError:
+                raise
+            except self.manager.halt_on as exc:
+                log.info("Stopped playing in %s: %r", self.guild_id, exc)
+                self.queue.insert(0, item)
+                self.current = None
+                self.active = False
+                return
+            except Exception:
+                log.exception("Unable to play %s in %s", item, self.guild_id)
+                self.current = None
+                continue
+            if ready and self._ended_at is not None:
+                self.gaps.append(time.perf_counter() - self._ended_at)
+            if self._requested is not None and self._requested[0] is item:
+                self.first_audio.append(time.perf_counter() - self._requested[1])
+                self._requested = None
+            self._ended_at = None
+            await self._wait_for_finish(item)
+            self.current = None
+            if self.manager.on_finished:
+                await self.manager.on_finished(self.guild_id)
+
+    async def _get_next(self) -> Tuple[Any, Any]:
+        if self._next is None:
+            return await self.queue.get(), None
+        item, prepared, prepared_at = self._next
+        self._next = None
+        if time.monotonic() - prepared_at > PREPARED_MAX_AGE:
+            self._discard(prepared)
+            prepared = None
+        return item, prepared
+
+    async def _wait_for_finish(self, item):
+        manager = self.manager
+        if manager.prepare and manager.duration:
+            delay = (manager.duration(item) or 0) - manager.lookahead
+            if delay > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._finished.wait(), delay)
+            if not self._finished.is_set() and not self.queue.empty():
+                generation = self._generation
+                next_item = self.queue.get_nowait()
+                prepared = None
+                try:
+                    prepared = await manager.prepare(self.guild_id, next_item)
+                except asyncio.CancelledError:
+                    if self._generation == generation:
+                        self.queue.insert(0, next_item)
+                    raise
+                except Exception:
+                    log.debug("Unable to prepare %s", next_item, exc_info=True)
+                if self._generation == generation:
+                    self._next = (next_item, prepared, time.monotonic())
+                else:
+                    # The queue was cleared while the item was being prepared.
+                    self._discard(prepared)
+        await self._finished.wait()
+
+    def _discard_next(self):
+        if self._next is not None:
+            self._discard(self._next[1])
+            self._next = None
+
+    def _discard(self, prepared):
+        if prepared is not None and self.manager.discard:
+            self.manager.discard(prepared)
+
+
+class PlayerManager:
+    """Owns one supervised `GuildPlayer` task per guild.
+
+    Args:
+        play: Coroutine starting playback of an item, gets the prepared source or None.
+        on_finished: Coroutine called once an item is done playing.
+        prepare: Coroutine preparing an item ahead of time, enables the look-ahead.
+        discard: Releases a prepared source that won't be played.
+        duration: Returns the seconds an item plays for, from where it starts.
+        halt_on: Exceptions of `play` meaning nothing can be played at all, rather
+            than just the item. The item is put back and the player stops.
+    """
+
+    def __init__(
+        self,
+        play: Callable[[int, Any, Any], Awaitable[Any]],
+        on_finished: Optional[Callable[[int], Awaitable[Any]]] = None,
+        prepare: Optional[Callable[[int, Any], Awaitable[Any]]] = None,
+        discard: Optional[Callable[[Any], Any]] = None,
+        duration: Optional[Callable[[Any], Optional[float]]] = None,
+        lookahead: float = LOOKAHEAD,
+        halt_on: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.players: Dict[int, GuildPlayer] = {}
+        self.play = play
+        self.on_finished = on_finished
+        self.prepare = prepare
+        self.discard = discard
+        self.duration = duration
+        self.lookahead = lookahead
+        self.halt_on = halt_on
+
+    def get(self, guild_id: int) -> GuildPlayer:
+        if guild_id not in self.players:
+            self.players[guild_id] = GuildPlayer(guild_id, self)
+        return self.players[guild_id]
+
+    def start(self, guild_id: int) -> GuildPlayer:
+        """Get the player of a guild, starting its task if it isn't running."""
+        player = self.get(guild_id)
+        player.active = True
+        if player.task is None or player.task.done():
+            player.task = asyncio.create_task(player.run())
+            player.task.add_done_callback(functools.partial(self._supervise, player))
+        return player
+
+    def stop(self, guild_id: int):
+        """Stop the task of a guild's player, its queue is kept."""
+        if player := self.players.get(guild_id):
+            player.active = False
+            player.current = None
+            player._discard_next()
+            player.cancel_feeders()
+            if player.task:
+                player.task.cancel()
+                player.task = None
+
+    def notify_finished(self, guild_id: int):
+        if player := self.players.get(guild_id):
+            player.notify_finished()
+
+    def gap_stats(self) -> Dict[str, float]:
+        """Median, 95th percentile and max inter-track gap in seconds across every guild."""
+        return _summarize([gap for player in self.players.values() for gap in player.gaps])
+
+    def first_audio_stats(self) -> Dict[str, float]:
+        """Median, 95th percentile and max seconds from a request until its audio started."""
+        return _summarize([t for player in self.players.values() for t in player.first_audio])
+
+    def shutdown(self):
+        for guild_id in list(self.players):
+            self.stop(guild_id)
+
+    def _supervise(self, player: GuildPlayer, task: asyncio.Task):
+        if task.cancelled() or player.task is not task or task.exception() is None:
+            return
+        exc = task.exception()
+        log.error("Player of %s crashed, restarting", player.guild_id, exc_info=exc)
+        player.task = None
+        player.current = None
+        with contextlib.suppress(RuntimeError):
+            asyncio.get_event_loop().call_later(RESTART_DELAY, self._restart, player)
+
+    def _restart(self, player: GuildPlayer):
+        if player.active and self.players.get(player.guild_id) is player:
+            self.start(player.guild_id)
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    samples.sort()
+    return {
+        "samples": len(samples),
+        "median": statistics.median(samples),
+        "p95": samples[math.ceil(len(samples) * 0.95) - 1],
+        "max": samples[-1],
+    }
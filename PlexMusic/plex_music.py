@@ -2,9 +2,13 @@ import asyncio
 import contextlib
 import functools
 import io
+import itertools
 import logging
-from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, Literal, Optional
+import os
+import time
+import weakref
+from collections import Counter, defaultdict
+from typing import AsyncIterator, Dict, List, Literal, Optional, Set, Tuple
 
 import aiohttp
 import discord
@@ -12,31 +16,76 @@ import plexapi
 import plexapi.audio
 import plexapi.exceptions
 import plexapi.playlist
-from async_timeout import timeout
-from discord import FFmpegPCMAudio
-from plexapi.library import MusicSection
+import plexapi.server
 from plexapi.myplex import MyPlexAccount
-from plexapi.server import PlexServer
 from redbot.core import Config, commands
 from redbot.core.bot import Red
-
-from .exceptions import MediaNotFoundError, VoiceChannelError
+from redbot.core.utils.chat_formatting import box
+from redbot.core.data_manager import cog_data_path
+
+from .artwork import ArtworkCache
+from .audio_cache import ADMIT_AFTER, AudioCache
+from .audio_cache import DEFAULT_BUDGET as DEFAULT_CACHE_BUDGET
+from .buffering import DEFAULT_READ_AHEAD, MAX_READ_AHEAD, ReadAheadAudio, ReadAheadStream
+from .async_plex import (
+    PAGE_SIZE,
+    PLEX_TV,
+    AsyncMusicSection,
+    AsyncPlexServer,
+    PlexExecutorPool,
+    iter_pages,
+)
+from .connections import DEFAULT_POOL_SIZE, PlexConnectionManager
+from .credentials import CredentialCache, Credentials
+from .exceptions import MediaNotFoundError, PlexTimeoutError, VoiceChannelError
+from .federated import DEFAULT_BUDGET, FederatedResult, FederatedSearch, Source, relevance
+from .instrumentation import DEFAULT_STALL_THRESHOLD, LoopMonitor, Metrics, timed
+from .lyrics import LyricsProvider, LyricsStore
+from .metadata import MetadataCache
+from .nowplaying import ArtUrlCache, NowPlaying
+from .player import PlayerManager
+from .queue import PreparedTrack, QueueEntry
+from .scheduling import Priority, request_context, set_request_context
+from .singleflight import SingleFlight
+from .snapshots import (
+    SNAPSHOT_INTERVAL,
+    GuildSnapshot,
+    SnapshotStore,
+    StoredQueue,
+    full_record,
+    position_record,
+    restore_entries,
+)
+from .startup import Startup, requires
+from .streaming import (
+    DEFAULT_BITRATE,
+    DEFAULT_PROFILE,
+    MODE_OPUS,
+    MODES,
+    PROFILES,
+    StreamResolver,
+)
+from .suggestions import Suggestion, SuggestionResolver, TitleCorpus
+from .track_index import TrackIndex
+from .workers import AudioWorkerPool
 
 log = logging.getLogger("red.plex-cogs.PlexMusic")
 
-try:
-    import lyricsgenius
-except ImportError:
-    lyricsgenius = None
-
-if TYPE_CHECKING:
-    lyricsgenius: lyricsgenius
+INDEX_SYNC_INTERVAL = 15 * 60
+# Playlists aren't indexed, their titles are listed again for suggestions after this long.
+PLAYLIST_TITLES_TTL = 10 * 60
+MB = 1024 * 1024
+# Voice channels rejoined at once when resuming playback after a restart.
+RESUME_CONCURRENCY = 5
+QUEUE_PAGE_SIZE = 10
 
 ### Rewrite of https://github.com/jarulsamy/Plex-Bot/blob/master/PlexBot/bot.py to work with Red Bots
 
 
-def check_if_lyrics_is_enabled(ctx: commands.Context):
-    return ctx.cog.genius is not None
+async def check_if_lyrics_is_enabled(ctx: commands.Context):
+    # Checks run before the command waits for startup, the token may not be loaded yet.
+    await ctx.cog.startup.wait("lyrics")
+    return ctx.cog.lyrics_provider.enabled
 
 
 class PlexMusic(commands.Cog):
@@ -52,26 +101,115 @@ class PlexMusic(commands.Cog):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=208903205982044161)
         self.config.register_user(username=None, token=None, url=None)
-        self.config.register_global(username=None, token=None, url=None, lyricsgenius=None)
-        self.pms_cache: Dict[int, PlexServer] = {}
-        self.music_library: Dict[int, MusicSection] = {}
+        self.config.register_guild(stream_profile=DEFAULT_PROFILE)
+        self.config.register_global(
+            username=None,
+            token=None,
+            url=None,
+            lyricsgenius=None,
+            pool_size=DEFAULT_POOL_SIZE,
+            stream_mode=MODE_OPUS,
+            stall_threshold=int(DEFAULT_STALL_THRESHOLD * 1000),
+            search_budget=int(DEFAULT_BUDGET * 1000),
+            servers=[],
+            audio_workers=0,
+            audio_cache_size=DEFAULT_CACHE_BUDGET // MB,
+            audio_cache_admit=ADMIT_AFTER,
+            read_ahead=DEFAULT_READ_AHEAD,
+        )
+        self.pms_cache: Dict[int, AsyncPlexServer] = {}
+        self.music_library: Dict[int, AsyncMusicSection] = {}
+        # Servers searched alongside the global one, by url.
+        self.extra_servers: Dict[str, AsyncPlexServer] = {}
+        self.metrics = Metrics()
+        self.loop_monitor = LoopMonitor(self.metrics)
+        self._command_started: "weakref.WeakKeyDictionary[commands.Context, float]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.plex_executors = PlexExecutorPool(metrics=self.metrics)
+        self.connections = PlexConnectionManager(self.plex_executors)
+        self.credentials = CredentialCache(self.config)
+        self.metadata = MetadataCache(self.plex_executors)
+        self.searches = SingleFlight()
+        self.federated = FederatedSearch(metrics=self.metrics)
+        self.suggestions = SuggestionResolver()
+        self.track_index = TrackIndex(cog_data_path(self) / "library.sqlite3")
+        self._index_syncs: Dict[str, asyncio.Task] = {}
         self.cog_ready_event = asyncio.Event()
         self.session = aiohttp.ClientSession()
+        self.artwork = ArtworkCache(
+            self.session, cog_data_path(self) / "artwork", executors=self.plex_executors
+        )
+        self.audio_cache = AudioCache(self.session, cog_data_path(self) / "audio")
+        self.streams = StreamResolver(
+            self.plex_executors, cache=self.audio_cache, session=self.session
+        )
+        # Read-ahead buffer of the track playing in each guild, and the counters of its buffers.
+        self.read_ahead: Dict[int, ReadAheadStream] = {}
+        self.read_ahead_stats: Dict[int, Counter] = defaultdict(Counter)
+        self.stream_mode = MODE_OPUS
+        self.stream_profiles: Dict[int, str] = {}
 
         # Initialize necessary vars
         self.voice_channel: Dict[int, discord.VoiceClient] = {}
-        self.np_message_id: Dict[int, discord.Message] = {}
+        self.art_urls = ArtUrlCache()
+        self.now_playing = NowPlaying(self.art_urls)
         self.current_track: Dict[int, plexapi.audio.Track] = {}
-        self.ctx_cache: Dict[int, commands.Context] = {}
-        self.play_queue: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
-        self.play_next_event: Dict[int, asyncio.Event] = defaultdict(asyncio.Event)
+        # The command context, or the text channel of a queue resumed after a restart.
+        self.ctx_cache: Dict[int, discord.abc.Messageable] = {}
+        # When the current track would have started had it never been paused.
+        self.playback_started: Dict[int, float] = {}
+        self._paused_at: Dict[int, float] = {}
+        self.players = PlayerManager(
+            self._play,
+            on_finished=self._on_track_finished,
+            prepare=self._prepare_source,
+            discard=self._discard_source,
+            duration=lambda entry: (entry.duration - entry.offset) / 1000,
+            halt_on=(VoiceChannelError, discord.ClientException),
+        )
 
-        self.genius = None
-        self._task = None
+        self.lyrics_provider = LyricsProvider(LyricsStore(cog_data_path(self) / "lyrics.sqlite3"))
+        self._maintenance_task = None
+        self.snapshots = SnapshotStore(cog_data_path(self) / "queues.jsonl")
+        self._snapshot_marks: Dict[int, Tuple[int, int, Optional[QueueEntry], Optional[int]]] = {}
+        self._snapshot_task = None
+        self._stored_queues: Dict[int, StoredQueue] = {}
+        self._resume_limit = asyncio.Semaphore(RESUME_CONCURRENCY)
+        self.startup = Startup()
+        self.startup.add("red", lambda: self.bot.wait_until_red_ready())
+        self.startup.add("config", self._load_config)
+        self.startup.add("storage", self._open_storage)
+        self.startup.add("workers", self._start_workers)
+        self.startup.add("lyrics", self._lyrics_genius_init)
+        self.startup.add("plex", self._init_global_plex, after=("red", "config", "storage"))
+        self.startup.add("queues", self._restore_queues, after=("plex",))
 
     def cog_unload(self):
-        if self._task:
-            self._task.cancel()
+        self.loop_monitor.stop()
+        self.startup.cancel()
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+        # Taken before the players stop, so the queues and positions are still there.
+        records = self._snapshot_records() if self.startup.is_ready("queues") else []
+        self.players.shutdown()
+        # Connections are left up for the reloaded cog to resume on, only the audio stops.
+        for voice_client in self.voice_channel.values():
+            if voice_client is not None:
+                voice_client.stop()
+        if self.streams.workers is not None:
+            self.streams.workers.shutdown(wait=False)
+        self.now_playing.shutdown()
+        self.snapshots.close(records)
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+        for task in self._index_syncs.values():
+            task.cancel()
+        self.track_index.close()
+        self.lyrics_provider.close()
+        self.audio_cache.close()
+        self.connections.close()
+        self.plex_executors.shutdown()
         asyncio.create_task(self.session.close())
 
     async def red_delete_data_for_user(
@@ -84,63 +222,117 @@ class PlexMusic(commands.Cog):
         Method for finding users data inside the cog and deleting it.
         """
         await self.config.user_from_id(user_id).clear()
+        self._forget_user(user_id)
         if requester == "owner":
             await self.config.clear_all_globals()
 
     async def cog_before_invoke(self, ctx: commands.Context) -> None:
-        await self.cog_ready_event.wait()
-        await self.get_context_server(ctx)
+        self._command_started[ctx] = time.perf_counter()
+        # Plex requests of the command, and of the tasks it starts, are made for its guild.
+        set_request_context(ctx.guild.id if ctx.guild else None, Priority.INTERACTIVE)
+        required = self.startup.closure(self.startup.required(ctx.command))
+        await self.startup.wait(*required)
+        if (
+            self.startup.is_ready("queues")
+            and ctx.guild is not None
+            and ctx.guild.id in self._stored_queues
+        ):
+            await self._restore_guild(ctx.guild.id)
+        if "plex" in required:
+            await self.get_context_server(ctx)
+
+    async def cog_after_invoke(self, ctx: commands.Context) -> None:
+        if (started := self._command_started.pop(ctx, None)) is not None:
+            self.metrics.observe(
+                "command_seconds",
+                ctx.command.qualified_name,
+                time.perf_counter() - started,
+                "command",
+            )
 
     async def _maybe_auth(self, ctx: commands.Context):
-        user_id = ctx.author.id
+        await self._connect_user(ctx.author.id)
+
+    async def _connect_user(self, user_id: int):
+        """Connect to the Plex server of a user if they set one up."""
         if user_id not in self.pms_cache:
-            user_data = await self.config.user(ctx.author).all()
-            if not all(user_data.get(k) for k in ["token", "url"]):
+            if (credentials := await self.credentials.get(user_id)) is None:
+                return
+            if self.credentials.is_backing_off(credentials):
                 return
-            url, token = user_data.get("url"), user_data.get("token")
             try:
-                server = PlexServer(url, token)
-                self.pms_cache[user_id] = PlexServer(url, token)
-                self.music_library[user_id] = next(
-                    iter(
-                        section
-                        for section in server.library.sections()
-                        if section.type == "artist"
-                    ),
-                    None,
-                )
-            except:
+                server = await self.connections.connect(credentials.url, credentials.token)
+                self.pms_cache[user_id] = server
+                self.music_library[user_id] = await server.music_section()
+            except Exception:
+                log.debug("Unable to connect to the Plex server of %s", user_id, exc_info=True)
+                self.credentials.record_failure(credentials)
                 return
+            self.credentials.record_success(credentials)
+            for section in await server.music_sections():
+                self._schedule_index_sync(section)
         elif user_id in self.pms_cache and user_id not in self.music_library:
             server = self.pms_cache[user_id]
-            self.music_library[user_id] = next(
-                iter(section for section in server.library.sections() if section.type == "artist"),
-                None,
-            )
+            with contextlib.suppress(Exception):
+                self.music_library[user_id] = await server.music_section()
+                self._schedule_index_sync(self.music_library[user_id])
 
-    async def get_context_server(self, ctx: commands.Context) -> Optional[PlexServer]:
+    def _forget_user(self, user_id: int):
+        """Drop the cached credentials and connection of a user."""
+        self.credentials.invalidate(user_id)
+        self.pms_cache.pop(user_id, None)
+        self.music_library.pop(user_id, None)
+
+    async def get_context_server(self, ctx: commands.Context) -> Optional[AsyncPlexServer]:
         await self._maybe_auth(ctx)
         default = self.pms_cache.get(self.bot.user.id, None)
         user = self.pms_cache.get(ctx.author.id, None)
         return user or default
 
     async def _init(self):
-        await self.bot.wait_until_red_ready()
-        await self._lyrics_genius_init()
-        await self._init_global_plex()
-        self._task = self._audio_player_task()
-        self.bot.loop.create_task(self._task)
+        self.loop_monitor.start()
+        await self.startup.run()
+        self._maintenance_task = asyncio.create_task(self._maintenance())
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
         self.cog_ready_event.set()
 
+    async def _load_config(self):
+        global_data = await self.config.all()
+        self.loop_monitor.stall_threshold = global_data["stall_threshold"] / 1000
+        pool_size = global_data["pool_size"]
+        self.plex_executors.max_workers = self.connections.pool_size = pool_size
+        self.stream_mode = global_data["stream_mode"]
+        self.federated.budget = global_data["search_budget"] / 1000
+        self.audio_cache.budget = global_data["audio_cache_size"] * MB
+        self.audio_cache.admit_after = global_data["audio_cache_admit"]
+        self.streams.read_ahead = global_data["read_ahead"]
+        self.stream_profiles = {
+            guild_id: data["stream_profile"]
+            for guild_id, data in (await self.config.all_guilds()).items()
+        }
+
+    async def _open_storage(self):
+        """Open the local databases, each on its own thread."""
+        await asyncio.gather(
+            self.track_index.initialize(),
+            self.audio_cache.initialize(),
+            self.credentials.load(),
+            self.lyrics_provider.store.initialize(),
+        )
+
+    async def _start_workers(self):
+        if audio_workers := await self.config.audio_workers():
+            workers = AudioWorkerPool(audio_workers)
+            # Spawning the processes blocks.
+            await asyncio.get_running_loop().run_in_executor(None, workers.start)
+            self.streams.workers = workers
+
     async def _lyrics_genius_init(self, token: str = None):
-        if lyricsgenius:
-            if not token:
-                token = await self.config.lyricsgenius()
-            if token is not None:
-                self.genius = lyricsgenius.Genius(token)  # FIXME: Blocking call
-                return
-        log.warning("No lyrics token specified, lyrics disabled")
-        self.genius = None
+        if not token:
+            token = await self.config.lyricsgenius()
+        await self.lyrics_provider.set_token(token)
+        if not self.lyrics_provider.enabled:
+            log.warning("No lyrics token specified, lyrics disabled")
 
     async def _init_global_plex(self, bot_id: int = None, username=None, token=None, url=None):
         try:
@@ -157,15 +349,16 @@ class PlexMusic(commands.Cog):
                     "to setup the global configuration."
                 )
                 return
-            server = PlexServer(url, token)
-            self.pms_cache[bot_id] = PlexServer(url, token)  # FIXME: Blocking call
-            self.music_library[bot_id] = next(
-                (
-                    section for section in server.library.sections() if section.type == "artist"
-                ),  # FIXME: Blocking call
-                None,
-            )
-
+            server = await self.connections.connect(url, token, pinned=True)
+            self.pms_cache[bot_id] = server
+            self.music_library[bot_id] = await server.music_section()
+            for section in await server.music_sections():
+                self._schedule_index_sync(section)
+            urls = await self.config.servers()
+            await asyncio.gather(*(self._connect_extra_server(u, token) for u in urls))
+
+        except PlexTimeoutError:
+            log.error("Timed out connecting to the global Plex server at %s", url)
         except plexapi.exceptions.Unauthorized:
             log.fatal(
                 "Invalid global Plex auth. Make sure to run the following commands in DM:  "
@@ -173,40 +366,309 @@ class PlexMusic(commands.Cog):
                 "to setup the global configuration."
             )
 
-    def _search_tracks(
+    async def _connect_extra_server(self, url: str, token: str) -> bool:
+        """Connect to a server searched alongside the global one and index its sections."""
+        try:
+            server = await self.connections.connect(url, token, pinned=True)
+            sections = await server.music_sections()
+        except Exception:
+            log.warning("Unable to connect to the Plex server at %s", url, exc_info=True)
+            return False
+        self.extra_servers[url] = server
+        for section in sections:
+            self._schedule_index_sync(section)
+        return True
+
+    def _schedule_index_sync(self, section: Optional[AsyncMusicSection]):
+        """Start syncing the local index of a MusicSection unless it's already syncing."""
+        if section is None:
+            return
+        source = TrackIndex.source_id(section)
+        if (task := self._index_syncs.get(source)) and not task.done():
+            return
+        with request_context(guild_id=None, priority=Priority.BACKGROUND):
+            self._index_syncs[source] = asyncio.create_task(self._sync_index(section))
+
+    async def _sync_index(self, section: AsyncMusicSection):
+        try:
+            await self.track_index.sync(section)
+            # Rebuilt right away so the first typo doesn't wait for it.
+            for kind in ("track", "album"):
+                await self._corpus(kind, section)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Failed to sync the library index of %s", section.title)
+
+    def _evict_idle_connections(self):
+        """Close idle Plex connections, users reconnect on their next command."""
+        evicted = self.connections.evict_idle(self._servers_in_use())
+        for user_id, server in list(self.pms_cache.items()):
+            if server in evicted:
+                del self.pms_cache[user_id]
+                self.music_library.pop(user_id, None)
+
+    def _servers_in_use(self) -> Set[plexapi.server.PlexServer]:
+        """Servers the current, next and queued entries of every guild play from."""
+        servers = set()
+        for player in self.players.players.values():
+            for entry in itertools.chain((player.current, player.next_item), player.queue):
+                if entry is not None:
+                    servers.add(entry.server)
+        return servers
+
+    async def _maintenance(self):
+        with contextlib.suppress(asyncio.CancelledError):
+            while True:
+                await asyncio.sleep(INDEX_SYNC_INTERVAL)
+                self._evict_idle_connections()
+                sections = {}
+                for server in {*self.pms_cache.values(), *self.extra_servers.values()}:
+                    with contextlib.suppress(Exception):
+                        for section in await server.music_sections():
+                            sections[TrackIndex.source_id(section)] = section
+                for section in sections.values():
+                    self._schedule_index_sync(section)
+
+    def _position(self, guild_id: int) -> int:
+        """Milliseconds into the current track of a guild."""
+        if (started := self.playback_started.get(guild_id)) is None:
+            return 0
+        return int(max(self._paused_at.get(guild_id, time.monotonic()) - started, 0) * 1000)
+
+    def _snapshot_records(self) -> List[str]:
+        """Records for every guild whose queue or playback changed since its last one."""
+        records = []
+        for guild_id, player in self.players.players.items():
+            queue = player.queue
+            queued = [player.next_item] if player.next_item is not None else []
+            # The prepared item was taken off the queue but hasn't started, keep it queued.
+            taken = queue.taken - len(queued)
+            voice_client = self.voice_channel.get(guild_id)
+            voice_channel_id = voice_client.channel.id if voice_client else None
+            state = (queue.version, taken, player.current, voice_channel_id)
+            mark = self._snapshot_marks.get(guild_id)
+            if mark == state and (player.current is None or guild_id in self._paused_at):
+                continue
+            if mark is None and not queued and not player.current and queue.empty():
+                continue
+            text_channel = self.ctx_cache.get(guild_id)
+            text_channel_id = getattr(text_channel, "channel", text_channel)
+            text_channel_id = getattr(text_channel_id, "id", None)
+            offset = self._position(guild_id) if player.current is not None else 0
+            if mark is None or mark[0] != queue.version:
+                record = full_record(
+                    guild_id,
+                    itertools.chain(queued, queue),
+                    player.current,
+                    offset,
+                    voice_channel_id,
+                    text_channel_id,
+                )
+            else:
+                record = position_record(
+                    guild_id,
+                    taken - mark[1],
+                    player.current,
+                    offset,
+                    voice_channel_id,
+                    text_channel_id,
+                )
+            self._snapshot_marks[guild_id] = state
+            records.append(record)
+        return records
+
+    async def _snapshot_loop(self):
+        with contextlib.suppress(asyncio.CancelledError):
+            while True:
+                await asyncio.sleep(SNAPSHOT_INTERVAL)
+                try:
+                    await self.snapshots.append(self._snapshot_records())
+                except Exception:
+                    log.exception("Failed to snapshot the queues")
+
+    async def _restore_queues(self):
+        """
+        Load the queues snapshotted before the cog was unloaded
+        A queue is only parsed and refilled the first time a command is used
+        in its guild, or right away if it was playing and someone is still
+        in its voice channel. Tracks are fetched from Plex once they play.
+        """
+        started = time.perf_counter()
+        try:
+            self._stored_queues = await self.snapshots.load()
+        except Exception:
+            log.exception("Unable to load the queue snapshots")
+            return
+        for stored in self._stored_queues.values():
+            if stored.voice_channel_id:
+                asyncio.create_task(
+                    self._resume_playback(stored.guild_id, stored.voice_channel_id)
+                )
+        log.info(
+            "Loaded the queues of %d guilds in %.0f ms",
+            len(self._stored_queues),
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def _servers_by_id(self) -> Dict[str, plexapi.server.PlexServer]:
+        return {
+            server.machine_identifier: server.server
+            for server in itertools.chain(self.pms_cache.values(), self.extra_servers.values())
+        }
+
+    async def _restore_guild(self, guild_id: int) -> Optional[GuildSnapshot]:
+        """Queue what a guild had queued before the restart, unless it was already restored."""
+        if (stored := self._stored_queues.pop(guild_id, None)) is None:
+            return None
+        if (snapshot := stored.snapshot()) is None:
+            return None
+        servers = self._servers_by_id()
+        if any(machine not in servers for machine in snapshot.servers):
+            # Tracks from the servers of individual users wait for them to connect.
+            rows = itertools.chain(snapshot.queue, filter(None, [snapshot.current]))
+            users = {row[6] for row in rows if row[6]}
+            await asyncio.gather(*(self._connect_user(user_id) for user_id in users))
+            servers = self._servers_by_id()
+        player = self.players.get(guild_id)
+        entries = restore_entries(snapshot, snapshot.queue, servers)
+        if snapshot.current and (
+            current := restore_entries(snapshot, [snapshot.current], servers)
+        ):
+            current[0].offset = snapshot.offset
+            entries.insert(0, current[0])
+        if dropped := len(snapshot.queue) + bool(snapshot.current) - len(entries):
+            log.info(
+                "Dropped %d queued tracks of %s, their servers are unavailable", dropped, guild_id
+            )
+        for position, entry in enumerate(entries):
+            player.queue.insert(position, entry)
+        return snapshot
+
+    async def _resume_playback(self, guild_id: int, voice_channel_id: int):
+        """Rejoin the voice channel of a restored queue if anyone is still listening."""
+        async with self._resume_limit:
+            channel = self.bot.get_channel(voice_channel_id)
+            if not isinstance(channel, discord.VoiceChannel):
+                return
+            if not any(not member.bot for member in channel.members):
+                return
+            if (snapshot := await self._restore_guild(guild_id)) is None:
+                return
+            if self.players.get(guild_id).queue.empty() or self.voice_channel.get(guild_id):
+                return
+            if (text_channel := self.bot.get_channel(snapshot.text_channel_id)) is not None:
+                self.ctx_cache.setdefault(guild_id, text_channel)
+            try:
+                self.voice_channel[guild_id] = await self._connect(channel)
+            except (asyncio.TimeoutError, discord.ClientException):
+                log.debug("Unable to rejoin the voice channel of %s", guild_id)
+                return
+            self.players.start(guild_id)
+
+    @staticmethod
+    async def _connect(channel: discord.VoiceChannel) -> discord.VoiceClient:
+        """
+        Connect to a voice channel, reusing the connection of the guild if there is one
+        A reloaded cog finds the voice clients of the previous one still connected.
+        """
+        voice_client = channel.guild.voice_client
+        if voice_client is None or not voice_client.is_connected():
+            return await channel.connect()
+        if voice_client.channel != channel:
+            await voice_client.move_to(channel)
+        return voice_client
+
+    def _servers_for(self, ctx: commands.Context) -> List[AsyncPlexServer]:
+        """The servers searched for a command, the author's own or every global one."""
+        if (server := self.pms_cache.get(ctx.author.id)) is not None:
+            return [server]
+        servers = [self.pms_cache.get(self.bot.user.id), *self.extra_servers.values()]
+        return list(dict.fromkeys(s for s in servers if s is not None))
+
+    async def _sections_for(self, ctx: commands.Context) -> List[AsyncMusicSection]:
+        sections = []
+        for server in self._servers_for(ctx):
+            try:
+                sections.extend(await server.music_sections())
+            except Exception:
+                log.debug("Unable to list the music sections of %s", server.name, exc_info=True)
+        return sections
+
+    async def _federated_search(
+        self, kind: str, targets: List, lookup, title: str, *args: Optional[str]
+    ) -> FederatedResult:
+        """
+        Run `lookup` against every target concurrently and return the best match
+        Args:
+            kind: What is searched for, part of the single-flight key.
+            targets: The music sections or servers to search.
+            lookup: Coroutine function taking a target, the title and `args`.
+            title: The title searched for, results are ranked by how well they match it.
+        Returns:
+            FederatedResult with the best match and the targets that didn't answer in time.
+        Raises:
+            MediaNotFoundError: None of the targets found anything.
+        """
+        # Identical searches made at the same time, e.g. across guilds, share one lookup.
+        query = (title.casefold(), *(a.casefold() if a else None for a in args))
+        sources = [
+            Source(
+                target.name,
+                functools.partial(
+                    self.searches.do,
+                    (kind, target, *query),
+                    functools.partial(lookup, target, title, *args),
+                ),
+            )
+            for target in targets
+        ]
+        return await self.federated.search(sources, lambda item: relevance(title, item.title))
+
+    async def _search_tracks(
         self, ctx: commands.Context, title: str, artist: str = None
-    ) -> plexapi.audio.Track:
+    ) -> FederatedResult:
         """
         Search the Plex music db for track
         Args:
             title: str title of song to search for
         Returns:
-            plexapi.audio.Track pointing to best matching title
+            FederatedResult pointing to the best matching plexapi.audio.Track
         Raises:
             MediaNotFoundError: Title of track can't be found in plex db
         """
-        if not (musiclib := self.music_library.get(ctx.author.id)):
-            if not (musiclib := self.music_library.get(self.bot.user.id)):
-                raise MediaNotFoundError("Track cannot be found")
+        if not (sections := await self._sections_for(ctx)):
+            raise MediaNotFoundError("Track cannot be found")
+        return await self._federated_search("track", sections, self._lookup_track, title, artist)
+
+    async def _lookup_track(
+        self, musiclib: AsyncMusicSection, title: str, artist: str = None
+    ) -> plexapi.audio.Track:
+        # Answer from the local index and only fetch the chosen track,
+        # items newer than the last sync fall through to a live search.
+        if self.track_index.is_ready(musiclib):
+            if hits := self.track_index.search_tracks(musiclib, title, artist):
+                with contextlib.suppress(plexapi.exceptions.NotFound):
+                    return await musiclib.server.fetch_item(hits[0].rating_key)
 
         if artist:
-            results = musiclib.searchTracks(
+            results = await musiclib.search_tracks(
                 title=title,
                 maxresults=10,
                 sort="titleSort",
-                **{  # FIXME: Blocking call
+                **{
                     "track.title": title,
                 },
             )
-            results = [
-                r for r in results if r.artist().title.lower() == artist.lower()
-            ]  # FIXME: Blocking call
+            await self.metadata.prefetch(results)
+            titles = await asyncio.gather(*(self.metadata.track_titles(r) for r in results))
+            results = [r for r, t in zip(results, titles) if t[1].lower() == artist.lower()]
         else:
-            results = musiclib.searchTracks(
+            results = await musiclib.search_tracks(
                 title=title,
                 sort="titleSort",
                 maxresults=1,
-                **{  # FIXME: Blocking call
+                **{
                     "track.title": title,
                 },
             )
@@ -215,101 +677,280 @@ class PlexMusic(commands.Cog):
         except IndexError:
             raise MediaNotFoundError("Track cannot be found")
 
-    def _search_albums(self, ctx: commands.Context, title: str) -> plexapi.audio.Album:
+    async def _search_albums(self, ctx: commands.Context, title: str) -> FederatedResult:
         """
         Search the Plex music db for album
         Args:
             title: str title of album to search for
         Returns:
-            plexapi.audio.Album pointing to best matching title
+            FederatedResult pointing to the best matching plexapi.audio.Album
         Raises:
             MediaNotFoundError: Title of album can't be found in plex db
         """
-        if not (musiclib := self.music_library.get(ctx.author.id)):
-            if not (musiclib := self.music_library.get(self.bot.user.id)):
-                raise MediaNotFoundError("Track cannot be found")
-        results = musiclib.searchAlbums(title=title, maxresults=1)  # FIXME: Blocking call
+        if not (sections := await self._sections_for(ctx)):
+            raise MediaNotFoundError("Album cannot be found")
+        return await self._federated_search("album", sections, self._lookup_album, title)
+
+    async def _lookup_album(self, musiclib: AsyncMusicSection, title: str) -> plexapi.audio.Album:
+        if self.track_index.is_ready(musiclib):
+            if hits := self.track_index.search_albums(musiclib, title):
+                with contextlib.suppress(plexapi.exceptions.NotFound):
+                    return await musiclib.server.fetch_item(hits[0].rating_key)
+        results = await musiclib.search_albums(title=title, maxresults=1)
         try:
             return results[0]
         except IndexError:
             raise MediaNotFoundError("Album cannot be found")
 
-    async def _search_playlists(
-        self, ctx: commands.Context, title: str
-    ) -> plexapi.playlist.Playlist:
+    async def _search_playlists(self, ctx: commands.Context, title: str) -> FederatedResult:
         """
         Search the Plex music db for playlist
         Args:
             title: str title of playlist to search for
         Returns:
-            plexapi.playlist.Playlist pointing to best matching title
+            FederatedResult pointing to the best matching plexapi.playlist.Playlist
         Raises:
             MediaNotFoundError: Title of playlist can't be found in plex db
         """
+        await self._maybe_auth(ctx)
+        if not (servers := self._servers_for(ctx)):
+            raise MediaNotFoundError("Playlist cannot be found")
+        return await self._federated_search("playlist", servers, self._lookup_playlist, title)
+
+    @staticmethod
+    async def _lookup_playlist(server: AsyncPlexServer, title: str) -> plexapi.playlist.Playlist:
         try:
-            server = await self.get_context_server(ctx)
-            return server.playlist(title)  # FIXME: Blocking call
+            return await server.playlist(title)
         except plexapi.exceptions.NotFound:
             raise MediaNotFoundError("Playlist cannot be found")
 
-    async def _play(self, guild_id: int):
+    async def _corpus(self, kind: str, target) -> Optional[TitleCorpus]:
+        """The title corpus of the tracks or albums of a section, or the playlists of a server."""
+        if kind == "playlist":
+            return await self.suggestions.corpus(
+                (kind, target.machine_identifier),
+                int(time.time() // PLAYLIST_TITLES_TTL),
+                lambda: self._playlist_titles(target),
+            )
+        if not self.track_index.is_ready(target):
+            return None
+        return await self.suggestions.corpus(
+            (kind, TrackIndex.source_id(target)),
+            self.track_index.version(target),
+            lambda: self.track_index.titles(target, kind),
+        )
+
+    @staticmethod
+    async def _playlist_titles(server: AsyncPlexServer) -> List[Tuple[str, Optional[str]]]:
+        return [(playlist.title, None) for playlist in await server.playlists()]
+
+    async def _suggest(self, ctx: commands.Context, kind: str, title: str) -> List[Suggestion]:
+        """
+        Titles close to one that wasn't found
+        Args:
+            ctx: discord.ext.commands.Context message context from command
+            kind: `track`, `album` or `playlist`.
+            title: The title that wasn't found.
+        Returns:
+            List of Suggestion, best first, across every library the command searches.
+        """
+        targets = self._servers_for(ctx) if kind == "playlist" else await self._sections_for(ctx)
+        corpora = []
+        for corpus in await asyncio.gather(
+            *(self._corpus(kind, target) for target in targets), return_exceptions=True
+        ):
+            if isinstance(corpus, Exception):
+                log.debug("Unable to build a title corpus", exc_info=corpus)
+            elif corpus is not None:
+                corpora.append(corpus)
+        return await self.suggestions.suggest(corpora, title)
+
+    async def _send_not_found(self, ctx: commands.Context, kind: str, label: str, title: str):
+        message = f"Can't find {label}: {title}"
+        if suggestions := await self._suggest(ctx, kind, title):
+            lines = [
+                f"{i}. {s.title} - {s.detail}" if s.detail else f"{i}. {s.title}"
+                for i, s in enumerate(suggestions, 1)
+            ]
+            message += "\nDid you mean:\n" + "\n".join(lines)
+        await ctx.send(message)
+
+    async def _track_pages(self, container, requester: int) -> AsyncIterator[List[QueueEntry]]:
+        """The tracks of an album or playlist as queue entries, a page at a time."""
+        async for page in iter_pages(self.plex_executors, container):
+            if entries := [
+                QueueEntry.from_track(item, requester) for item in page if item.TYPE == "track"
+            ]:
+                yield entries
+
+    async def _queue_container(self, ctx: commands.Context, container, requested_at: float):
+        """
+        Queue the tracks of an album or playlist
+        The first page is queued right away so playback can start, the
+        rest is queued in the background by the guild's player.
+        Args:
+            ctx: discord.ext.commands.Context message context from command
+            container: plexapi.audio.Album or plexapi.playlist.Playlist to queue.
+            requested_at: `time.perf_counter()` when the command was invoked.
+        """
+        player = self.players.start(ctx.guild.id)
+        idle = player.idle
+        pages = self._track_pages(container, ctx.author.id)
+        try:
+            first = await pages.__anext__()
+        except StopAsyncIteration:
+            return
+        if idle:
+            player.expect(first[0], requested_at)
+        for entry in first:
+            player.queue.put_nowait(entry)
+        with request_context(priority=Priority.BACKGROUND):
+            player.feed(pages)
+        if (container.leafCount or 0) > PAGE_SIZE:
+            log.info(
+                "Queued the first %d of %d tracks of %s in %.0f ms",
+                len(first),
+                container.leafCount,
+                container.title,
+                (time.perf_counter() - requested_at) * 1000,
+            )
+
+    async def _rehydrate(self, entry: QueueEntry) -> plexapi.audio.Track:
+        """Fetch the full track of a queue entry."""
+        executor = self.plex_executors.get(entry.server._baseurl)
+        return await executor.run(entry.server.fetchItem, entry.rating_key)
+
+    async def _prepare_source(self, guild_id: int, entry: QueueEntry) -> PreparedTrack:
+        """
+        Fetch the track of a queue entry, resolve its stream and start its FFmpeg process
+        FFmpeg connects to Plex and starts buffering right away,
+        so the source can be played without any delay later on.
+        """
+        with request_context(guild_id=guild_id, priority=Priority.PLAYBACK):
+            track = await self._rehydrate(entry)
+            bitrate = DEFAULT_BITRATE
+            if (voice_client := self.voice_channel.get(guild_id)) and voice_client.channel:
+                bitrate = voice_client.channel.bitrate // 1000
+            source = await self.streams.source(
+                track,
+                self.stream_mode,
+                bitrate,
+                self.stream_profiles.get(guild_id, DEFAULT_PROFILE),
+                entry.offset / 1000,
+                self.read_ahead_stats[guild_id],
+            )
+        return PreparedTrack(track, source)
+
+    @staticmethod
+    def _discard_source(prepared: PreparedTrack):
+        prepared.source.cleanup()
+
+    async def _play(
+        self,
+        guild_id: int,
+        entry: QueueEntry,
+        prepared: Optional[PreparedTrack] = None,
+    ):
         """
         Heavy lifting of playing songs
         Grabs the appropriate streaming URL, sends the `now playing`
         message, and initiates playback in the vc.
+        Called by the guild's player once the previous track is done,
+        with the source it prepared ahead of time if there is one.
         """
-        track_url = self.current_track[guild_id].getStreamURL()  # FIXME: Blocking call
-        audio_stream = FFmpegPCMAudio(track_url)
-
-        while self.voice_channel[guild_id].is_playing():
-            await asyncio.sleep(2)
-
-        self.voice_channel[guild_id].play(
-            audio_stream, after=functools.partial(self._toggle_next, guild_id=guild_id)
+        if not (voice_client := self.voice_channel.get(guild_id)):
+            if prepared:
+                self._discard_source(prepared)
+            raise VoiceChannelError
+        if prepared is None:
+            prepared = await self._prepare_source(guild_id, entry)
+        track, audio_stream = prepared
+        try:
+            voice_client.play(
+                audio_stream, after=functools.partial(self._toggle_next, guild_id=guild_id)
+            )
+        except discord.ClientException:
+            # Disconnected meanwhile, the player puts the entry back.
+            self._discard_source(prepared)
+            raise
+        self.current_track[guild_id] = track
+        if isinstance(audio_stream, ReadAheadAudio):
+            self.read_ahead[guild_id] = audio_stream.stream
+        else:
+            self.read_ahead.pop(guild_id, None)
+        self.playback_started[guild_id] = time.monotonic() - entry.offset / 1000
+        self._paused_at.pop(guild_id, None)
+
+        self._schedule_now_playing(guild_id)
+
+    async def _on_track_finished(self, guild_id: int):
+        self.playback_started.pop(guild_id, None)
+        self.read_ahead.pop(guild_id, None)
+        self._paused_at.pop(guild_id, None)
+        # Removes the message unless the next track starts first, which edits it instead.
+        self._schedule_now_playing(guild_id)
+
+    def _schedule_now_playing(self, guild_id: int):
+        self.now_playing.schedule(
+            guild_id,
+            functools.partial(self._render_now_playing, guild_id),
+            lambda: self.ctx_cache.get(guild_id),
         )
 
-        log.debug("%s - URL: %s", self.current_track[guild_id], track_url)
-
-        embed, img = await self._build_embed_track(self.current_track[guild_id])
-        if not embed:
-            return
-        self.np_message_id[guild_id] = await self.ctx_cache[guild_id].send(embed=embed, file=img)
+    async def _render_now_playing(self, guild_id: int, exclude: Optional[int] = None):
+        with request_context(guild_id=guild_id, priority=Priority.COSMETIC):
+            return await self._build_embed_track(self.current_track.get(guild_id), exclude=exclude)
 
-    async def _audio_player_task(self):
-        await self.bot.wait_until_red_ready()
-        with contextlib.suppress(asyncio.CancelledError):
-            while True:
-                await asyncio.sleep(0.5)
-                for k, voice_channel in self.voice_channel.items():
-                    await asyncio.sleep(0.1)
-                    self.play_next_event[k].clear()
-                    if voice_channel:
-                        try:
-                            # Disconnect after 15 seconds idle
-                            async with timeout(1):
-                                self.current_track[k] = await self.play_queue[k].get()
-                        except asyncio.TimeoutError:
-                            continue
-                    if not self.current_track.get(k):
-                        self.current_track[k] = await self.play_queue[k].get()
-                    await self._play(k)
-                    if not self.play_next_event[k].is_set():
-                        continue
-                    with contextlib.suppress(discord.HTTPException):
-                        await self.np_message_id[k].delete()
+    async def _attach_art(
+        self,
+        embed: discord.Embed,
+        server: plexapi.server.PlexServer,
+        path: Optional[str],
+        exclude: Optional[int] = None,
+    ) -> Optional[discord.File]:
+        """
+        Set the thumbnail of an embed, reusing the art if it was uploaded before
+        Args:
+            embed: The embed to set the thumbnail of.
+            server: The PlexServer the art belongs to.
+            path: The thumb/composite path of the item.
+            exclude: Id of a message about to be deleted, its art isn't reused.
+        Returns:
+            The art to upload with the embed, None if it's reused or there is none.
+        """
+        if not path:
+            return None
+        key = self.artwork.key(server, path)
+        if url := self.art_urls.get(key, exclude):
+            embed.set_thumbnail(url=url)
+            return None
+        if not (art := await self.artwork.get(server, path)):
+            return None
+        # Named after its key, so the url of the upload can be reused.
+        embed.set_thumbnail(url=f"attachment://{key}.jpg")
+        return discord.File(io.BytesIO(art), filename=f"{key}.jpg")
+
+    async def _send_card(self, ctx: commands.Context, embed: discord.Embed, art):
+        self.art_urls.remember(await ctx.send(embed=embed, file=art))
 
     def _toggle_next(self, error=None, guild_id: int = None):
         """
         Callback for vc playback
-        Clears current track, then activates _audio_player_task
-        to play next in queue or disconnect.
+        Clears current track, then wakes up the guild's player
+        to play next in queue.
+        Runs in the voice client's thread.
         """
         if guild_id is None:
             return
+        if error:
+            log.error("Playback error in %s", guild_id, exc_info=error)
         self.current_track[guild_id] = None
-        self.bot.loop.call_soon_threadsafe(self.play_next_event[guild_id].set)
+        self.players.notify_finished(guild_id)
 
-    async def _build_embed_track(self, track: plexapi.audio.Track, type_="play"):
+    @timed("embed_seconds", "track")
+    async def _build_embed_track(
+        self, track: plexapi.audio.Track, type_="play", exclude: Optional[int] = None
+    ):
         """
         Creates a pretty embed card for tracks
         Builds a helpful status embed with the following info:
@@ -318,6 +959,7 @@ class PlexMusic(commands.Cog):
         Args:
             track: plexapi.audio.Track object of song
             type_: Type of card to make (play, queue).
+            exclude: Id of a message about to be deleted, its art isn't reused.
         Returns:
             embed: discord.embed fully constructed payload.
             thumb_art: io.BytesIO of album thumbnail img.
@@ -328,14 +970,6 @@ class PlexMusic(commands.Cog):
 
         if not track:
             return None, None
-        if not track.thumbUrl:
-            log.warning(f"{track.title} does not have a thumbnail")
-            art_file = None
-        else:
-            async with self.session.get(track.thumbUrl) as resp:
-                img = io.BytesIO(await resp.read())
-            # Attach to discord embed
-            art_file = discord.File(img, filename="image0.png")
         # Get appropiate status message
         if type_ == "play":
             title = f"Now Playing - {track.title}"
@@ -345,19 +979,22 @@ class PlexMusic(commands.Cog):
             raise ValueError(f"Unsupported type of embed {type_}")
 
         # Include song details
-        descrip = f"{track.album().title} - {track.artist().title}"  # FIXME: Blocking call
+        album_title, artist_title = await self.metadata.track_titles(track)
+        descrip = f"{album_title} - {artist_title}"
 
         # Build the actual embed
         embed = discord.Embed(title=title, description=descrip, colour=discord.Color.red())
         embed.set_author(name=self.bot.user.name)
-        if art_file:
-            # Point to file attached with ctx object.
-            embed.set_thumbnail(url="attachment://image0.png")
+        thumb = track.firstAttr("thumb", "parentThumb")
+        art_file = await self._attach_art(embed, track._server, thumb, exclude)
+        if embed.thumbnail.url is discord.Embed.Empty:
+            log.warning(f"{track.title} does not have a thumbnail")
 
         log.debug("Built embed for track - %s", track.title)
 
         return embed, art_file
 
+    @timed("embed_seconds", "album")
     async def _build_embed_album(self, album: plexapi.audio.Album):
         """
         Creates a pretty embed card for albums
@@ -375,55 +1012,49 @@ class PlexMusic(commands.Cog):
         # Grab the relevant thumbnail
         if not album:
             return None, None
-        if not album.thumbUrl:
-            log.warning(f"{album.title} does not have a thumbnail.")
-            art_file = None
-        else:
-            async with self.session.get(album.thumbUrl) as resp:
-                img = io.BytesIO(await resp.read())
-            # Attach to discord embed
-            art_file = discord.File(img, filename="image0.png")
         title = "Added album to queue"
-        descrip = f"{album.title} - {album.artist().title}"  # FIXME: Blocking call
+        descrip = f"{album.title} - {await self.metadata.album_artist(album)}"
 
         embed = discord.Embed(title=title, description=descrip, colour=discord.Color.red())
         embed.set_author(name=self.bot.user.name)
-        if art_file:
-            embed.set_thumbnail(url="attachment://image0.png")
+        art_file = await self._attach_art(embed, album._server, album.thumb)
+        if embed.thumbnail.url is discord.Embed.Empty:
+            log.warning(f"{album.title} does not have a thumbnail.")
         log.debug("Built embed for album - %s", album.title)
 
         return embed, art_file
 
+    @timed("embed_seconds", "playlist")
     async def _build_embed_playlist(
         self, ctx: commands.Context, playlist: plexapi.playlist.Playlist
     ):
         """"""
         # Grab the relevant thumbnail
 
-        if not playlist:
+        if playlist is None:
             return None, None
-        if not playlist.composite:
-            log.debug(f"{playlist.title} does not have a composite image.")
-            art_file = None
-        else:
-            server = await self.get_context_server(ctx)
-            async with self.session.get(server.url(playlist.composite, True)) as resp:
-                img = io.BytesIO(await resp.read())
-            # Attach to discord embed
-            art_file = discord.File(img, filename="image0.png")
 
         title = "Added playlist to queue"
         descrip = f"{playlist.title}"
 
         embed = discord.Embed(title=title, description=descrip, colour=discord.Color.red())
         embed.set_author(name=self.bot.user.name)
-        if art_file:
-            embed.set_thumbnail(url="attachment://image0.png")
+        art_file = await self._attach_art(embed, playlist._server, playlist.composite)
+        if embed.thumbnail.url is discord.Embed.Empty:
+            log.debug(f"{playlist.title} does not have a composite image.")
 
         log.debug("Built embed for playlist - %s", playlist.title)
 
         return embed, art_file
 
+    @staticmethod
+    async def _note_slow_sources(ctx: commands.Context, result: FederatedResult):
+        if result.slow:
+            await ctx.send(
+                f"{', '.join(result.slow)} didn't answer in time, "
+                f"playing the best match from {result.source}."
+            )
+
     async def _validate(self, ctx: commands.Context):
         """
         Ensures user is in a vc
@@ -476,8 +1107,10 @@ class PlexMusic(commands.Cog):
         """
 
         try:
-            user = MyPlexAccount(username=plex_email, password=password)
-        except plexapi.exceptions.Unauthorized:
+            user = await self.plex_executors.get(PLEX_TV).run(
+                MyPlexAccount, username=plex_email, password=password
+            )
+        except (plexapi.exceptions.Unauthorized, PlexTimeoutError):
             await ctx.send("Unable to complete authorization, please try again.")
             await ctx.send_help()
             return
@@ -485,6 +1118,8 @@ class PlexMusic(commands.Cog):
             user_data["username"] = user.email
             user_data["token"] = user.authenticationToken
             user_data["url"] = server_url
+        self._forget_user(ctx.author.id)
+        self.credentials.set(ctx.author.id, Credentials(server_url, user.authenticationToken))
         await ctx.send(
             "Successfully authenticated as {user.email} ({user.username}).".format(user=user)
         )
@@ -496,8 +1131,32 @@ class PlexMusic(commands.Cog):
         The bot will use the Global Plex server if provided by the bot owner.
         """
         await self.config.user(ctx.author).clear()
+        self._forget_user(ctx.author.id)
+        self.credentials.set(ctx.author.id, None)
         await ctx.send("Cleared any and all user identifiable information.")
 
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_guild=True)
+    @command_config.command(name="profile")
+    async def command_config_profile(self, ctx: commands.Context, profile: str = None):
+        """Set the bitrate the Plex server streams at in this server.
+
+        `auto` follows the bitrate of the voice channel, the other profiles
+        use a fixed bitrate. Lower bitrates make Plex transcode lossless
+        tracks instead of sending them at several Mbit/s.
+        """
+        current = self.stream_profiles.get(ctx.guild.id, DEFAULT_PROFILE)
+        if profile is None or (profile := profile.lower()) not in PROFILES:
+            lines = [
+                f"{'*' if name == current else ' '} {name:<7} {p.description}"
+                for name, p in PROFILES.items()
+            ]
+            await ctx.send(box("\n".join(lines)))
+            return
+        await self.config.guild(ctx.guild).stream_profile.set(profile)
+        self.stream_profiles[ctx.guild.id] = profile
+        await ctx.send(f"Stream profile set to {profile}, it applies from the next track.")
+
     @commands.is_owner()
     @commands.dm_only()
     @command_config.group(name="global")
@@ -519,8 +1178,10 @@ class PlexMusic(commands.Cog):
         For example if my password is "password" I would enter "password123456"
         """
         try:
-            user = MyPlexAccount(username=plex_email, password=password)
-        except plexapi.exceptions.Unauthorized:
+            user = await self.plex_executors.get(PLEX_TV).run(
+                MyPlexAccount, username=plex_email, password=password
+            )
+        except (plexapi.exceptions.Unauthorized, PlexTimeoutError):
             await ctx.send("Unable to complete authorization, please try again.")
             await ctx.send_help()
             return
@@ -542,8 +1203,135 @@ class PlexMusic(commands.Cog):
         """
         await self.config.lyricsgenius.set(token)
         await ctx.send(f"Token set to: {token}")
-        await self._lyrics_genius_init(token)  # FIXME: Blocking call
+        await self._lyrics_genius_init(token)
 
+    @command_config_global.command(name="poolsize")
+    async def command_config_global_poolsize(self, ctx: commands.Context, size: int):
+        """Set how many concurrent requests the bot makes to each Plex server.
+
+        This is the size of both the thread pool and the keep-alive connection pool
+        of every Plex server, it applies to connections made after the cog is reloaded.
+        """
+        if not 1 <= size <= 32:
+            await ctx.send("The pool size must be between 1 and 32.")
+            return
+        await self.config.pool_size.set(size)
+        await ctx.send(f"Pool size set to {size}, reload the cog to apply it.")
+
+    @command_config_global.command(name="audioworkers")
+    async def command_config_global_audioworkers(self, ctx: commands.Context, processes: int):
+        """Set how many processes encode the audio of `pcm` streams, 0 to encode in the bot.
+
+        Without workers every `pcm` stream is encoded by the bot's own process,
+        which can only use a single core. Workers spread them over several cores,
+        one per core is a good start. It applies after the cog is reloaded.
+        """
+        limit = (os.cpu_count() or 1) * 2
+        if not 0 <= processes <= limit:
+            await ctx.send(f"The number of workers must be between 0 and {limit}.")
+            return
+        await self.config.audio_workers.set(processes)
+        await ctx.send(f"Audio workers set to {processes}, reload the cog to apply it.")
+
+    @command_config_global.command(name="streammode")
+    async def command_config_global_streammode(self, ctx: commands.Context, mode: str):
+        """Set how tracks are streamed to voice channels, `opus` or `pcm`.
+
+        `opus` has Plex send Opus which is passed to Discord as is, tracks that
+        are already Opus are not transcoded at all. Servers that can't transcode
+        to Opus automatically use `pcm`, where the bot encodes the audio itself.
+        """
+        if (mode := mode.lower()) not in MODES:
+            await ctx.send(f"The stream mode must be one of: {', '.join(MODES)}.")
+            return
+        await self.config.stream_mode.set(mode)
+        self.stream_mode = mode
+        await ctx.send(f"Stream mode set to {mode}, it applies from the next track.")
+
+    @command_config_global.command(name="stallthreshold")
+    async def command_config_global_stallthreshold(self, ctx: commands.Context, ms: int):
+        """Set after how many milliseconds a blocked event loop is logged with its stack."""
+        if ms < 100:
+            await ctx.send("The threshold must be at least 100 ms.")
+            return
+        await self.config.stall_threshold.set(ms)
+        self.loop_monitor.stall_threshold = ms / 1000
+        await ctx.send(f"Event loop stalls longer than {ms} ms will be logged.")
+
+    @command_config_global.command(name="searchbudget")
+    async def command_config_global_searchbudget(self, ctx: commands.Context, ms: int):
+        """Set how many milliseconds searches wait for each Plex library.
+
+        Libraries that take longer are left out of the results, unless no
+        other library found anything.
+        """
+        if ms < 100:
+            await ctx.send("The search budget must be at least 100 ms.")
+            return
+        await self.config.search_budget.set(ms)
+        self.federated.budget = ms / 1000
+        await ctx.send(f"Searches now wait up to {ms} ms for each library.")
+
+    @command_config_global.command(name="readahead")
+    async def command_config_global_readahead(self, ctx: commands.Context, seconds: int):
+        """Set how many seconds of audio are downloaded ahead of playback, 0 to disable it.
+
+        The buffer absorbs stalls of the Plex server or its connection, and
+        dropped connections are resumed where they stopped. It's used by
+        `opus` streams, without it FFmpeg reads from Plex directly. It applies
+        from the next track on.
+        """
+        if not 0 <= seconds <= MAX_READ_AHEAD:
+            await ctx.send(f"The read-ahead must be between 0 and {MAX_READ_AHEAD} seconds.")
+            return
+        await self.config.read_ahead.set(seconds)
+        self.streams.read_ahead = seconds
+        await ctx.send(f"Read-ahead set to {seconds} seconds.")
+
+    @command_config_global.group(name="servers")
+    async def command_config_global_servers(self, ctx: commands.Context):
+        """Plex servers searched alongside the global one, with the global auth."""
+
+    @command_config_global_servers.command(name="add")
+    async def command_config_global_servers_add(self, ctx: commands.Context, server_url: str):
+        """Search the music libraries of another Plex server too."""
+        if not (token := await self.config.token()):
+            await ctx.send("Set up the global Plex auth first.")
+            return
+        server_url = server_url.rstrip("/")
+        if not await self._connect_extra_server(server_url, token):
+            await ctx.send("Unable to connect to that server with the global Plex auth.")
+            return
+        async with self.config.servers() as servers:
+            if server_url not in servers:
+                servers.append(server_url)
+        await ctx.send(f"Now also searching {self.extra_servers[server_url].name}.")
+
+    @command_config_global_servers.command(name="remove")
+    async def command_config_global_servers_remove(self, ctx: commands.Context, server_url: str):
+        """Stop searching a Plex server added with `servers add`."""
+        server_url = server_url.rstrip("/")
+        async with self.config.servers() as servers:
+            if server_url not in servers:
+                await ctx.send("That server isn't searched.")
+                return
+            servers.remove(server_url)
+        self.extra_servers.pop(server_url, None)
+        await ctx.send(f"No longer searching {server_url}.")
+
+    @command_config_global_servers.command(name="list")
+    async def command_config_global_servers_list(self, ctx: commands.Context):
+        """The Plex servers searched alongside the global one."""
+        if not (urls := await self.config.servers()):
+            await ctx.send("Only the global Plex server is searched.")
+            return
+        lines = []
+        for url in urls:
+            server = self.extra_servers.get(url)
+            lines.append(f"{url} ({server.name if server else 'offline'})")
+        await ctx.send(box("\n".join(lines)))
+
+    @requires("plex", "queues", "workers")
     @commands.guild_only()
     @commands.command()
     async def play(self, ctx: commands.Context, title: str, artists: str = None):
@@ -555,15 +1343,18 @@ class PlexMusic(commands.Cog):
             title: Title of song to play
             artists: The singers name
         """
+        requested_at = time.perf_counter()
         # Save the context to use with async callbacks
         self.ctx_cache[ctx.guild.id] = ctx
 
         try:
-            track = self._search_tracks(ctx, title, artists)  # FIXME: Blocking call
-        except MediaNotFoundError:
-            await ctx.send(f"Can't find song: {title}")
+            result = await self._search_tracks(ctx, title, artists)
+        except (MediaNotFoundError, PlexTimeoutError):
+            await self._send_not_found(ctx, "track", "song", title)
             log.debug("Failed to play, can't find song - %s", title)
             return
+        track = result.item
+        await self._note_slow_sources(ctx, result)
 
         try:
             await self._validate(ctx)
@@ -573,15 +1364,18 @@ class PlexMusic(commands.Cog):
         # Specific add to queue message
         if self.voice_channel[ctx.guild.id].is_playing():
             log.debug("Added to queue - %s", title)
-            embed, img = await self._build_embed_track(
-                track, type_="queue"
-            )  # FIXME: Blocking call
+            embed, img = await self._build_embed_track(track, type_="queue")
             if embed:
-                await ctx.send(embed=embed, file=img)
+                await self._send_card(ctx, embed, img)
 
         # Add the song to the async queue
-        await self.play_queue[ctx.guild.id].put(track)
+        player = self.players.start(ctx.guild.id)
+        entry = QueueEntry.from_track(track, ctx.author.id)
+        if player.idle:
+            player.expect(entry, requested_at)
+        await player.queue.put(entry)
 
+    @requires("plex", "queues", "workers")
     @commands.guild_only()
     @commands.command()
     async def album(self, ctx: commands.Context, *, title: str):
@@ -592,15 +1386,18 @@ class PlexMusic(commands.Cog):
         Arguments:
             title: Title of albumb to play
         """
+        requested_at = time.perf_counter()
         # Save the context to use with async callbacks
         self.ctx_cache[ctx.guild.id] = ctx
 
         try:
-            album = self._search_albums(ctx, title)  # FIXME: Blocking call
-        except MediaNotFoundError:
-            await ctx.send(f"Can't find album: {title}")
+            result = await self._search_albums(ctx, title)
+        except (MediaNotFoundError, PlexTimeoutError):
+            await self._send_not_found(ctx, "album", "album", title)
             log.debug("Failed to queue album, can't find - %s", title)
             return
+        album = result.item
+        await self._note_slow_sources(ctx, result)
 
         try:
             await self._validate(ctx)
@@ -608,12 +1405,12 @@ class PlexMusic(commands.Cog):
             return await ctx.send("First join a voice channel.")
 
         log.debug("Added to queue - %s", title)
-        embed, img = await self._build_embed_album(album)  # FIXME: Blocking call
+        embed, img = await self._build_embed_album(album)
         if embed:
-            await ctx.send(embed=embed, file=img)
-        for track in album.tracks():
-            await self.play_queue[ctx.guild.id].put(track)
+            await self._send_card(ctx, embed, img)
+        await self._queue_container(ctx, album, requested_at)
 
+    @requires("plex", "queues", "workers")
     @commands.guild_only()
     @commands.command()
     async def playlist(self, ctx: commands.Context, *, title: str):
@@ -625,13 +1422,16 @@ class PlexMusic(commands.Cog):
         Arguments:
             title: Title of playlist to play
         """
+        requested_at = time.perf_counter()
 
         try:
-            playlist = await self._search_playlists(ctx, title)  # FIXME: Blocking call
-        except MediaNotFoundError:
-            await ctx.send(f"Can't find playlist: {title}")
+            result = await self._search_playlists(ctx, title)
+        except (MediaNotFoundError, PlexTimeoutError):
+            await self._send_not_found(ctx, "playlist", "playlist", title)
             log.debug("Failed to queue playlist, can't find - %s", title)
             return
+        playlist = result.item
+        await self._note_slow_sources(ctx, result)
 
         try:
             await self._validate(ctx)
@@ -639,14 +1439,13 @@ class PlexMusic(commands.Cog):
             return
 
         log.debug("Added to queue - %s", title)
-        embed, img = await self._build_embed_playlist(ctx, playlist)  # FIXME: Blocking call
+        embed, img = await self._build_embed_playlist(ctx, playlist)
         if embed:
-            await ctx.send(embed=embed, file=img)
+            await self._send_card(ctx, embed, img)
 
-        for item in playlist.items():
-            if item.TYPE == "track":
-                await self.play_queue[ctx.guild.id].put(item)
+        await self._queue_container(ctx, playlist, requested_at)
 
+    @requires()
     @commands.guild_only()
     @commands.command()
     async def stop(self, ctx: commands.Context):
@@ -655,12 +1454,14 @@ class PlexMusic(commands.Cog):
         Stops playback and disconnects from vc.
         """
         if vc := self.voice_channel.get(ctx.guild.id):
+            self.players.stop(ctx.guild.id)
             vc.stop()
             await vc.disconnect()
             self.voice_channel[ctx.guild.id] = None
             log.debug("Stopped")
             await ctx.send(":stop_button: Stopped")
 
+    @requires()
     @commands.guild_only()
     @commands.command()
     async def pause(self, ctx: commands.Context):
@@ -671,9 +1472,11 @@ class PlexMusic(commands.Cog):
         """
         if vc := self.voice_channel.get(ctx.guild.id):
             vc.pause()
+            self._paused_at.setdefault(ctx.guild.id, time.monotonic())
             log.debug("Paused")
             await ctx.send(":play_pause: Paused")
 
+    @requires()
     @commands.guild_only()
     @commands.command()
     async def resume(self, ctx: commands.Context):
@@ -688,9 +1491,13 @@ class PlexMusic(commands.Cog):
         """
         if vc := self.voice_channel.get(ctx.guild.id):
             vc.resume()
+            paused_at = self._paused_at.pop(ctx.guild.id, None)
+            if paused_at is not None and ctx.guild.id in self.playback_started:
+                self.playback_started[ctx.guild.id] += time.monotonic() - paused_at
             log.debug("Resumed")
             await ctx.send(":play_pause: Resumed")
 
+    @requires()
     @commands.guild_only()
     @commands.command()
     async def skip(self, ctx: commands.Context):
@@ -704,35 +1511,110 @@ class PlexMusic(commands.Cog):
             log.debug("Skipped")
             self._toggle_next(ctx.guild.id)
 
+    @requires()
     @commands.guild_only()
     @commands.command(name="np")
     async def now_playing(self, ctx: commands.Context):
         """
         User command to get currently playing song.
-        Deletes old `now playing` status message,
-        Creates a new one with up to date information.
+        Moves the `now playing` status message to the bottom
+        of the channel with up to date information.
         """
-        if track := self.current_track.get(ctx.guild.id):
-            embed, img = await self._build_embed_track(track)  # FIXME: Blocking call
-            if not embed:
-                return
+        if self.current_track.get(ctx.guild.id):
             log.debug("Now playing")
-            if np_message_id := self.np_message_id.get(ctx.guild.id):
-                await np_message_id.delete()
-                log.debug("Deleted old np status")
-            log.debug("Created np status")
-            self.np_message_id[ctx.guild.id] = await ctx.send(embed=embed, file=img)
+            message = self.now_playing.messages.get(ctx.guild.id)
+            repost = True
+            if message is not None and message.channel.id == ctx.channel.id:
+                # Only the command came after it, so it's still in view and editing is enough.
+                with contextlib.suppress(discord.HTTPException):
+                    previous = await ctx.channel.history(limit=1, before=ctx.message).flatten()
+                    repost = not previous or previous[0].id != message.id
+            await self.now_playing.update(
+                ctx.guild.id,
+                functools.partial(self._render_now_playing, ctx.guild.id),
+                ctx,
+                repost=repost,
+            )
 
+    @requires("queues")
     @commands.guild_only()
     @commands.command()
     async def clear(self, ctx: commands.Context):
         """
         User command to clear play queue.
         """
-        self.play_queue[ctx.guild.id] = asyncio.Queue()
+        self.players.get(ctx.guild.id).clear()
         log.debug("Cleared queue")
         await ctx.send(":boom: Queue cleared.")
 
+    @requires("queues")
+    @commands.guild_only()
+    @commands.command(name="queue")
+    async def command_queue(self, ctx: commands.Context, page: int = 1):
+        """
+        User command to list the play queue.
+        Arguments:
+            page: Page of the queue to show
+        """
+        queue = self.players.get(ctx.guild.id).queue
+        if queue.empty():
+            await ctx.send("The queue is empty.")
+            return
+        pages = -(-len(queue) // QUEUE_PAGE_SIZE)
+        page = min(max(page, 1), pages)
+        lines = []
+        for position, entry in queue.page(page - 1, QUEUE_PAGE_SIZE):
+            minutes, seconds = divmod(entry.duration // 1000, 60)
+            lines.append(f"{position + 1:>4}. {entry.title} ({minutes}:{seconds:02})")
+        lines.append(f"\nPage {page}/{pages} - {len(queue)} tracks")
+        await ctx.send(box("\n".join(lines)))
+
+    @requires("queues")
+    @commands.guild_only()
+    @commands.command()
+    async def shuffle(self, ctx: commands.Context):
+        """
+        User command to shuffle the play queue.
+        """
+        self.players.get(ctx.guild.id).queue.shuffle()
+        log.debug("Shuffled queue")
+        await ctx.send(":twisted_rightwards_arrows: Queue shuffled.")
+
+    @requires("queues")
+    @commands.guild_only()
+    @commands.command()
+    async def remove(self, ctx: commands.Context, position: int):
+        """
+        User command to remove a track from the play queue.
+        Arguments:
+            position: Position of the track in the queue
+        """
+        try:
+            entry = self.players.get(ctx.guild.id).queue.pop(position - 1)
+        except IndexError:
+            await ctx.send(f"There is no track at position {position}.")
+            return
+        await ctx.send(f"Removed {entry.title} from the queue.")
+
+    @requires("queues")
+    @commands.guild_only()
+    @commands.command()
+    async def move(self, ctx: commands.Context, position: int, new_position: int):
+        """
+        User command to move a track to another position in the play queue.
+        Arguments:
+            position: Current position of the track in the queue
+            new_position: Position to move the track to
+        """
+        queue = self.players.get(ctx.guild.id).queue
+        if not 1 <= position <= len(queue):
+            await ctx.send(f"There is no track at position {position}.")
+            return
+        new_position = min(max(new_position, 1), len(queue))
+        queue.move(position - 1, new_position - 1)
+        await ctx.send(f"Moved {queue[new_position - 1].title} to position {new_position}.")
+
+    @requires("lyrics")
     @commands.check(check_if_lyrics_is_enabled)
     @commands.guild_only()
     @commands.command()
@@ -742,21 +1624,17 @@ class PlexMusic(commands.Cog):
             await ctx.send("No song currently playing.")
             return
 
-        if self.genius:
-            await ctx.send(
-                f"Searching for {track.title}, {track.artist().title}."
-            )  # FIXME: Blocking call
+        if self.lyrics_provider.enabled:
+            _, artist = await self.metadata.track_titles(track)
+            await ctx.send(f"Searching for {track.title}, {artist}.")
             try:
-                song = self.genius.search_song(
-                    track.title, track.artist().title
-                )  # FIXME: Blocking call
+                lyrics = await self.lyrics_provider.get(track, artist)
             except TypeError:
-                self.genius = None
+                await self.lyrics_provider.set_token(None)
                 await ctx.send(f"Lyrics extension is currently disabled.")
                 return
 
             try:
-                lyrics = song.lyrics
                 # Split into 1950 char chunks
                 # Discord max message length is 2000
                 lines = [(lyrics[i : i + 1950]) for i in range(0, len(lyrics), 1950)]
@@ -772,3 +1650,297 @@ class PlexMusic(commands.Cog):
                 await ctx.send("Can't find lyrics for this song.")
         else:
             await ctx.send(f"Lyrics extension is currently disabled.")
+
+    @requires()
+    @commands.is_owner()
+    @commands.group(name="plexstats")
+    async def command_plexstats(self, ctx: commands.Context):
+        """Performance statistics of the cog."""
+
+    @command_plexstats.command(name="gaps")
+    async def command_plexstats_gaps(self, ctx: commands.Context):
+        """Silence between the end of a track and the start of the next one."""
+        if not (stats := self.players.gap_stats()):
+            await ctx.send("No track transitions recorded yet.")
+            return
+        await ctx.send(
+            box(
+                f"Transitions: {stats['samples']}\n"
+                f"Median gap:  {stats['median'] * 1000:.1f} ms\n"
+                f"95th pct:    {stats['p95'] * 1000:.1f} ms\n"
+                f"Max gap:     {stats['max'] * 1000:.1f} ms"
+            )
+        )
+
+    @command_plexstats.command(name="streams")
+    async def command_plexstats_streams(self, ctx: commands.Context):
+        """How many tracks were streamed with each method and profile."""
+        if not self.streams.streams:
+            await ctx.send("No tracks streamed yet.")
+            return
+        counts = {
+            **self.streams.streams,
+            **{f"profile {k}": v for k, v in self.streams.profiles.items()},
+        }
+        if self.streams.workers is not None:
+            counts.update({f"worker {k}": v for k, v in self.streams.workers.stats.items()})
+            counts["worker load"] = " ".join(map(str, self.streams.workers.load()))
+        await ctx.send(box("\n".join(f"{kind:<15} {count}" for kind, count in counts.items())))
+
+    @command_plexstats.command(name="buffers")
+    async def command_plexstats_buffers(self, ctx: commands.Context):
+        """Read-ahead buffer of the track playing in each guild, and its underruns."""
+        # Guilds that only streamed without the buffer have no counts.
+        if not (guilds := {g: stats for g, stats in self.read_ahead_stats.items() if stats}):
+            await ctx.send("No tracks streamed through the read-ahead buffer yet.")
+            return
+        lines = [f"{'guild':<20} {'fill':>5} {'ahead':>7} {'underruns':>9} {'reconnects':>10}"]
+        for guild_id, stats in guilds.items():
+            guild = self.bot.get_guild(guild_id)
+            name = guild.name if guild else str(guild_id)
+            if stream := self.read_ahead.get(guild_id):
+                fill, ahead = f"{stream.fill:.0%}", f"{stream.seconds:.1f}s"
+            else:
+                fill, ahead = "-", "-"
+            lines.append(
+                f"{name[:20]:<20} {fill:>5} {ahead:>7} "
+                f"{stats['underruns']:>9} {stats['reconnects']:>10}"
+                + (f" ({stats['failed']} failed)" if stats["failed"] else "")
+            )
+        await ctx.send(box("\n".join(lines)))
+
+    @command_plexstats.command(name="scheduler")
+    async def command_plexstats_scheduler(self, ctx: commands.Context):
+        """Requests waiting for each Plex server, and how long requests waited by priority."""
+        executors = self.plex_executors.executors
+        if not executors:
+            await ctx.send("No requests made to Plex yet.")
+            return
+        priorities = " ".join(f"{p.name.lower()[:5]:>5}" for p in Priority)
+        lines = [f"{'server':<32} {'active':>7}  waiting {priorities}"]
+        requests, waited = Counter(), Counter()
+        for executor in executors:
+            scheduler = executor.scheduler
+            waiting = " ".join(f"{count:>5}" for count in scheduler.waiting().values())
+            lines.append(
+                f"{executor.name[-32:]:<32} {scheduler.active:>3}/{scheduler.limit:<3}"
+                f"{'':>10}{waiting}"
+            )
+            requests.update(scheduler.requests)
+            waited.update(scheduler.waited)
+        if series := self.metrics.summary("plex_wait_seconds"):
+            lines.append("")
+            lines.append(
+                f"{'waited for a slot':<20} {'count':>7} {'p50':>8} {'p95':>8} {'max':>8}"
+            )
+            for name, histogram in series:
+                p50, p95 = histogram.quantile(0.5) * 1000, histogram.quantile(0.95) * 1000
+                lines.append(
+                    f"{name:<20} {histogram.count:>7} "
+                    f"{p50:>6g}ms {p95:>6g}ms {histogram.max * 1000:>6.0f}ms"
+                )
+        if requests:
+            lines.append("")
+            lines.append(f"{'guild':<20} {'requests':>9} {'mean wait':>10}")
+            for guild_id, count in requests.most_common(10):
+                guild = self.bot.get_guild(guild_id) if guild_id else None
+                name = guild.name if guild else str(guild_id or "bot")
+                lines.append(
+                    f"{name[:20]:<20} {count:>9} {waited[guild_id] / count * 1000:>8.1f}ms"
+                )
+        await ctx.send(box("\n".join(lines)))
+
+    @command_plexstats.command(name="searches")
+    async def command_plexstats_searches(self, ctx: commands.Context):
+        """Shared lookups, partial results and libraries missing the search budget."""
+        stats = self.searches.stats
+        await ctx.send(
+            box(
+                f"Plex lookups:     {stats['calls']}\n"
+                f"Joined in-flight: {stats['shared']}\n"
+                f"From memo:        {stats['memo']}\n"
+                f"Failed lookups:   {stats['errors']}\n"
+                f"Hit ratio:        {self.searches.hit_ratio:.1%}\n"
+                f"Searches:         {self.federated.stats['searches']}\n"
+                f"Partial results:  {self.federated.stats['partial']}"
+            )
+        )
+        if slow := self.federated.slow_sources.most_common(10):
+            lines = [f"{count:>6} {name}" for name, count in slow]
+            await ctx.send(box("Missed the search budget:\n" + "\n".join(lines)))
+
+    @command_plexstats.command(name="nowplaying")
+    async def command_plexstats_nowplaying(self, ctx: commands.Context):
+        """API calls and uploads spent on now playing messages."""
+        stats = self.now_playing.stats
+        await ctx.send(
+            box(
+                f"Updates scheduled: {stats['scheduled']}\n"
+                f"Merged:            {stats['merged']}\n"
+                f"Edited in place:   {stats['edits']}\n"
+                f"Sent:              {stats['sends']}\n"
+                f"Art uploads:       {stats['uploads']}\n"
+                f"Deleted:           {stats['deletes']}"
+            )
+        )
+
+    @command_plexstats.command(name="firstaudio")
+    async def command_plexstats_firstaudio(self, ctx: commands.Context):
+        """Time from a play, album or playlist command until its first track starts."""
+        if not (stats := self.players.first_audio_stats()):
+            await ctx.send("No requests recorded yet.")
+            return
+        await ctx.send(
+            box(
+                f"Requests:    {stats['samples']}\n"
+                f"Median:      {stats['median'] * 1000:.1f} ms\n"
+                f"95th pct:    {stats['p95'] * 1000:.1f} ms\n"
+                f"Max:         {stats['max'] * 1000:.1f} ms"
+            )
+        )
+
+    @command_plexstats.command(name="loop")
+    async def command_plexstats_loop(self, ctx: commands.Context):
+        """Event loop lag and how often the loop was blocked."""
+        if not (series := self.metrics.summary("loop_lag_seconds")):
+            await ctx.send("No loop lag recorded yet.")
+            return
+        histogram = series[0][1]
+        await ctx.send(
+            box(
+                f"Samples:     {histogram.count}\n"
+                f"Median lag:  <{histogram.quantile(0.5) * 1000:g} ms\n"
+                f"99th pct:    <{histogram.quantile(0.99) * 1000:g} ms\n"
+                f"Max lag:     {histogram.max * 1000:.1f} ms\n"
+                f"Stalls:      {self.loop_monitor.stalls} "
+                f"(>{self.loop_monitor.stall_threshold * 1000:g} ms)"
+            )
+        )
+
+    @command_plexstats.command(name="latency")
+    async def command_plexstats_latency(self, ctx: commands.Context):
+        """Latency of commands, Plex calls and embeds."""
+        lines = []
+        for metric, title in (
+            ("command_seconds", "Commands"),
+            ("plex_call_seconds", "Plex calls"),
+            ("embed_seconds", "Embeds"),
+        ):
+            if not (series := self.metrics.summary(metric)):
+                continue
+            lines.append(f"{title:<32} {'count':>7} {'p50':>8} {'p95':>8} {'max':>8}")
+            for name, histogram in series:
+                p50, p95 = histogram.quantile(0.5) * 1000, histogram.quantile(0.95) * 1000
+                lines.append(
+                    f"{name[:32]:<32} {histogram.count:>7} "
+                    f"{p50:>6g}ms {p95:>6g}ms {histogram.max * 1000:>6.0f}ms"
+                )
+            lines.append("")
+        if not lines:
+            await ctx.send("No latencies recorded yet.")
+            return
+        await ctx.send(box("\n".join(lines)))
+
+    @command_plexstats.command(name="startup")
+    async def command_plexstats_startup(self, ctx: commands.Context):
+        """How long the cog took to import and each of its subsystems to start."""
+        lines = []
+        if (import_seconds := self.startup.import_seconds) is not None:
+            lines.append(f"{'import':<10} {import_seconds * 1000:>9.0f} ms")
+        lines.append(f"{'subsystem':<10} {'ready after':>12} {'took':>9}")
+        timings = {timing.name: timing for timing in self.startup.timings()}
+        for name in self.startup.names:
+            if (timing := timings.get(name)) is None:
+                lines.append(f"{name:<10} {'starting':>12}")
+                continue
+            lines.append(
+                f"{name:<10} {timing.ready * 1000:>9.0f} ms {timing.took * 1000:>6.0f} ms"
+                + (" (failed)" if timing.failed else "")
+            )
+        await ctx.send(box("\n".join(lines)))
+
+    @command_plexstats.command(name="prometheus")
+    async def command_plexstats_prometheus(self, ctx: commands.Context):
+        """Every histogram in the Prometheus text format."""
+        await ctx.send(
+            file=discord.File(
+                io.BytesIO(self.metrics.prometheus().encode()), filename="plexmusic.prom"
+            )
+        )
+
+    @requires("storage")
+    @commands.is_owner()
+    @commands.group(name="plexcache")
+    async def command_plexcache(self, ctx: commands.Context):
+        """Local cache of the audio of frequently played tracks."""
+
+    @command_plexcache.command(name="stats")
+    async def command_plexcache_stats(self, ctx: commands.Context):
+        """Size, hit ratio and bandwidth saved by the audio cache."""
+        cache = self.audio_cache
+        count, size = await cache.usage()
+        await ctx.send(
+            box(
+                f"Cached tracks:  {count}\n"
+                f"Size:           {size / MB:.0f} / {cache.budget / MB:.0f} MB\n"
+                f"Admitted after: {cache.admit_after} plays\n"
+                f"Hits:           {cache.stats['hits']}\n"
+                f"Misses:         {cache.stats['misses']}\n"
+                f"Hit ratio:      {cache.hit_ratio:.1%}\n"
+                f"Saved:          {cache.stats['bytes_saved'] / MB:.0f} MB\n"
+                f"Downloaded:     {cache.stats['bytes_downloaded'] / MB:.0f} MB\n"
+                f"Evicted:        {cache.stats['evicted']}"
+            )
+        )
+        if top := await cache.top(10):
+            lines = [f"{t.plays:>6} {t.size / MB:>6.1f} MB  {t.key}" for t in top]
+            await ctx.send(box("Most played:\n" + "\n".join(lines)))
+
+    @command_plexcache.command(name="size")
+    async def command_plexcache_size(self, ctx: commands.Context, megabytes: int):
+        """Set how much disk space the audio cache may use, 0 disables it."""
+        if megabytes < 0:
+            await ctx.send("The size can't be negative.")
+            return
+        await self.config.audio_cache_size.set(megabytes)
+        await self.audio_cache.resize(megabytes * MB)
+        await ctx.send(f"Audio cache size set to {megabytes} MB.")
+
+    @command_plexcache.command(name="admit")
+    async def command_plexcache_admit(self, ctx: commands.Context, plays: int):
+        """Set after how many plays a track is cached."""
+        if plays < 1:
+            await ctx.send("Tracks must be played at least once to be cached.")
+            return
+        await self.config.audio_cache_admit.set(plays)
+        self.audio_cache.admit_after = plays
+        await ctx.send(f"Tracks are cached once they were played {plays} times.")
+
+    @requires("storage", "plex")
+    @command_plexcache.command(name="prewarm")
+    async def command_plexcache_prewarm(self, ctx: commands.Context, *, playlist: str):
+        """Cache every track of a playlist right away."""
+        if self.audio_cache.budget <= 0:
+            await ctx.send("The audio cache is disabled.")
+            return
+        try:
+            result = await self._search_playlists(ctx, playlist)
+        except (MediaNotFoundError, PlexTimeoutError):
+            await self._send_not_found(ctx, "playlist", "playlist", playlist)
+            return
+        tracks = [
+            item
+            async for page in iter_pages(self.plex_executors, result.item)
+            for item in page
+            if item.TYPE == "track"
+        ]
+        await ctx.send(f"Caching {len(tracks)} tracks of {result.item.title}...")
+        async with ctx.typing():
+            cached = await self.audio_cache.prewarm(tracks)
+        await ctx.send(f"{cached} of {len(tracks)} tracks of {result.item.title} are cached.")
+
+    @command_plexcache.command(name="clear")
+    async def command_plexcache_clear(self, ctx: commands.Context):
+        """Delete every cached track, play counts are kept."""
+        await self.audio_cache.clear()
+        await ctx.send("Audio cache cleared.")
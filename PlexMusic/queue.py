@@ -0,0 +1,256 @@
+import asyncio
+import random
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+import plexapi.audio
+
+# Entries are kept in chunks of about this size, so inserting or removing
+# anywhere only shifts the entries of a single chunk.
+CHUNK_SIZE = 256
+
+
+class QueueEntry:
+    """What the queue remembers of a track until it's about to be played.
+
+    A `plexapi.audio.Track` keeps its whole XML element, its media and
+    parts around, an entry only keeps the keys needed to fetch it again.
+    """
+
+    __slots__ = (
+        "server",
+        "rating_key",
+        "duration",
+        "parent_key",
+        "grandparent_key",
+        "title",
+        "requester",
+        "offset",
+    )
+
+    def __init__(
+        self,
+        server,
+        rating_key: int,
+        duration: int,
+        parent_key: Optional[int],
+        grandparent_key: Optional[int],
+        title: str,
+        requester: Optional[int] = None,
+        offset: int = 0,
+    ):
+        self.server = server
+        self.rating_key = rating_key
+        self.duration = duration
+        self.parent_key = parent_key
+        self.grandparent_key = grandparent_key
+        self.title = title
+        self.requester = requester
+        # Milliseconds into the track to start at, set for tracks resumed after a restart.
+        self.offset = offset
+
+    @classmethod
+    def from_track(cls, track: plexapi.audio.Track, requester: Optional[int] = None):
+        return cls(
+            track._server,
+            int(track.ratingKey),
+            track.duration or 0,
+            track.parentRatingKey,
+            track.grandparentRatingKey,
+            track.title,
+            requester,
+        )
+
+    def __repr__(self):
+        return f"<QueueEntry {self.rating_key}:{self.title}>"
+
+
+class PreparedTrack(NamedTuple):
+    track: plexapi.audio.Track
+    source: Any
+
+
+class PlayQueue:
+    """Indexable FIFO of queue entries, a drop-in for the `asyncio.Queue` API the player uses.
+
+    Entries live in a list of chunks, whose lengths are kept in a Fenwick
+    tree. Finding a position, inserting and removing anywhere, taking from
+    the front included, touch a single chunk and O(log n) nodes of the tree.
+    Chunks that empty out stay in place until they are half of all chunks,
+    and a chunk grown to twice `CHUNK_SIZE` is split, both rebuild the tree
+    which is rare enough to stay cheap on average.
+
+    `taken` counts the entries taken from the front and `version` every
+    other change, so snapshots can tell when the rest of the queue is intact.
+    """
+
+    def __init__(self):
+        self._chunks: List[List[Any]] = []
+        # Fenwick tree of the chunk lengths, node i covers the chunks before it
+        # down to `i - (i & -i)`, node 0 is unused.
+        self._tree: List[int] = [0]
+        self._empty = 0
+        self._len = 0
+        self._not_empty = asyncio.Event()
+        self.taken = 0
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __getitem__(self, position: int):
+        i, offset = self._locate(position)
+        return self._chunks[i][offset]
+
+    def qsize(self) -> int:
+        return self._len
+
+    def empty(self) -> bool:
+        return not self._len
+
+    def put_nowait(self, entry):
+        self.append(entry)
+
+    async def put(self, entry):
+        self.append(entry)
+
+    def get_nowait(self):
+        if not self._len:
+            raise asyncio.QueueEmpty
+        return self.popleft()
+
+    async def get(self):
+        while not self._len:
+            await self._not_empty.wait()
+        return self.popleft()
+
+    def append(self, entry):
+        if self._chunks and len(self._chunks[-1]) < CHUNK_SIZE:
+            if not self._chunks[-1]:
+                self._empty -= 1
+            self._chunks[-1].append(entry)
+            self._add(len(self._chunks) - 1, 1)
+        else:
+            self._chunks.append([entry])
+            # A new last node covers its own chunk and the ones before it down to its lowest bit.
+            node = len(self._chunks)
+            self._tree.append(1 + self._prefix(node - 1) - self._prefix(node - (node & -node)))
+        self._len += 1
+        self.version += 1
+        self._not_empty.set()
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty queue")
+        i, offset = self._locate(0)
+        entry = self._chunks[i].pop(offset)
+        self.taken += 1
+        self._removed(i)
+        return entry
+
+    def insert(self, position: int, entry):
+        position = max(position, 0)
+        if position >= self._len:
+            self.append(entry)
+            return
+        i, offset = self._locate(position)
+        chunk = self._chunks[i]
+        chunk.insert(offset, entry)
+        self._add(i, 1)
+        self._len += 1
+        self.version += 1
+        if len(chunk) > 2 * CHUNK_SIZE:
+            self._chunks[i : i + 1] = [chunk[:CHUNK_SIZE], chunk[CHUNK_SIZE:]]
+            self._reindex()
+
+    def pop(self, position: int = 0):
+        """Remove and return the entry at `position`, 0 being the next one to play."""
+        if position == 0:
+            return self.popleft()
+        i, offset = self._locate(position)
+        entry = self._chunks[i].pop(offset)
+        self.version += 1
+        self._removed(i)
+        return entry
+
+    def move(self, source: int, destination: int):
+        self.insert(destination, self.pop(source))
+
+    def shuffle(self):
+        entries = list(self)
+        random.shuffle(entries)
+        self._rebuild(entries)
+
+    def clear(self):
+        self._rebuild([])
+
+    def page(self, page: int, per_page: int) -> List[Tuple[int, Any]]:
+        """The (position, entry) pairs on a page of the queue, pages start at 0."""
+        start = page * per_page
+        if not 0 <= start < self._len:
+            return []
+        i, offset = self._locate(start)
+        entries = []
+        while i < len(self._chunks) and len(entries) < per_page:
+            entries.extend(self._chunks[i][offset : offset + per_page - len(entries)])
+            i, offset = i + 1, 0
+        return list(enumerate(entries, start))
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """The chunk holding `position` and the offset of the entry in it."""
+        if not 0 <= position < self._len:
+            raise IndexError("queue index out of range")
+        # Descend the tree for the most chunks whose lengths add up to at most `position`.
+        node, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            if node + step < len(self._tree) and self._tree[node + step] <= position:
+                node += step
+                position -= self._tree[node]
+            step >>= 1
+        return node, position
+
+    def _add(self, i: int, delta: int):
+        node = i + 1
+        while node < len(self._tree):
+            self._tree[node] += delta
+            node += node & -node
+
+    def _prefix(self, count: int) -> int:
+        """Number of entries in the first `count` chunks."""
+        total = 0
+        while count:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+    def _removed(self, i: int):
+        self._add(i, -1)
+        if not self._chunks[i]:
+            self._empty += 1
+            if self._empty * 2 > len(self._chunks):
+                self._chunks = [chunk for chunk in self._chunks if chunk]
+                self._reindex()
+        self._len -= 1
+        if not self._len:
+            self._not_empty.clear()
+
+    def _reindex(self):
+        """Build the tree from the chunk lengths, in time linear in the number of chunks."""
+        self._tree = [0] + [len(chunk) for chunk in self._chunks]
+        for node in range(1, len(self._tree)):
+            if (parent := node + (node & -node)) < len(self._tree):
+                self._tree[parent] += self._tree[node]
+        self._empty = sum(not chunk for chunk in self._chunks)
+
+    def _rebuild(self, entries: List):
+        self._chunks = [entries[i : i + CHUNK_SIZE] for i in range(0, len(entries), CHUNK_SIZE)]
+        self._reindex()
+        self._len = len(entries)
+        self.version += 1
+        if self._len:
+            self._not_empty.set()
+        else:
+            self._not_empty.clear()
@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+import contextvars
+import enum
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, Hashable, Iterator, Optional
+
+from .instrumentation import Metrics
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.scheduling")
+
+
+class Priority(enum.IntEnum):
+    """Order waiting Plex requests are let through in, lowest first."""
+
+    # Fetching and resolving the stream of the next track.
+    PLAYBACK = 0
+    # Commands someone is waiting on.
+    INTERACTIVE = 1
+    # Queuing the rest of large playlists and syncing library indexes.
+    BACKGROUND = 2
+    # Art and embeds refreshed on their own.
+    COSMETIC = 3
+
+
+_priority: "contextvars.ContextVar[Priority]" = contextvars.ContextVar(
+    "plex_priority", default=Priority.INTERACTIVE
+)
+_guild: "contextvars.ContextVar[Optional[int]]" = contextvars.ContextVar(
+    "plex_guild", default=None
+)
+_UNSET = object()
+
+
+def set_request_context(guild_id: Optional[int], priority: Priority = Priority.INTERACTIVE):
+    """Attribute the Plex requests of the current task, and of the tasks it starts, to a guild."""
+    _guild.set(guild_id)
+    _priority.set(priority)
+
+
+@contextlib.contextmanager
+def request_context(*, guild_id=_UNSET, priority=_UNSET) -> Iterator[None]:
+    """
+    Attribute the Plex requests made inside the block, and by the tasks started in it
+    Args:
+        guild_id: The guild the requests are made for, None for the bot itself.
+            Left as it is when not given.
+        priority: The Priority of the requests, left as it is when not given.
+    """
+    tokens = []
+    if guild_id is not _UNSET:
+        tokens.append((_guild, _guild.set(guild_id)))
+    if priority is not _UNSET:
+        tokens.append((_priority, _priority.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class FairScheduler:
+    """Caps the concurrent requests to a Plex server and decides which waiting one goes next.
+
+    Waiting requests are let through by priority first. Within a priority
+    guilds take turns, one request each, so a guild queuing thousands of
+    tracks only ever waits behind its own requests. Requests made outside
+    of any guild, like index syncs, take their turns as one more guild.
+    """
+
+    def __init__(self, name: str, limit: int, metrics: Optional[Metrics] = None):
+        self.name = name
+        self.limit = limit
+        self.metrics = metrics
+        self.active = 0
+        self.requests = Counter()
+        # Seconds spent waiting for a slot, by guild.
+        self.waited = Counter()
+        self._waiting: Dict[Priority, "OrderedDict[Hashable, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+
+    def waiting(self) -> Dict[Priority, int]:
+        """Number of requests waiting for a slot, by priority."""
+        return {
+            priority: sum(map(len, guilds.values())) for priority, guilds in self._waiting.items()
+        }
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: Optional[Priority] = None) -> AsyncIterator[None]:
+        """Hold one of the slots of the server for the duration of the block."""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Optional[Priority] = None):
+        """
+        Wait for a slot, `release()` must be called once done with it
+        Args:
+            priority: Priority of the request, the one of the current context if None.
+        """
+        priority = _priority.get() if priority is None else priority
+        guild_id = _guild.get()
+        started = time.perf_counter()
+        if self.active < self.limit and not any(self._waiting.values()):
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting[priority].setdefault(guild_id, deque()).append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted right as it was cancelled, the slot goes to the next in line.
+                    self.release()
+                else:
+                    self._forget(priority, guild_id, future)
+                raise
+        waited = time.perf_counter() - started
+        self.requests[guild_id] += 1
+        self.waited[guild_id] += waited
+        if self.metrics is not None:
+            self.metrics.observe("plex_wait_seconds", priority.name.lower(), waited, "priority")
+
+    def release(self):
+        self.active -= 1
+        while self.active < self.limit and (future := self._next()) is not None:
+            self.active += 1
+            future.set_result(None)
+
+    def _next(self) -> Optional[asyncio.Future]:
+        # Priorities iterate from the most urgent.
+        for guilds in self._waiting.values():
+            while guilds:
+                guild_id, queue = next(iter(guilds.items()))
+                future = queue.popleft()
+                if queue:
+                    guilds.move_to_end(guild_id)
+                else:
+                    del guilds[guild_id]
+                # Cancelled waiters only forget themselves once their task runs again.
+                if not future.done():
+                    return future
+        return None
+
+    def _forget(self, priority: Priority, guild_id: Optional[int], future: asyncio.Future):
+        guilds = self._waiting[priority]
+        if (queue := guilds.get(guild_id)) is None:
+            return
+        with contextlib.suppress(ValueError):
+            queue.remove(future)
+        if not queue:
+            del guilds[guild_id]
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.singleflight")
+
+T = TypeVar("T")
+
+# Seconds a completed lookup keeps answering identical ones.
+DEFAULT_TTL = 10.0
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class SingleFlight:
+    """Coalesces identical concurrent lookups into a single call.
+
+    The first caller for a key starts the call, everyone asking for the same
+    key while it runs awaits the same result. Successful results are then
+    remembered for `ttl` seconds, failures are shared but never remembered.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = Counter()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._memo: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Get the result of `func` for `key`, sharing it with identical lookups
+        Args:
+            key: Identifies the lookup, e.g. the server and the query.
+            func: Makes the actual lookup, only called if nobody else is.
+        Returns:
+            Whatever `func` returns.
+        """
+        if (entry := self._memo.get(key)) is not None:
+            if entry[0] > time.monotonic():
+                self._memo.move_to_end(key)
+                self.stats["memo"] += 1
+                return entry[1]
+            del self._memo[key]
+        if (future := self._inflight.get(key)) is not None:
+            self.stats["shared"] += 1
+        else:
+            self.stats["calls"] += 1
+            # The call runs in its own task, so a caller giving up doesn't fail everyone else.
+            future = self._inflight[key] = asyncio.ensure_future(func())
+            future.add_done_callback(lambda f: self._done(key, f))
+        return await asyncio.shield(future)
+
+    def _done(self, key: Hashable, future: asyncio.Future):
+        del self._inflight[key]
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.stats["errors"] += 1
+            return
+        if self.ttl > 0:
+            self._memo[key] = (time.monotonic() + self.ttl, future.result())
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+
+    def clear(self):
+        self._memo.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of lookups answered without a call of their own."""
+        total = self.stats["memo"] + self.stats["shared"] + self.stats["calls"]
+        return (self.stats["memo"] + self.stats["shared"]) / total if total else 0.0
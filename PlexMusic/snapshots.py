@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .queue import QueueEntry
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.snapshots")
+
+# Seconds between two snapshots of the queues that changed.
+SNAPSHOT_INTERVAL = 30
+# The file is rewritten once it grows this many times larger than after the last rewrite.
+COMPACT_RATIO = 4
+COMPACT_MIN_BYTES = 1024 * 1024
+# Single records shorter than this are parsed when compacting, to drop emptied queues.
+SMALL_RECORD = 512
+
+FULL = "f"
+POSITION = "p"
+
+
+class GuildSnapshot(NamedTuple):
+    """The stored queue of a guild.
+
+    Entries are kept as rows starting with the position of the machine
+    identifier of their server in `servers`, followed by the arguments of
+    `QueueEntry` up to the requester.
+    """
+
+    guild_id: int
+    servers: List[str]
+    queue: List[list]
+    current: Optional[list]
+    offset: int
+    voice_channel_id: Optional[int]
+    text_channel_id: Optional[int]
+
+
+class StoredQueue:
+    """The records of a guild since its last full one, only parsed once they are restored."""
+
+    __slots__ = ("guild_id", "voice_channel_id", "records")
+
+    def __init__(self, guild_id: int, voice_channel_id: Optional[int], records: List[str]):
+        self.guild_id = guild_id
+        self.voice_channel_id = voice_channel_id
+        self.records = records
+
+    def snapshot(self) -> Optional[GuildSnapshot]:
+        """The queue the records add up to, None if it was empty."""
+        snapshot = None
+        for payload in self.records:
+            try:
+                record = json.loads(payload)
+            except ValueError:
+                # A record cut short by a crash while it was being written.
+                continue
+            servers, current = record["s"], record["c"]
+            if "q" in record:
+                queue = record["q"]
+            elif snapshot is not None:
+                # The current track is the only row that may come from a server not seen before.
+                queue, servers = snapshot.queue[record["n"] :], list(snapshot.servers)
+                current = _reindex(current, record["s"], servers)
+            else:
+                continue
+            snapshot = GuildSnapshot(
+                self.guild_id,
+                servers,
+                queue,
+                current,
+                record["o"],
+                record["vc"],
+                record["tc"],
+            )
+        if snapshot is None or not (snapshot.queue or snapshot.current):
+            return None
+        return snapshot
+
+
+def _encode(entry: QueueEntry, servers: Dict[str, int]) -> list:
+    server = servers.setdefault(entry.server.machineIdentifier, len(servers))
+    return [
+        server,
+        entry.rating_key,
+        entry.duration,
+        entry.parent_key,
+        entry.grandparent_key,
+        entry.title,
+        entry.requester,
+    ]
+
+
+def _reindex(row: Optional[list], source: List[str], servers: List[str]) -> Optional[list]:
+    """`row` with its server index in `source` changed to its index in `servers`."""
+    if row is None:
+        return None
+    machine = source[row[0]]
+    if machine not in servers:
+        servers.append(machine)
+    return [servers.index(machine), *row[1:]]
+
+
+def _line(kind: str, record: dict) -> str:
+    # The guild and voice channel lead the line, so loading doesn't have to parse the JSON.
+    voice_channel_id = record["vc"] or ""
+    payload = json.dumps(record, separators=(",", ":"))
+    return f"{record['g']}\t{kind}\t{voice_channel_id}\t{payload}\n"
+
+
+def full_record(
+    guild_id: int,
+    queue: Iterable[QueueEntry],
+    current: Optional[QueueEntry],
+    offset: int,
+    voice_channel_id: Optional[int],
+    text_channel_id: Optional[int],
+) -> str:
+    """A record holding the whole queue of a guild."""
+    servers = {}
+    rows = [_encode(entry, servers) for entry in queue]
+    record = {
+        "g": guild_id,
+        "q": rows,
+        "c": _encode(current, servers) if current else None,
+        "s": list(servers),
+        "o": offset,
+        "vc": voice_channel_id,
+        "tc": text_channel_id,
+    }
+    return _line(FULL, record)
+
+
+def position_record(
+    guild_id: int,
+    taken: int,
+    current: Optional[QueueEntry],
+    offset: int,
+    voice_channel_id: Optional[int],
+    text_channel_id: Optional[int],
+) -> str:
+    """A record of a guild whose queue only lost `taken` entries at the front since the last."""
+    servers = {}
+    record = {
+        "g": guild_id,
+        "n": taken,
+        "c": _encode(current, servers) if current else None,
+        "s": list(servers),
+        "o": offset,
+        "vc": voice_channel_id,
+        "tc": text_channel_id,
+    }
+    return _line(POSITION, record)
+
+
+def restore_entries(
+    snapshot: GuildSnapshot, rows: Iterable[list], servers: Dict[str, object]
+) -> List[QueueEntry]:
+    """
+    Turn rows of a snapshot back into queue entries
+    Args:
+        snapshot: The snapshot the rows are from.
+        rows: Rows of `snapshot.queue` or `snapshot.current`.
+        servers: Servers by machine identifier, rows of other servers are dropped.
+    Returns:
+        List of QueueEntry in the order of `rows`.
+    """
+    resolved = [servers.get(machine) for machine in snapshot.servers]
+    return [
+        QueueEntry(server, *fields)
+        for index, *fields in rows
+        if (server := resolved[index]) is not None
+    ]
+
+
+def read_records(lines: Iterable[str]) -> Dict[int, StoredQueue]:
+    """The records of every guild since its last full record, without parsing them."""
+    guilds: Dict[int, StoredQueue] = {}
+    for line in lines:
+        try:
+            guild_id, kind, voice_channel_id, payload = line.rstrip("\n").split("\t", 3)
+            guild_id = int(guild_id)
+            voice_channel_id = int(voice_channel_id) if voice_channel_id else None
+        except ValueError:
+            continue
+        if kind == FULL:
+            guilds[guild_id] = StoredQueue(guild_id, voice_channel_id, [payload])
+        elif (stored := guilds.get(guild_id)) is not None:
+            stored.voice_channel_id = voice_channel_id
+            stored.records.append(payload)
+    return guilds
+
+
+class SnapshotStore:
+    """Append-only file of queue snapshots, one record per line.
+
+    A guild gets a full record when its queue changed and a small position
+    record when entries were only played off the front. Loading only splits
+    the lines by guild, the records of a guild are parsed when its queue is
+    restored. The file is rewritten with a single full record per guild
+    after loading and once it has grown `COMPACT_RATIO` times larger.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._compacted_size = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="PlexMusic-snapshots"
+        )
+
+    async def load(self) -> Dict[int, StoredQueue]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+
+    async def append(self, records: List[str]):
+        if records:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._append, records)
+
+    def close(self, records: List[str]):
+        """Write the last records in the background, the next store to load waits for them."""
+        if records:
+            self._executor.submit(self._append, records)
+        # Not a daemon, so the interpreter waits for the writes before exiting too.
+        threading.Thread(
+            target=self._executor.shutdown, name=self._closing_name(self.path)
+        ).start()
+
+    @staticmethod
+    def _closing_name(path: Path) -> str:
+        return f"PlexMusic-snapshots-closing {path}"
+
+    def _load(self) -> Dict[int, StoredQueue]:
+        # A reloaded cog loads while the store of the unloaded one may still be writing.
+        for thread in threading.enumerate():
+            if thread.name == self._closing_name(self.path):
+                thread.join()
+        try:
+            with self.path.open(encoding="utf-8") as file:
+                guilds = read_records(file)
+        except FileNotFoundError:
+            return {}
+        # Queued behind the load, restoring doesn't wait for the rewrite.
+        self._executor.submit(self._compact, dict(guilds))
+        return guilds
+
+    def _append(self, records: List[str]):
+        with self.path.open("a", encoding="utf-8") as file:
+            file.writelines(records)
+            size = file.tell()
+        if size > max(COMPACT_MIN_BYTES, self._compacted_size * COMPACT_RATIO):
+            with self.path.open(encoding="utf-8") as file:
+                self._compact(read_records(file))
+
+    def _compact(self, guilds: Dict[int, StoredQueue]):
+        temporary = self.path.with_suffix(".tmp")
+        with temporary.open("w", encoding="utf-8") as file:
+            for stored in guilds.values():
+                if len(stored.records) == 1 and len(stored.records[0]) > SMALL_RECORD:
+                    # A lone full record is already compact, no need to parse it.
+                    voice_channel_id = stored.voice_channel_id or ""
+                    file.write(f"{stored.guild_id}\t{FULL}\t{voice_channel_id}\t")
+                    file.write(f"{stored.records[0]}\n")
+                    continue
+                if (snapshot := stored.snapshot()) is None:
+                    continue
+                record = {
+                    "g": snapshot.guild_id,
+                    "q": snapshot.queue,
+                    "c": snapshot.current,
+                    "s": snapshot.servers,
+                    "o": snapshot.offset,
+                    "vc": snapshot.voice_channel_id,
+                    "tc": snapshot.text_channel_id,
+                }
+                file.write(_line(FULL, record))
+            self._compacted_size = file.tell()
+        os.replace(temporary, self.path)
+        log.debug("Compacted the queue snapshots to %d bytes", self._compacted_size)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from redbot.core import commands
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.startup")
+
+
+class Subsystem(NamedTuple):
+    name: str
+    start: Callable[[], Awaitable]
+    after: Tuple[str, ...]
+
+
+class Timing(NamedTuple):
+    name: str
+    # Seconds from the start of the cog until the subsystem was ready.
+    ready: float
+    # Seconds the subsystem itself took, without waiting for what it starts after.
+    took: float
+    failed: bool
+
+
+def requires(*subsystems: str):
+    """
+    Only hold a command back until the given subsystems are ready
+    Commands without it wait for every subsystem, subcommands inherit it
+    from their group unless they set their own.
+    Args:
+        subsystems: Names of the subsystems the command uses, none if it uses none.
+    """
+
+    def decorator(func):
+        callback = getattr(func, "callback", func)
+        callback.__startup_requires__ = subsystems
+        return func
+
+    return decorator
+
+
+class Startup:
+    """Subsystems of the cog started concurrently, each as soon as the ones it needs are ready.
+
+    Every subsystem has its own event, so commands only wait for what they
+    use instead of the whole cog. A subsystem that fails to start is logged
+    and still counts as ready, its commands deal with it missing like they
+    would with a server that went away.
+    """
+
+    def __init__(self):
+        self.import_seconds: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self._subsystems: Dict[str, Subsystem] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self._timings: Dict[str, Timing] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._subsystems)
+
+    def add(self, name: str, start: Callable[[], Awaitable], after: Iterable[str] = ()):
+        """
+        Register a subsystem
+        Args:
+            name: Name commands refer to it by.
+            start: Coroutine function starting it.
+            after: Names of the subsystems it needs, they are registered before it.
+        """
+        after = tuple(after)
+        if unknown := [n for n in after if n not in self._subsystems]:
+            raise ValueError(f"{name} starts after unknown subsystems {unknown}")
+        self._subsystems[name] = Subsystem(name, start, after)
+        self._events[name] = asyncio.Event()
+
+    async def run(self) -> List[Timing]:
+        """Start every subsystem and wait until they are all ready."""
+        self.started_at = time.perf_counter()
+        self._tasks = [asyncio.create_task(self._start(s)) for s in self._subsystems.values()]
+        await asyncio.gather(*self._tasks)
+        timings = self.timings()
+        log.info(
+            "Ready in %.0f ms (%s)",
+            max((t.ready for t in timings), default=0) * 1000,
+            ", ".join(f"{t.name} {t.took * 1000:.0f} ms" for t in timings),
+        )
+        return timings
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    async def wait(self, *names: str):
+        """Wait until the given subsystems are ready."""
+        for name in names:
+            await self._events[name].wait()
+
+    def is_ready(self, name: str) -> bool:
+        return self._events[name].is_set()
+
+    def closure(self, names: Iterable[str]) -> Set[str]:
+        """The given subsystems and every subsystem they start after."""
+        pending, found = list(names), set()
+        while pending:
+            if (name := pending.pop()) not in found:
+                found.add(name)
+                pending.extend(self._subsystems[name].after)
+        return found
+
+    def required(self, command: Optional[commands.Command]) -> Tuple[str, ...]:
+        """Names of the subsystems a command waits for."""
+        while command is not None:
+            if (names := getattr(command.callback, "__startup_requires__", None)) is not None:
+                return names
+            command = command.parent
+        return self.names
+
+    def timings(self) -> List[Timing]:
+        """Timings of the subsystems that are ready, in the order they got ready."""
+        return sorted(self._timings.values(), key=lambda t: t.ready)
+
+    async def _start(self, subsystem: Subsystem):
+        await self.wait(*subsystem.after)
+        started = time.perf_counter()
+        failed = False
+        try:
+            await subsystem.start()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Failed to start %s", subsystem.name)
+            failed = True
+        finished = time.perf_counter()
+        self._timings[subsystem.name] = Timing(
+            subsystem.name, finished - self.started_at, finished - started, failed
+        )
+        self._events[subsystem.name].set()
@@ -0,0 +1,293 @@
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from collections import Counter
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlencode
+
+import aiohttp
+import plexapi
+import plexapi.audio
+from discord import AudioSource, FFmpegOpusAudio, FFmpegPCMAudio
+
+from .async_plex import PlexExecutorPool
+from .audio_cache import AudioCache
+from .buffering import DEFAULT_READ_AHEAD, ReadAheadOpusAudio, ReadAheadStream
+from .workers import AudioWorkerPool
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.streaming")
+
+MODE_OPUS = "opus"
+MODE_PCM = "pcm"
+MODES = (MODE_OPUS, MODE_PCM)
+
+# Discord voice channels carry between 8 and 384 kbps, 96 kbps unless boosted.
+DEFAULT_BITRATE = 96
+MIN_BITRATE = 32
+MAX_BITRATE = 384
+# Opus inside any of these containers can be fed to Discord without re-encoding.
+OPUS_CONTAINERS = {"ogg", "opus", "webm", "mka"}
+PROBE_BYTES = 4096
+PROBE_TIMEOUT = 10
+# Seconds before probing again a server whose probe failed without an answer.
+PROBE_RETRY = 5 * 60
+
+
+class StreamProfile(NamedTuple):
+    name: str
+    # Highest bitrate requested from Plex in kbps, None follows the voice channel.
+    bitrate: Optional[int]
+    description: str
+
+    def bitrate_for(self, channel_bitrate: int) -> int:
+        """The bitrate to stream at in a voice channel of `channel_bitrate` kbps."""
+        return min(max(self.bitrate or channel_bitrate, MIN_BITRATE), MAX_BITRATE)
+
+
+PROFILES: Dict[str, StreamProfile] = {
+    profile.name: profile
+    for profile in (
+        StreamProfile("auto", None, "The bitrate of the voice channel"),
+        StreamProfile("low", 64, "64 kbps, the lowest Discord default"),
+        StreamProfile("normal", 96, "96 kbps, the Discord default"),
+        StreamProfile("high", 160, "160 kbps"),
+        StreamProfile("max", MAX_BITRATE, f"{MAX_BITRATE} kbps, boosted voice channels"),
+    )
+}
+DEFAULT_PROFILE = "auto"
+
+
+class StreamResolver:
+    """Picks how a track is streamed to a voice client.
+
+    In opus mode FFmpeg only remuxes Opus packets, discord.py then sends them
+    as is instead of decoding to PCM and encoding every 20ms frame again:
+
+    - tracks that are already Opus are read straight from their media part,
+    - anything else is transcoded to Opus in Ogg by the Plex server.
+
+    Whether a server's transcoder can produce Opus is probed once per server,
+    servers that can't, and pcm mode, use the `FFmpegPCMAudio` path. With
+    `workers` set that path is encoded by the worker processes instead,
+    unless none of them is running.
+    Tracks in the `cache` are read from disk instead of from Plex. With a
+    `session`, opus streams are read from Plex through a `ReadAheadStream`
+    holding `read_ahead` seconds of audio. The `FFmpegPCMAudio` path reads
+    an HLS playlist, whose segments FFmpeg has to fetch itself.
+    """
+
+    def __init__(
+        self,
+        executors: PlexExecutorPool,
+        workers: Optional[AudioWorkerPool] = None,
+        cache: Optional[AudioCache] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        read_ahead: float = DEFAULT_READ_AHEAD,
+    ):
+        self.executors = executors
+        self.workers = workers
+        self.cache = cache
+        self.session = session
+        self.read_ahead = read_ahead
+        self.streams = Counter()
+        self.profiles = Counter()
+        self._opus_transcode: Dict[str, bool] = {}
+        self._probes: Dict[str, asyncio.Task] = {}
+        # When servers whose probe failed, e.g. timed out, are probed again.
+        self._probe_retry: Dict[str, float] = {}
+
+    async def source(
+        self,
+        track: plexapi.audio.Track,
+        mode: str = MODE_OPUS,
+        channel_bitrate: int = DEFAULT_BITRATE,
+        profile: str = DEFAULT_PROFILE,
+        offset: float = 0,
+        stats: Optional[Counter] = None,
+    ) -> AudioSource:
+        """
+        Build the audio source of a track
+        Args:
+            track: plexapi.audio.Track to stream.
+            mode: `MODE_OPUS` to avoid re-encoding locally whenever possible, or `MODE_PCM`.
+            channel_bitrate: The bitrate of the voice channel in kbps.
+            profile: Name of the `StreamProfile` capping the bitrate Plex sends.
+            offset: Seconds into the track to start at.
+            stats: Counter the read-ahead buffer counts underruns and reconnects in.
+        Returns:
+            FFmpegOpusAudio, ReadAheadOpusAudio, FFmpegPCMAudio or WorkerAudio
+            reading the track from Plex.
+        """
+        profile = PROFILES.get(profile, PROFILES[DEFAULT_PROFILE])
+        self.profiles[profile.name] += 1
+        bitrate = profile.bitrate_for(channel_bitrate)
+        options = {"before_options": f"-ss {offset:.3f}"} if offset > 0 else {}
+        if self.cache is not None and (path := await self.cache.lookup(track)) is not None:
+            return self._cached_source(track, str(path), mode, bitrate, options)
+        if mode == MODE_OPUS:
+            if self.is_opus(track) and (track.media[0].bitrate or 0) <= bitrate:
+                self.streams["opus-direct"] += 1
+                return self._remote_source(
+                    self.direct_url(track),
+                    track.media[0].bitrate or bitrate,
+                    stats,
+                    bitrate=bitrate,
+                    codec="opus",
+                    **options,
+                )
+            if await self.supports_opus_transcode(track):
+                self.streams["opus-transcode"] += 1
+                return self._remote_source(
+                    self.transcode_url(track, bitrate),
+                    bitrate,
+                    stats,
+                    bitrate=bitrate,
+                    codec="opus",
+                    **options,
+                )
+        track_url = await self.executors.run_for(track, track.getStreamURL)
+        # getStreamURL drops parameters it doesn't know, without these Plex may
+        # stream lossless originals at several Mbit/s.
+        track_url += "&" + urlencode({"maxAudioBitrate": bitrate, "musicBitrate": bitrate})
+        log.debug("%s - URL: %s", track, track_url)
+        if self.workers is not None and self.workers.available:
+            self.streams["pcm-worker"] += 1
+            return self.workers.source(track_url, bitrate=bitrate, **options)
+        self.streams["pcm"] += 1
+        return FFmpegPCMAudio(track_url, **options)
+
+    def _remote_source(
+        self, url: str, url_bitrate: int, stats: Optional[Counter], **kwargs
+    ) -> AudioSource:
+        """
+        FFmpeg remuxing the Opus of a Plex url, through a read-ahead buffer unless it's disabled
+        Args:
+            url: The url to stream, served as a single file.
+            url_bitrate: Bitrate of what the url serves in kbps, sizes the buffer.
+            stats: Counter the buffer counts underruns and reconnects in.
+            kwargs: Passed on to FFmpegOpusAudio.
+        """
+        if self.session is None or self.read_ahead <= 0:
+            return FFmpegOpusAudio(url, **kwargs)
+        self.streams["read-ahead"] += 1
+        stream = ReadAheadStream(self.session, url, url_bitrate, self.read_ahead, stats)
+        return ReadAheadOpusAudio(stream, **kwargs)
+
+    def _cached_source(
+        self, track: plexapi.audio.Track, path: str, mode: str, bitrate: int, options: dict
+    ) -> AudioSource:
+        """The audio source of a track whose media file is cached on disk."""
+        if mode == MODE_OPUS:
+            # Without Plex to transcode, FFmpeg encodes to Opus itself, still outside the bot.
+            self.streams["cached-opus"] += 1
+            direct = self.is_opus(track) and (track.media[0].bitrate or 0) <= bitrate
+            codec = "opus" if direct else None
+            return FFmpegOpusAudio(path, bitrate=bitrate, codec=codec, **options)
+        self.streams["cached-pcm"] += 1
+        if self.workers is not None and self.workers.available:
+            return self.workers.source(path, bitrate=bitrate, **options)
+        return FFmpegPCMAudio(path, **options)
+
+    @staticmethod
+    def is_opus(track: plexapi.audio.Track) -> bool:
+        if not track.media:
+            return False
+        media = track.media[0]
+        return media.audioCodec == "opus" and media.container in OPUS_CONTAINERS
+
+    @staticmethod
+    def direct_url(track: plexapi.audio.Track) -> str:
+        return track._server.url(track.media[0].parts[0].key, includeToken=True)
+
+    @staticmethod
+    def transcode_url(
+        track: plexapi.audio.Track, bitrate: int, session: Optional[str] = None
+    ) -> str:
+        """Url of a universal transcode of `track` to Opus in Ogg, capped at `bitrate` kbps."""
+        profile = (
+            "add-transcode-target(type=musicProfile&context=streaming&protocol=http"
+            "&container=ogg&audioCodec=opus)"
+            "+add-limitation(scope=musicCodec&scopeName=opus&type=upperBound"
+            f"&name=audio.bitrate&value={bitrate})"
+        )
+        params = {
+            "path": track.key,
+            "mediaIndex": 0,
+            "partIndex": 0,
+            "protocol": "http",
+            "directPlay": 0,
+            "directStream": 0,
+            "maxAudioBitrate": bitrate,
+            "musicBitrate": bitrate,
+            "session": session or uuid.uuid4().hex,
+            "X-Plex-Client-Identifier": plexapi.X_PLEX_IDENTIFIER,
+            "X-Plex-Product": plexapi.X_PLEX_PRODUCT,
+            "X-Plex-Platform": "Generic",
+            "X-Plex-Client-Profile-Extra": profile,
+        }
+        return track._server.url(
+            f"/music/:/transcode/universal/start.ogg?{urlencode(params)}", includeToken=True
+        )
+
+    async def supports_opus_transcode(self, track: plexapi.audio.Track) -> bool:
+        """
+        Whether the server of `track` transcodes to Opus, probed once per server
+        A server that didn't answer the probe counts as not transcoding to Opus
+        until it's probed again `PROBE_RETRY` seconds later.
+        """
+        server = track._server.machineIdentifier
+        if server in self._opus_transcode:
+            return self._opus_transcode[server]
+        if self._probe_retry.get(server, 0) > time.monotonic():
+            return False
+        if server not in self._probes:
+            self._probes[server] = asyncio.create_task(self._probe(track))
+        return await asyncio.shield(self._probes[server])
+
+    async def _probe(self, track: plexapi.audio.Track) -> bool:
+        server = track._server.machineIdentifier
+        session = uuid.uuid4().hex
+        url = self.transcode_url(track, DEFAULT_BITRATE, session=session)
+        try:
+            supported = await self.executors.run_for(
+                track, self._read_header, track._server, url, session
+            )
+        except Exception:
+            # Timeouts and errors of a busy server don't say anything about its transcoder.
+            log.info(
+                "Unable to probe the transcoder of %s, using %s streams for %ds",
+                server,
+                MODE_PCM,
+                PROBE_RETRY,
+                exc_info=log.isEnabledFor(logging.DEBUG),
+            )
+            self._probe_retry[server] = time.monotonic() + PROBE_RETRY
+            return False
+        finally:
+            del self._probes[server]
+        self._probe_retry.pop(server, None)
+        self._opus_transcode[server] = supported
+        log.info(
+            "Plex server %s %s Opus, using %s streams",
+            server,
+            "transcodes to" if supported else "can't transcode to",
+            MODE_OPUS if supported else MODE_PCM,
+        )
+        return supported
+
+    @staticmethod
+    def _read_header(server, url: str, session: str) -> bool:
+        try:
+            with server._session.get(url, stream=True, timeout=PROBE_TIMEOUT) as response:
+                # Server errors are retried later, any other refusal is a final answer.
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                if not response.ok:
+                    return False
+                header = response.raw.read(PROBE_BYTES)
+        finally:
+            with contextlib.suppress(Exception):
+                server.query("/video/:/transcode/universal/stop", params={"session": session})
+        return header.startswith(b"OggS") and b"OpusHead" in header
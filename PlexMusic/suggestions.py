@@ -0,0 +1,186 @@
+import asyncio
+import functools
+import heapq
+import logging
+import re
+import unicodedata
+import warnings
+from array import array
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.suggestions")
+
+# Titles shortlisted by shared trigrams, only these are scored by fuzzywuzzy.
+CANDIDATES = 40
+# The rarest trigrams of the query that are looked up, a typo only changes three of them.
+QUERY_GRAMS = 12
+MIN_SCORE = 60
+DEFAULT_LIMIT = 5
+
+_STRIP_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+
+
+@functools.lru_cache(maxsize=None)
+def _fuzzywuzzy():
+    """fuzzywuzzy's `fuzz` and `process`, imported the first time a query is scored."""
+    with warnings.catch_warnings():
+        # Without python-Levenshtein fuzzywuzzy warns about its pure Python fallback,
+        # which is fine for the few dozen candidates it scores here.
+        warnings.simplefilter("ignore")
+        from fuzzywuzzy import fuzz, process
+    return fuzz, process
+
+
+class Suggestion(NamedTuple):
+    title: str
+    # The artist of tracks and albums.
+    detail: Optional[str]
+    score: int
+
+
+def normalize(title: str) -> str:
+    """Case, accents, punctuation and repeated whitespace removed."""
+    title = title.casefold()
+    if not title.isascii():
+        title = unicodedata.normalize("NFKD", title)
+        title = "".join(c for c in title if not unicodedata.combining(c))
+    return " ".join(_STRIP_RE.sub(" ", title).split())
+
+
+def trigrams(normalized: str) -> List[str]:
+    """The distinct trigrams of every word, padded so short words have one too."""
+    padded = f" {normalized.replace(' ', '  ')} "
+    # Grams with two spaces span a word boundary.
+    return [g for g in {padded[i : i + 3] for i in range(len(padded) - 2)} if "  " not in g]
+
+
+class TitleCorpus:
+    """Normalized titles of a library with a trigram index, built once and then only read.
+
+    Suggesting counts the trigrams a query shares with every title in a
+    single pass over the posting lists of its rarest trigrams, and only
+    scores the best shortlisted titles with fuzzywuzzy.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Optional[str]]]):
+        self.titles: List[str] = []
+        self.details: List[Optional[str]] = []
+        self.normalized: List[str] = []
+        self._exact: Dict[str, List[int]] = {}
+        postings: Dict[str, array] = {}
+        gram_counts = array("H")
+        seen = set()
+        for title, detail in entries:
+            if not title or (title, detail) in seen:
+                continue
+            seen.add((title, detail))
+            normalized = normalize(title)
+            index = len(self.titles)
+            self.titles.append(title)
+            self.details.append(detail)
+            self.normalized.append(normalized)
+            self._exact.setdefault(normalized, []).append(index)
+            grams = trigrams(normalized)
+            gram_counts.append(min(len(grams), 0xFFFF))
+            for gram in grams:
+                if (posting := postings.get(gram)) is None:
+                    posting = postings[gram] = array("I")
+                posting.append(index)
+        self._postings = postings
+        self._gram_counts = gram_counts
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def suggest(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Suggestion]:
+        """
+        Rank the titles closest to a query
+        Args:
+            query: What the user typed.
+            limit: The maximum number of suggestions.
+        Returns:
+            List of Suggestion, best first. Exact matches after normalizing score 100.
+        """
+        if not (normalized := normalize(query)):
+            return []
+        if exact := self._exact.get(normalized):
+            return [self._suggestion(i, 100) for i in exact[:limit]]
+        grams = [g for g in trigrams(normalized) if g in self._postings]
+        if not grams:
+            return []
+        grams.sort(key=lambda g: len(self._postings[g]))
+        shared = Counter()
+        for gram in grams[:QUERY_GRAMS]:
+            shared.update(self._postings[gram])
+        size = len(grams[:QUERY_GRAMS])
+        counts = self._gram_counts
+        # Dice coefficient, so long titles sharing a few common trigrams don't crowd the shortlist.
+        shortlist = heapq.nlargest(
+            CANDIDATES, shared.items(), key=lambda item: item[1] / (size + counts[item[0]])
+        )
+        choices = {index: self.normalized[index] for index, _ in shortlist}
+        fuzz, process = _fuzzywuzzy()
+        scored = process.extract(
+            normalized, choices, scorer=fuzz.WRatio, processor=None, limit=limit
+        )
+        return [self._suggestion(i, score) for _, score, i in scored if score >= MIN_SCORE]
+
+    def _suggestion(self, index: int, score: int) -> Suggestion:
+        return Suggestion(self.titles[index], self.details[index], score)
+
+
+class SuggestionResolver:
+    """Title corpora of every library, rebuilt in the background when their version changes."""
+
+    def __init__(self):
+        self._corpora: Dict[Hashable, Tuple[Hashable, TitleCorpus]] = {}
+        self._builds: Dict[Hashable, asyncio.Task] = {}
+
+    async def corpus(
+        self,
+        key: Hashable,
+        version: Hashable,
+        load: Callable[[], Awaitable[Iterable[Tuple[str, Optional[str]]]]],
+    ) -> TitleCorpus:
+        """
+        The corpus of a library, built from `load()` if there's none for `version` yet
+        Args:
+            key: Identifies the library and what kind of titles it holds.
+            version: Changes whenever the titles may have changed.
+            load: Returns the title and detail of every item.
+        Returns:
+            The TitleCorpus, the outdated one while its replacement is being built.
+        """
+        current = self._corpora.get(key)
+        if current is not None and current[0] == version:
+            return current[1]
+        if key not in self._builds:
+            self._builds[key] = asyncio.create_task(self._build(key, version, load))
+        if current is not None:
+            return current[1]
+        return await asyncio.shield(self._builds[key])
+
+    async def suggest(
+        self, corpora: Iterable[TitleCorpus], query: str, limit: int = DEFAULT_LIMIT
+    ) -> List[Suggestion]:
+        """The best suggestions across several corpora, scored off the event loop."""
+        corpora = list(corpora)
+        if not corpora:
+            return []
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, corpus.suggest, query, limit) for corpus in corpora)
+        )
+        merged = dict.fromkeys(s for result in results for s in result)
+        return sorted(merged, key=lambda s: s.score, reverse=True)[:limit]
+
+    async def _build(self, key: Hashable, version: Hashable, load) -> TitleCorpus:
+        try:
+            entries = await load()
+            corpus = await asyncio.get_running_loop().run_in_executor(None, TitleCorpus, entries)
+        finally:
+            del self._builds[key]
+        self._corpora[key] = (version, corpus)
+        log.debug("Built the title corpus of %s with %d titles", key, len(corpus))
+        return corpus
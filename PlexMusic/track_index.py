@@ -0,0 +1,408 @@
+import asyncio
+import logging
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .async_plex import AsyncMusicSection
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.track_index")
+
+PAGE_SIZE = 500
+# Incremental syncs overlap the previous one by this many seconds to cover clock skew.
+SYNC_OVERLAP = 300
+# Incremental syncs can't see deletions so a full rescan is done periodically.
+FULL_SYNC_INTERVAL = 24 * 60 * 60
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    synced_at INTEGER NOT NULL,
+    full_synced_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    rating_key INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    title_sort TEXT,
+    album_title TEXT,
+    artist_title TEXT,
+    album_key INTEGER,
+    artist_key INTEGER,
+    duration INTEGER,
+    updated_at INTEGER,
+    UNIQUE (source, rating_key)
+);
+CREATE TABLE IF NOT EXISTS albums (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    rating_key INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    title_sort TEXT,
+    artist_title TEXT,
+    artist_key INTEGER,
+    updated_at INTEGER,
+    UNIQUE (source, rating_key)
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+    {columns}, content='{table}', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {table} BEGIN
+    INSERT INTO {table}_fts(rowid, {columns}) VALUES (new.id, {new});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {table} BEGIN
+    INSERT INTO {table}_fts({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE ON {table} BEGIN
+    INSERT INTO {table}_fts({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+    INSERT INTO {table}_fts(rowid, {columns}) VALUES (new.id, {new});
+END;
+"""
+
+_FTS_COLUMNS = {
+    "tracks": ("title", "artist_title", "album_title"),
+    "albums": ("title", "artist_title"),
+}
+
+
+class IndexedTrack(NamedTuple):
+    rating_key: int
+    title: str
+    album_title: Optional[str]
+    artist_title: Optional[str]
+    album_key: Optional[int]
+    artist_key: Optional[int]
+    duration: Optional[int]
+
+
+class IndexedAlbum(NamedTuple):
+    rating_key: int
+    title: str
+    artist_title: Optional[str]
+    artist_key: Optional[int]
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[int]:
+    return int(value.timestamp()) if value else None
+
+
+def _match_expression(column: str, query: str) -> Optional[str]:
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return f"{column} : (" + " AND ".join(f'"{t}"*' for t in tokens) + ")"
+
+
+class TrackIndex:
+    """Local SQLite index of the tracks and albums of every loaded MusicSection.
+
+    Writes happen on a dedicated thread, reads are done on the event loop
+    against a separate WAL connection and only take microseconds.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fts = True
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PlexMusic-index")
+        self._writer: Optional[sqlite3.Connection] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._synced: Dict[str, int] = {}
+        # Bumped whenever a sync changed the rows of a source.
+        self._versions: Dict[str, int] = defaultdict(int)
+
+    async def initialize(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._open_writer)
+        self._reader = sqlite3.connect(str(self.path))
+        self._reader.execute("PRAGMA query_only = ON")
+        self._synced = dict(self._reader.execute("SELECT source, synced_at FROM sources"))
+
+    def close(self):
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+        self._executor.submit(self._close_writer)
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def source_id(section: AsyncMusicSection) -> str:
+        return f"{section.server.machine_identifier}:{section.key}"
+
+    def is_ready(self, section: AsyncMusicSection) -> bool:
+        return self._reader is not None and self.source_id(section) in self._synced
+
+    def version(self, section: AsyncMusicSection) -> int:
+        """Changes whenever the indexed items of a section changed."""
+        return self._versions[self.source_id(section)]
+
+    async def titles(
+        self, section: AsyncMusicSection, libtype: str
+    ) -> List[Tuple[str, Optional[str]]]:
+        """
+        The titles of every indexed item of a section
+        Args:
+            section: The MusicSection to list.
+            libtype: `track` or `album`.
+        Returns:
+            List of the title and artist title of every item.
+        """
+        table = {"track": "tracks", "album": "albums"}[libtype]
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._titles, table, self.source_id(section)
+        )
+
+    def search_tracks(
+        self, section: AsyncMusicSection, title: str, artist: str = None, limit: int = 1
+    ) -> List[IndexedTrack]:
+        """
+        Search the index for tracks
+        Args:
+            section: The MusicSection to search in.
+            title: str title of song to search for.
+            artist: Optional artist name the track must belong to.
+            limit: The maximum number of results.
+        Returns:
+            List of IndexedTrack, best match first.
+        """
+        params = [self.source_id(section)]
+        artist_clause = ""
+        if artist:
+            artist_clause = "AND t.artist_title = ? COLLATE NOCASE"
+            params.append(artist)
+        columns = (
+            "t.rating_key, t.title, t.album_title, t.artist_title, "
+            "t.album_key, t.artist_key, t.duration"
+        )
+        if self.fts:
+            if (match := _match_expression("title", title)) is None:
+                return []
+            query = (
+                f"SELECT {columns} FROM tracks_fts JOIN tracks t ON t.id = tracks_fts.rowid "
+                f"WHERE tracks_fts MATCH ? AND t.source = ? {artist_clause} "
+                "ORDER BY (t.title = ? COLLATE NOCASE) DESC, tracks_fts.rank, t.title_sort LIMIT ?"
+            )
+            params.insert(0, match)
+        else:
+            query = (
+                f"SELECT {columns} FROM tracks t WHERE t.title LIKE ? AND t.source = ? "
+                f"{artist_clause} ORDER BY (t.title = ? COLLATE NOCASE) DESC, t.title_sort LIMIT ?"
+            )
+            params.insert(0, f"%{title}%")
+        params.extend((title, limit))
+        return [IndexedTrack(*row) for row in self._reader.execute(query, params)]
+
+    def search_albums(
+        self, section: AsyncMusicSection, title: str, limit: int = 1
+    ) -> List[IndexedAlbum]:
+        """
+        Search the index for albums
+        Args:
+            section: The MusicSection to search in.
+            title: str title of album to search for.
+            limit: The maximum number of results.
+        Returns:
+            List of IndexedAlbum, best match first.
+        """
+        columns = "a.rating_key, a.title, a.artist_title, a.artist_key"
+        if self.fts:
+            if (match := _match_expression("title", title)) is None:
+                return []
+            query = (
+                f"SELECT {columns} FROM albums_fts JOIN albums a ON a.id = albums_fts.rowid "
+                "WHERE albums_fts MATCH ? AND a.source = ? "
+                "ORDER BY (a.title = ? COLLATE NOCASE) DESC, albums_fts.rank, a.title_sort LIMIT ?"
+            )
+        else:
+            match = f"%{title}%"
+            query = (
+                f"SELECT {columns} FROM albums a WHERE a.title LIKE ? AND a.source = ? "
+                "ORDER BY (a.title = ? COLLATE NOCASE) DESC, a.title_sort LIMIT ?"
+            )
+        params = (match, self.source_id(section), title, limit)
+        return [IndexedAlbum(*row) for row in self._reader.execute(query, params)]
+
+    async def sync(self, section: AsyncMusicSection, full: bool = False):
+        """
+        Bring the index of a MusicSection up to date
+        The first sync of a section loads every track and album, later
+        syncs only fetch the items added or updated since the last one.
+        Args:
+            section: The MusicSection to sync.
+            full: Force a full rescan, which also drops deleted items.
+        """
+        source = self.source_id(section)
+        async with self._locks[source]:
+            row = self._reader.execute(
+                "SELECT synced_at, full_synced_at FROM sources WHERE source = ?", (source,)
+            ).fetchone()
+            started = int(time.time())
+            full = full or row is None or started - row[1] > FULL_SYNC_INTERVAL
+            since = None if full else datetime.fromtimestamp(row[0] - SYNC_OVERLAP)
+            seen = {}
+            for libtype in ("track", "album"):
+                seen[libtype] = await self._sync_libtype(section, source, libtype, since)
+            loop = asyncio.get_running_loop()
+            if full:
+                await loop.run_in_executor(
+                    self._executor, self._prune, source, seen["track"], seen["album"]
+                )
+            await loop.run_in_executor(self._executor, self._mark_synced, source, started, full)
+            self._synced[source] = started
+            if full or seen["track"] or seen["album"]:
+                self._versions[source] += 1
+            log.debug(
+                "Synced %s (%s): %d tracks, %d albums",
+                source,
+                "full" if full else "incremental",
+                len(seen["track"]),
+                len(seen["album"]),
+            )
+
+    async def _sync_libtype(
+        self, section: AsyncMusicSection, source: str, libtype: str, since: Optional[datetime]
+    ) -> Set[int]:
+        kwargs = {}
+        if since is not None:
+            kwargs["filters"] = {
+                "or": [{f"{libtype}.updatedAt>>": since}, {f"{libtype}.addedAt>>": since}]
+            }
+        row_factory = self._track_row if libtype == "track" else self._album_row
+        writer = self._upsert_tracks if libtype == "track" else self._upsert_albums
+        loop = asyncio.get_running_loop()
+        seen = set()
+        start = 0
+        while True:
+            page = await section.server.run(
+                section.section.search,
+                libtype=libtype,
+                container_start=start,
+                maxresults=PAGE_SIZE,
+                **kwargs,
+            )
+            rows = [row_factory(source, item) for item in page]
+            seen.update(row[1] for row in rows)
+            await loop.run_in_executor(self._executor, writer, rows)
+            if len(page) < PAGE_SIZE:
+                return seen
+            start += PAGE_SIZE
+
+    @staticmethod
+    def _track_row(source: str, track) -> tuple:
+        return (
+            source,
+            int(track.ratingKey),
+            track.title or "",
+            track.titleSort,
+            track.parentTitle,
+            track.grandparentTitle,
+            track.parentRatingKey,
+            track.grandparentRatingKey,
+            track.duration,
+            _timestamp(track.updatedAt),
+        )
+
+    @staticmethod
+    def _album_row(source: str, album) -> tuple:
+        return (
+            source,
+            int(album.ratingKey),
+            album.title or "",
+            album.titleSort,
+            album.parentTitle,
+            album.parentRatingKey,
+            _timestamp(album.updatedAt),
+        )
+
+    # Everything below runs on the index thread.
+
+    def _open_writer(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = sqlite3.connect(str(self.path))
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        self._writer.execute("PRAGMA synchronous = NORMAL")
+        self._writer.executescript(_SCHEMA)
+        try:
+            for table, columns in _FTS_COLUMNS.items():
+                self._writer.executescript(
+                    _FTS_SCHEMA.format(
+                        table=table,
+                        columns=", ".join(columns),
+                        new=", ".join(f"new.{c}" for c in columns),
+                        old=", ".join(f"old.{c}" for c in columns),
+                    )
+                )
+        except sqlite3.OperationalError:
+            log.warning("SQLite was built without FTS5, falling back to LIKE searches")
+            self.fts = False
+        self._writer.commit()
+
+    def _titles(self, table: str, source: str) -> List[Tuple[str, Optional[str]]]:
+        return self._writer.execute(
+            f"SELECT title, artist_title FROM {table} WHERE source = ?", (source,)
+        ).fetchall()
+
+    def _close_writer(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def _upsert_tracks(self, rows: Iterable[tuple]):
+        with self._writer:
+            self._writer.executemany(
+                "INSERT INTO tracks (source, rating_key, title, title_sort, album_title, "
+                "artist_title, album_key, artist_key, duration, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (source, rating_key) DO UPDATE SET title = excluded.title, "
+                "title_sort = excluded.title_sort, album_title = excluded.album_title, "
+                "artist_title = excluded.artist_title, album_key = excluded.album_key, "
+                "artist_key = excluded.artist_key, duration = excluded.duration, "
+                "updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def _upsert_albums(self, rows: Iterable[tuple]):
+        with self._writer:
+            self._writer.executemany(
+                "INSERT INTO albums (source, rating_key, title, title_sort, artist_title, "
+                "artist_key, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (source, rating_key) DO UPDATE SET title = excluded.title, "
+                "title_sort = excluded.title_sort, artist_title = excluded.artist_title, "
+                "artist_key = excluded.artist_key, updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def _prune(self, source: str, tracks: Set[int], albums: Set[int]):
+        with self._writer:
+            for table, keep in (("tracks", tracks), ("albums", albums)):
+                stale = [
+                    (source, key)
+                    for (key,) in self._writer.execute(
+                        f"SELECT rating_key FROM {table} WHERE source = ?", (source,)
+                    )
+                    if key not in keep
+                ]
+                self._writer.executemany(
+                    f"DELETE FROM {table} WHERE source = ? AND rating_key = ?", stale
+                )
+
+    def _mark_synced(self, source: str, synced_at: int, full: bool):
+        with self._writer:
+            self._writer.execute(
+                "INSERT INTO sources (source, synced_at, full_synced_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (source) DO UPDATE SET synced_at = excluded.synced_at, "
+                "full_synced_at = CASE WHEN ? THEN excluded.full_synced_at "
+                "ELSE sources.full_synced_at END",
+                (source, synced_at, synced_at, full),
+            )
@@ -0,0 +1,383 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import struct
+import subprocess
+import threading
+import time
+from collections import Counter
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Set
+
+import discord
+import discord.opus
+
+log = logging.getLogger("red.plex-cogs.PlexMusic.workers")
+
+# Audio encoded ahead of playback per stream, every frame is 20ms.
+BUFFER_SECONDS = 5
+# Opus packets of a single 20ms frame are never larger than this.
+MAX_PACKET = 1275
+# How long the voice thread waits for a frame before giving up on the stream.
+READ_TIMEOUT = 10
+POLL_INTERVAL = 0.005
+# How often the supervisor looks for new workers to watch when none died.
+SUPERVISE_INTERVAL = 1.0
+
+RUNNING = 0
+FINISHED = 1
+FAILED = 2
+CLOSED = 1
+
+
+class FrameRing:
+    """Ring of Opus packets in shared memory, written by one process and read by another.
+
+    The header holds the number of packets written and read so far and the
+    state of both sides. Each counter has a single writer, and a packet is
+    written before the counter that publishes it, so neither side needs a
+    lock. Slots are a two byte length followed by the packet.
+    """
+
+    _COUNT = struct.Struct("<Q")
+    _LENGTH = struct.Struct("<H")
+    _WRITTEN = 0
+    _READ = 8
+    _PRODUCER = 16
+    _CONSUMER = 17
+    _HEADER = 64
+    _SLOT = _LENGTH.size + MAX_PACKET
+
+    def __init__(self, memory: shared_memory.SharedMemory, slots: int, owner: bool):
+        self.memory = memory
+        self.slots = slots
+        self.owner = owner
+        self._buffer = memory.buf
+
+    @classmethod
+    def create(cls, slots: int) -> "FrameRing":
+        size = cls._HEADER + slots * cls._SLOT
+        return cls(shared_memory.SharedMemory(create=True, size=size), slots, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, slots: int) -> "FrameRing":
+        return cls(shared_memory.SharedMemory(name=name), slots, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def written(self) -> int:
+        return self._COUNT.unpack_from(self._buffer, self._WRITTEN)[0]
+
+    @property
+    def read(self) -> int:
+        return self._COUNT.unpack_from(self._buffer, self._READ)[0]
+
+    @property
+    def buffered(self) -> int:
+        return self.written - self.read
+
+    @property
+    def state(self) -> int:
+        return self._buffer[self._PRODUCER]
+
+    @property
+    def closed(self) -> bool:
+        return self._buffer[self._CONSUMER] == CLOSED
+
+    def put(self, packet: bytes) -> bool:
+        """
+        Append a packet, waiting while the ring is full
+        Args:
+            packet: Opus packet of a single frame.
+        Returns:
+            False once the reader closed the ring, the packet is dropped.
+        """
+        written = self.written
+        while written - self.read >= self.slots:
+            if self.closed:
+                return False
+            time.sleep(POLL_INTERVAL)
+        offset = self._HEADER + written % self.slots * self._SLOT
+        self._LENGTH.pack_into(self._buffer, offset, len(packet))
+        self._buffer[offset + self._LENGTH.size : offset + self._LENGTH.size + len(packet)] = (
+            packet
+        )
+        self._COUNT.pack_into(self._buffer, self._WRITTEN, written + 1)
+        return not self.closed
+
+    def get(self) -> Optional[bytes]:
+        """The next packet, None if none was written yet."""
+        read = self.read
+        if self.written == read:
+            return None
+        offset = self._HEADER + read % self.slots * self._SLOT
+        (length,) = self._LENGTH.unpack_from(self._buffer, offset)
+        start = offset + self._LENGTH.size
+        packet = bytes(self._buffer[start : start + length])
+        self._COUNT.pack_into(self._buffer, self._READ, read + 1)
+        return packet
+
+    def finish(self, failed: bool = False):
+        """Tell the reader no more packets are coming."""
+        self._buffer[self._PRODUCER] = FAILED if failed else FINISHED
+
+    def drained(self) -> bool:
+        """Whether every packet was read and no more are coming."""
+        # The state is checked first, packets written before it changed are still counted.
+        return self.state != RUNNING and self.written == self.read
+
+    def close(self):
+        """Stop using the ring, the writer stops at its next packet."""
+        if self._buffer is None:
+            return
+        self._buffer[self._CONSUMER] = CLOSED
+        self._buffer = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def ffmpeg_args(url: str, before_options: Optional[str] = None) -> List[str]:
+    """The command `FFmpegPCMAudio` would run for `url`."""
+    args = ["ffmpeg"]
+    if before_options:
+        args.extend(before_options.split())
+    args.extend(("-i", url, "-f", "s16le", "-ar", "48000", "-ac", "2"))
+    args.extend(("-loglevel", "warning", "pipe:1"))
+    return args
+
+
+def _encode_stream(name: str, slots: int, args: List[str], bitrate: int):
+    """Decode a stream with FFmpeg and write its Opus packets into a ring, in a worker."""
+    ring = FrameRing.attach(name, slots)
+    process = None
+    failed = False
+    try:
+        encoder = discord.opus.Encoder()
+        encoder.set_bitrate(bitrate)
+        frame_size = encoder.FRAME_SIZE
+        process = subprocess.Popen(
+            args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        while len(pcm := process.stdout.read(frame_size)) == frame_size:
+            if not ring.put(encoder.encode(pcm, encoder.SAMPLES_PER_FRAME)):
+                break
+        else:
+            failed = process.wait() != 0
+    except Exception:
+        log.exception("Unable to encode %s", args)
+        failed = True
+    finally:
+        if process is not None:
+            process.kill()
+            process.wait()
+        ring.finish(failed)
+        ring.memory.close()
+
+
+def _worker_main(commands: multiprocessing.Queue, opus_library: Optional[str]):
+    """Encode every stream sent to this worker in a thread of its own until told to stop."""
+    # Rings are unlinked by the bot, which created them. Before Python 3.13 attaching to one
+    # registers it for cleanup a second time, which leaks warnings once the bot unlinked it.
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: (
+        None if rtype == "shared_memory" else register(name, rtype)
+    )
+    if not discord.opus.is_loaded():
+        if opus_library:
+            discord.opus.load_opus(opus_library)
+        else:
+            discord.opus._load_default()
+    while (command := commands.get()) is not None:
+        threading.Thread(target=_encode_stream, args=command, daemon=True).start()
+
+
+class _Worker:
+    __slots__ = ("process", "commands", "streams", "rings")
+
+    def __init__(self, context, opus_library: Optional[str]):
+        self.commands = context.Queue()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(self.commands, opus_library),
+            name="PlexMusic-audio",
+            daemon=True,
+        )
+        self.process.start()
+        self.streams = 0
+        # Rings of the streams it encodes, failed by the pool if the process dies.
+        self.rings: Set[FrameRing] = set()
+
+
+class WorkerAudio(discord.AudioSource):
+    """Opus packets encoded by an `AudioWorkerPool` process, read from their ring."""
+
+    def __init__(self, ring: FrameRing, pool: "AudioWorkerPool", worker: _Worker):
+        self.ring = ring
+        self.pool = pool
+        self.worker = worker
+        self._started = False
+
+    def read(self) -> bytes:
+        deadline = None
+        while (packet := self.ring.get()) is None:
+            if self.ring.drained():
+                if self.ring.state == FAILED:
+                    self.pool.stats["failed"] += 1
+                return b""
+            if deadline is None:
+                deadline = time.monotonic() + READ_TIMEOUT
+                # Waiting for the first frame is buffering, any later wait is audible.
+                self.pool.stats["underruns"] += self._started
+            elif time.monotonic() > deadline:
+                log.warning("No audio from the worker for %ss, ending the track", READ_TIMEOUT)
+                self.pool.stats["failed"] += 1
+                return b""
+            time.sleep(POLL_INTERVAL)
+        self._started = True
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        if self.worker is not None:
+            self.pool.release(self.worker, self.ring)
+            self.ring.close()
+            self.worker = None
+
+
+class AudioWorkerPool:
+    """Processes decoding and Opus encoding streams outside of the bot's process.
+
+    discord.py encodes PCM sources in the voice client's thread, so every
+    stream shares the bot's GIL and a single core. Streams handed to the
+    pool are decoded by FFmpeg and encoded by a worker process, which writes
+    the packets into a `FrameRing` the voice client reads them from as they
+    are, like any other Opus source. Streams go to the least busy worker,
+    capacity grows with the number of processes. A supervisor thread ends
+    the streams of a worker that died and starts a new one in its place.
+    """
+
+    def __init__(self, processes: Optional[int] = None, buffer_seconds: float = BUFFER_SECONDS):
+        self.processes = processes or os.cpu_count() or 1
+        self.slots = int(buffer_seconds * 50)
+        self.stats = Counter()
+        self._workers: List[_Worker] = []
+        # Forking would copy the bot and its threads, workers start from a fresh interpreter.
+        self._context = multiprocessing.get_context("spawn")
+        self._opus_library: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def available(self) -> bool:
+        """Whether any worker is running, none are while the only ones are being replaced."""
+        return any(worker.process.is_alive() for worker in self._workers)
+
+    def start(self):
+        """Start the worker processes, blocks while they spawn."""
+        # Workers load the same libopus as the bot.
+        self._opus_library = getattr(discord.opus._lib, "_name", None)
+        with self._lock:
+            while len(self._workers) < self.processes:
+                self._workers.append(_Worker(self._context, self._opus_library))
+        threading.Thread(target=self._supervise, name="PlexMusic-workers", daemon=True).start()
+        log.debug("Started %d audio workers", self.processes)
+
+    def source(
+        self, url: str, before_options: Optional[str] = None, bitrate: int = 128
+    ) -> WorkerAudio:
+        """
+        Start encoding a stream in the least busy worker
+        Args:
+            url: What FFmpeg reads the audio from.
+            before_options: FFmpeg options placed before its input, like `FFmpegPCMAudio`.
+            bitrate: Opus bitrate in kbps.
+        Returns:
+            WorkerAudio reading the packets of the stream.
+        Raises:
+            RuntimeError: No worker is running.
+        """
+        ring = FrameRing.create(self.slots)
+        with self._lock:
+            if not (workers := [w for w in self._workers if w.process.is_alive()]):
+                ring.close()
+                raise RuntimeError("No audio worker is running")
+            worker = min(workers, key=lambda w: w.streams)
+            worker.streams += 1
+            worker.rings.add(ring)
+        worker.commands.put((ring.name, self.slots, ffmpeg_args(url, before_options), bitrate))
+        self.stats["streams"] += 1
+        return WorkerAudio(ring, self, worker)
+
+    def release(self, worker: _Worker, ring: FrameRing):
+        """Forget a stream of a worker, before its ring is closed."""
+        with self._lock:
+            worker.streams -= 1
+            worker.rings.discard(ring)
+
+    def load(self) -> List[int]:
+        """Streams running in each worker."""
+        return [worker.streams for worker in self._workers]
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers, their current streams end
+        Args:
+            wait: Block until they exited, otherwise they are joined by a thread.
+        """
+        self._stopped.set()
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.commands.put(None)
+        if wait:
+            self._join(workers)
+        else:
+            threading.Thread(
+                target=self._join, args=(workers,), name="PlexMusic-workers-shutdown"
+            ).start()
+
+    @staticmethod
+    def _join(workers: List[_Worker]):
+        for worker in workers:
+            worker.process.join(timeout=1)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    # Everything below runs on the supervisor thread.
+
+    def _supervise(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                workers = {worker.process.sentinel: worker for worker in self._workers}
+            for sentinel in multiprocessing.connection.wait(list(workers), SUPERVISE_INTERVAL):
+                if not self._stopped.is_set():
+                    self._replace(workers[sentinel])
+
+    def _replace(self, dead: _Worker):
+        dead.process.join()
+        log.warning(
+            "Audio worker %s died with exit code %s, replacing it",
+            dead.process.pid,
+            dead.process.exitcode,
+        )
+        with self._lock:
+            # Its streams end right away instead of their voice clients waiting out READ_TIMEOUT.
+            for ring in dead.rings:
+                ring.finish(failed=True)
+            dead.rings.clear()
+        # Spawning takes a while, streams meanwhile go to the other workers.
+        replacement = _Worker(self._context, self._opus_library)
+        with self._lock:
+            if not self._stopped.is_set() and dead in self._workers:
+                self._workers[self._workers.index(dead)] = replacement
+                replacement = None
+        if replacement is not None:
+            replacement.commands.put(None)
+        self.stats["restarts"] += 1
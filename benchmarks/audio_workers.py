@@ -0,0 +1,119 @@
+"""Concurrent PCM streams the bot can encode, in its own process against worker processes.
+
+Decodes the same lossless sample in `--streams` concurrent streams and
+encodes every 20ms frame to Opus, reading frames as fast as possible. In
+bot mode each stream runs in a thread of the bot's process, like discord.py
+voice clients do for `FFmpegPCMAudio`. In workers mode the streams are
+encoded by an `AudioWorkerPool`. Capacity is how many streams would keep
+up with real time, the audio encoded per second of wall time.
+
+Requires ffmpeg and libopus.
+
+    python -m benchmarks.audio_workers --duration 30 --streams 1 2 4 8 16
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import discord
+import discord.opus
+from discord import FFmpegPCMAudio
+
+from PlexMusic.workers import AudioWorkerPool
+
+
+def make_sample(directory: Path, duration: int) -> Path:
+    flac = directory / "sample.flac"
+    # Pink noise, so the encoder doesn't get an easy signal.
+    signal = (
+        f"anoisesrc=color=pink:duration={duration}:sample_rate=48000,"
+        "aformat=channel_layouts=stereo"
+    )
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", signal, str(flac)], check=True
+    )
+    return flac
+
+
+def encode_in_bot(path: str, bitrate: int) -> int:
+    source = FFmpegPCMAudio(path)
+    encoder = discord.opus.Encoder()
+    encoder.set_bitrate(bitrate)
+    frames = 0
+    while data := source.read():
+        # What `VoiceClient.send_audio_packet` does for sources that aren't Opus.
+        encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+        frames += 1
+    source.cleanup()
+    return frames
+
+
+def encode_in_workers(pool: AudioWorkerPool) -> Callable[[str, int], int]:
+    def encode(path: str, bitrate: int) -> int:
+        source = pool.source(path, bitrate=bitrate)
+        frames = 0
+        while source.read():
+            frames += 1
+        source.cleanup()
+        return frames
+
+    return encode
+
+
+def run(encode: Callable[[str, int], int], path: str, streams: int, bitrate: int) -> float:
+    """Seconds of audio encoded per second of wall time across `streams` streams."""
+    frames: List[int] = []
+    threads = [
+        threading.Thread(target=lambda: frames.append(encode(path, bitrate)))
+        for _ in range(streams)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Every frame is 20ms of audio.
+    return sum(frames) * 0.02 / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=int, default=30, help="Sample length in seconds.")
+    parser.add_argument("--bitrate", type=int, default=96, help="Voice bitrate in kbps.")
+    parser.add_argument(
+        "--streams", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Concurrent streams."
+    )
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(), help="Worker processes of the pool."
+    )
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+
+    pool = AudioWorkerPool(args.processes)
+    pool.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(make_sample(Path(directory), args.duration))
+            modes = {"bot": encode_in_bot, "workers": encode_in_workers(pool)}
+            print(f"{args.processes} workers, {os.cpu_count()} cores")
+            print(f"{'streams':>8} {'bot capacity':>13} {'workers capacity':>17}")
+            for streams in args.streams:
+                capacity = {
+                    mode: run(encode, path, streams, args.bitrate)
+                    for mode, encode in modes.items()
+                }
+                print(f"{streams:>8} {capacity['bot']:>13.1f} {capacity['workers']:>17.1f}")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""A local aiohttp server speaking enough of the Plex XML API for the cog.
+
+The library is synthetic and generated on the fly from item numbers, so it
+can hold hundreds of thousands of tracks without building them up front:
+
+- track `i` is on album `i // TRACKS_PER_ALBUM`,
+- album `a` is by artist `a // ALBUMS_PER_ARTIST`,
+- playlist `n` holds the first `PLAYLIST_SIZES[n]` tracks.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+from aiohttp import web
+
+MACHINE_IDENTIFIER = "fake-plex-benchmark"
+SECTION_KEY = "1"
+TRACKS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 8
+PLAYLIST_SIZES = (100, 1000, 5000)
+# Items are numbered from these offsets so ratingKeys never collide.
+TRACK_BASE = 1_000_000
+ALBUM_BASE = 100_000
+ARTIST_BASE = 10_000
+PLAYLIST_BASE = 1_000
+ADDED_AT = 1_600_000_000
+TYPE_ARTIST, TYPE_ALBUM, TYPE_TRACK = 8, 9, 10
+
+WORDS = (
+    "after all along alone angel away baby back beautiful black blue broken burning "
+    "call city cold crazy dance dark days dead deep down dream easy electric empty "
+    "end eyes fall fire forever free game ghost girl gold golden good gone green "
+    "heart heaven high home hope last light little lonely long love lost midnight "
+    "moon never night ocean only paradise rain red river road run shadow silver sky "
+    "song soul stars stay stone storm summer sun sweet time tonight walk water white "
+    "wild wind world young"
+).split()
+
+# Stand-in artwork, the cog only stores and forwards the bytes.
+JPEG = b"\xff\xd8\xff\xe0" + bytes(2048) + b"\xff\xd9"
+
+# Just enough of the filter metadata for plexapi to validate the searches the cog makes.
+META = """<Meta>
+<Type key="/library/sections/1/all?type=10" type="track" title="Tracks" active="0">
+<Field key="track.title" title="Track Title" type="string"/>
+<Field key="track.addedAt" title="Date Added" type="date"/>
+<Sort key="titleSort" title="Title" defaultDirection="asc" descKey="titleSort:desc"/>
+</Type>
+<Type key="/library/sections/1/all?type=9" type="album" title="Albums" active="0">
+<Field key="album.title" title="Album Title" type="string"/>
+<Field key="album.addedAt" title="Date Added" type="date"/>
+<Sort key="titleSort" title="Title" defaultDirection="asc" descKey="titleSort:desc"/>
+</Type>
+<FieldType type="string">
+<Operator key="=" title="contains"/><Operator key="!=" title="does not contain"/>
+<Operator key="==" title="is"/><Operator key="!==" title="is not"/>
+</FieldType>
+<FieldType type="date">
+<Operator key="&lt;&lt;=" title="is before"/><Operator key="&gt;&gt;=" title="is after"/>
+</FieldType>
+<FieldType type="integer">
+<Operator key="=" title="is"/><Operator key="&gt;&gt;=" title="is greater than"/>
+<Operator key="&lt;&lt;=" title="is less than"/>
+</FieldType>
+</Meta>"""
+
+
+def _words(i: int) -> str:
+    return f"{WORDS[i % len(WORDS)]} {WORDS[(i // len(WORDS)) % len(WORDS)]}".title()
+
+
+class SyntheticLibrary:
+    def __init__(self, tracks: int):
+        self.tracks = tracks
+        self.albums = -(-tracks // TRACKS_PER_ALBUM)
+        self.artists = -(-self.albums // ALBUMS_PER_ARTIST)
+        self.playlists = [size for size in PLAYLIST_SIZES if size <= tracks] or [tracks]
+        self._track_titles = {self.track_title(i).lower(): i for i in range(tracks)}
+        self._album_titles = {self.album_title(a).lower(): a for a in range(self.albums)}
+
+    @staticmethod
+    def track_title(i: int) -> str:
+        return f"{_words(i)} {i}"
+
+    @staticmethod
+    def album_title(a: int) -> str:
+        return f"{_words(a * 7)} Album {a}"
+
+    @staticmethod
+    def artist_title(r: int) -> str:
+        return f"The {_words(r * 13)} {r}"
+
+    @staticmethod
+    def playlist_title(size: int) -> str:
+        return f"Playlist {size}"
+
+    def search(self, titles: Dict[str, int], title: Optional[str], libtype: int) -> List[int]:
+        """
+        Numbers of the items matching `title`
+        An exact title is looked up directly, anything else falls back to a
+        substring scan, so the stub stays out of the way of what's measured.
+        """
+        count = self.tracks if libtype == TYPE_TRACK else self.albums
+        if title is None:
+            return list(range(count))
+        title = title.lower()
+        if (exact := titles.get(title)) is not None:
+            return [exact]
+        name = self.track_title if libtype == TYPE_TRACK else self.album_title
+        return [i for i in range(count) if title in name(i).lower()]
+
+    def track_xml(self, i: int) -> str:
+        album = i // TRACKS_PER_ALBUM
+        artist = album // ALBUMS_PER_ARTIST
+        key = TRACK_BASE + i
+        parent = ALBUM_BASE + album
+        grandparent = ARTIST_BASE + artist
+        title = self.track_title(i)
+        return (
+            f'<Track ratingKey="{key}" key="/library/metadata/{key}" type="track" '
+            f'guid="plex://track/{key:024x}" title={quoteattr(title)} '
+            f'titleSort={quoteattr(title)} parentRatingKey="{parent}" '
+            f'parentKey="/library/metadata/{parent}" '
+            f"parentTitle={quoteattr(self.album_title(album))} "
+            f'grandparentRatingKey="{grandparent}" '
+            f'grandparentKey="/library/metadata/{grandparent}" '
+            f"grandparentTitle={quoteattr(self.artist_title(artist))} "
+            f'index="{i % TRACKS_PER_ALBUM + 1}" parentIndex="1" '
+            f'duration="{180000 + i % 97 * 1000}" '
+            f'thumb="/library/metadata/{parent}/thumb/{ADDED_AT}" '
+            f'parentThumb="/library/metadata/{parent}/thumb/{ADDED_AT}" '
+            f'grandparentThumb="/library/metadata/{grandparent}/thumb/{ADDED_AT}" '
+            f'addedAt="{ADDED_AT}" updatedAt="{ADDED_AT}">'
+            f'<Media id="{key}" duration="180000" bitrate="1024" audioChannels="2" '
+            f'audioCodec="flac" container="flac">'
+            f'<Part id="{key}" key="/library/parts/{key}/{ADDED_AT}/file.flac" '
+            f'duration="180000" container="flac" size="23040000"/></Media></Track>'
+        )
+
+    def album_xml(self, a: int) -> str:
+        key = ALBUM_BASE + a
+        artist = a // ALBUMS_PER_ARTIST
+        title = self.album_title(a)
+        leaves = min(TRACKS_PER_ALBUM, self.tracks - a * TRACKS_PER_ALBUM)
+        return (
+            f'<Directory ratingKey="{key}" key="/library/metadata/{key}/children" type="album" '
+            f'guid="plex://album/{key:024x}" '
+            f"title={quoteattr(title)} titleSort={quoteattr(title)} "
+            f'parentRatingKey="{ARTIST_BASE + artist}" '
+            f"parentTitle={quoteattr(self.artist_title(artist))} "
+            f'leafCount="{leaves}" thumb="/library/metadata/{key}/thumb/{ADDED_AT}" '
+            f'addedAt="{ADDED_AT}" updatedAt="{ADDED_AT}"/>'
+        )
+
+    def artist_xml(self, r: int) -> str:
+        key = ARTIST_BASE + r
+        title = self.artist_title(r)
+        return (
+            f'<Directory ratingKey="{key}" key="/library/metadata/{key}/children" type="artist" '
+            f"title={quoteattr(title)} titleSort={quoteattr(title)} "
+            f'thumb="/library/metadata/{key}/thumb/{ADDED_AT}" '
+            f'addedAt="{ADDED_AT}" updatedAt="{ADDED_AT}"/>'
+        )
+
+    def playlist_xml(self, n: int) -> str:
+        key = PLAYLIST_BASE + n
+        size = self.playlists[n]
+        return (
+            f'<Playlist ratingKey="{key}" key="/playlists/{key}/items" type="playlist" '
+            f'title={quoteattr(self.playlist_title(size))} playlistType="audio" smart="0" '
+            f'leafCount="{size}" duration="{size * 180000}" '
+            f'composite="/playlists/{key}/composite/{ADDED_AT}" '
+            f'addedAt="{ADDED_AT}" updatedAt="{ADDED_AT}"/>'
+        )
+
+    def item_xml(self, rating_key: int) -> Optional[str]:
+        if TRACK_BASE <= rating_key < TRACK_BASE + self.tracks:
+            return self.track_xml(rating_key - TRACK_BASE)
+        if ALBUM_BASE <= rating_key < ALBUM_BASE + self.albums:
+            return self.album_xml(rating_key - ALBUM_BASE)
+        if ARTIST_BASE <= rating_key < ARTIST_BASE + self.artists:
+            return self.artist_xml(rating_key - ARTIST_BASE)
+        return None
+
+
+def _container(elements: Iterable[str], total: Optional[int] = None, **attrs) -> web.Response:
+    elements = list(elements)
+    attrs.setdefault("size", len(elements))
+    if total is not None:
+        attrs["totalSize"] = total
+    attributes = " ".join(f"{k}={quoteattr(str(v))}" for k, v in attrs.items())
+    body = f'<?xml version="1.0" encoding="UTF-8"?>\n<MediaContainer {attributes}>'
+    return web.Response(
+        text=body + "".join(elements) + "</MediaContainer>", content_type="text/xml"
+    )
+
+
+def _window(request: web.Request, total: int) -> Tuple[int, int]:
+    start = int(request.query.get("X-Plex-Container-Start", 0))
+    size = int(request.query.get("X-Plex-Container-Size", total))
+    return start, min(start + size, total)
+
+
+def make_app(library: SyntheticLibrary) -> web.Application:
+    routes = web.RouteTableDef()
+
+    @routes.get("/")
+    async def root(request):
+        return _container(
+            [],
+            friendlyName="Benchmark",
+            machineIdentifier=MACHINE_IDENTIFIER,
+            version="1.25.0.5282",
+            platform="Linux",
+            myPlex="0",
+        )
+
+    @routes.get("/library")
+    async def library_root(request):
+        return _container(['<Directory key="sections" title="Library Sections"/>'])
+
+    @routes.get("/library/sections")
+    async def sections(request):
+        return _container(
+            [
+                f'<Directory key="{SECTION_KEY}" type="artist" title="Music" '
+                'agent="tv.plex.agents.music" scanner="Plex Music" language="en-US" '
+                'uuid="00000000-0000-0000-0000-000000000001" '
+                f'updatedAt="{ADDED_AT}" createdAt="{ADDED_AT}"/>'
+            ]
+        )
+
+    @routes.get("/library/sections/{section}/collections")
+    async def collections(request):
+        return _container([])
+
+    @routes.get("/library/sections/{section}/all")
+    async def section_all(request):
+        query = request.query
+        if query.get("includeMeta") == "1":
+            return _container([META])
+        libtype = int(query.get("type", TYPE_TRACK))
+        if libtype not in (TYPE_TRACK, TYPE_ALBUM):
+            return _container([], total=0)
+        # Every synthetic item was added at ADDED_AT, nothing is newer than a sync.
+        if any(re.search(r"(updatedAt|addedAt)>>$", key) for key in query):
+            if all(int(v) >= ADDED_AT for k, v in query.items() if k.endswith(">>")):
+                return _container([], total=0)
+        title = next(
+            (v for k, v in query.items() if k in ("title", "track.title", "album.title")), None
+        )
+        if libtype == TYPE_TRACK:
+            found = library.search(library._track_titles, title, libtype)
+            render = library.track_xml
+        else:
+            found = library.search(library._album_titles, title, libtype)
+            render = library.album_xml
+        start, end = _window(request, len(found))
+        return _container(
+            (render(i) for i in found[start:end]),
+            total=len(found),
+            librarySectionID=SECTION_KEY,
+        )
+
+    @routes.get("/library/metadata/{keys}")
+    async def metadata(request):
+        elements = (library.item_xml(int(k)) for k in request.match_info["keys"].split(","))
+        return _container(e for e in elements if e)
+
+    @routes.get("/library/metadata/{key}/children")
+    async def children(request):
+        album = int(request.match_info["key"]) - ALBUM_BASE
+        first = album * TRACKS_PER_ALBUM
+        tracks = list(range(first, min(first + TRACKS_PER_ALBUM, library.tracks)))
+        start, end = _window(request, len(tracks))
+        return _container((library.track_xml(i) for i in tracks[start:end]), total=len(tracks))
+
+    @routes.get("/playlists")
+    async def playlists(request):
+        title = request.query.get("title", "").lower()
+        return _container(
+            library.playlist_xml(n)
+            for n, size in enumerate(library.playlists)
+            if title in library.playlist_title(size).lower()
+        )
+
+    @routes.get("/playlists/{key}/items")
+    async def playlist_items(request):
+        size = library.playlists[int(request.match_info["key"]) - PLAYLIST_BASE]
+        start, end = _window(request, size)
+        return _container((library.track_xml(i) for i in range(start, end)), total=size)
+
+    @routes.get("/photo/:/transcode")
+    async def transcode_image(request):
+        return web.Response(body=JPEG, content_type="image/jpeg")
+
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+async def start(library: SyntheticLibrary, host: str = "127.0.0.1") -> Tuple[web.AppRunner, str]:
+    """Serve `library` on a free local port, returns the runner and the base url."""
+    runner = web.AppRunner(make_app(library), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
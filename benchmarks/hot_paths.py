@@ -0,0 +1,233 @@
+"""Timings of the cog's hot paths against a local fake Plex server.
+
+Starts `benchmarks.fake_plex` with a synthetic library, builds the cog
+around it with fake Discord objects and times searches, embeds and the
+queuing of albums and playlists. Nothing leaves the machine. Results are
+written as JSON, pass a previous file as `--baseline` to compare.
+
+    python -m benchmarks.hot_paths --tracks 10000 --output before.json
+    python -m benchmarks.hot_paths --tracks 10000 --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List
+from unittest import mock
+
+import plexapi
+
+from PlexMusic import plex_music
+from PlexMusic.async_plex import AsyncPlexServer
+
+from . import fake_plex
+
+BOT_ID = 1
+USER_ID = 2
+GUILD_ID = 3
+
+
+class FakeMessage:
+    async def delete(self):
+        pass
+
+
+class FakeContext:
+    """The parts of `commands.Context` the cog's helpers touch."""
+
+    def __init__(self):
+        self.author = SimpleNamespace(id=USER_ID, name="benchmark", voice=None)
+        self.guild = SimpleNamespace(id=GUILD_ID, me=SimpleNamespace(voice=None))
+        self.sent = 0
+
+    async def send(self, *args, **kwargs) -> FakeMessage:
+        self.sent += 1
+        return FakeMessage()
+
+
+async def make_cog(url: str, data_path: Path) -> plex_music.PlexMusic:
+    """Build the cog around the fake server without a running Red instance."""
+    bot = SimpleNamespace(user=SimpleNamespace(id=BOT_ID, name="Benchmark"))
+    # Config and the data path need Red's data manager, the hot paths don't use either.
+    with mock.patch.object(plex_music.Config, "get_conf"), mock.patch.object(
+        plex_music, "cog_data_path", return_value=data_path
+    ):
+        cog = plex_music.PlexMusic(bot)
+    server = await cog.connections.connect(url, "benchmark", pinned=True)
+    section = await server.music_section()
+    for user_id in (BOT_ID, USER_ID):
+        cog.pms_cache[user_id] = server
+        cog.music_library[user_id] = section
+    await cog.track_index.initialize()
+    # Only time actual lookups, repeated searches would otherwise be answered from the memo.
+    cog.searches.ttl = 0
+    # Players aren't started, so queued entries stay queued and nothing tries to play.
+    cog.players.start = cog.players.get
+    cog.cog_ready_event.set()
+    return cog
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_ms": samples[0] * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[math.ceil(len(samples) * 0.95) - 1] * 1000,
+        "mean_ms": statistics.mean(samples) * 1000,
+    }
+
+
+async def timed(func: Callable[[int], Awaitable], repeat: int) -> Dict[str, float]:
+    """Time `func(i)` `repeat` times after one warm up call."""
+    await func(-1)
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        await func(i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def run(tracks: int, repeat: int, index: bool) -> Dict[str, Dict[str, float]]:
+    library = fake_plex.SyntheticLibrary(tracks)
+    runner, url = await fake_plex.start(library)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cog = await make_cog(url, Path(directory))
+        ctx = FakeContext()
+        server: AsyncPlexServer = cog.pms_cache[USER_ID]
+        section = cog.music_library[USER_ID]
+        # Spread the lookups over the library so caches don't answer everything.
+        step = max(tracks // (repeat + 1), 1)
+
+        def track_title(i: int) -> str:
+            return library.track_title((i + 1) * step % tracks)
+
+        def album_title(i: int) -> str:
+            return library.album_title((i + 1) * step // fake_plex.TRACKS_PER_ALBUM)
+
+        async def search_tracks(i):
+            await cog._search_tracks(ctx, track_title(i))
+
+        async def search_tracks_artist(i):
+            n = (i + 1) * step % tracks
+            artist = n // fake_plex.TRACKS_PER_ALBUM // fake_plex.ALBUMS_PER_ARTIST
+            await cog._search_tracks(ctx, library.track_title(n), library.artist_title(artist))
+
+        async def search_albums(i):
+            await cog._search_albums(ctx, album_title(i))
+
+        async def search_playlists(i):
+            await cog._search_playlists(ctx, library.playlist_title(library.playlists[-1]))
+
+        results["search_tracks[live]"] = await timed(search_tracks, repeat)
+        results["search_tracks_artist[live]"] = await timed(search_tracks_artist, repeat)
+        results["search_albums[live]"] = await timed(search_albums, repeat)
+        results["search_playlists"] = await timed(search_playlists, repeat)
+
+        if index:
+            start = time.perf_counter()
+            await cog.track_index.sync(section)
+            results["index_sync"] = summarize([time.perf_counter() - start])
+            results["search_tracks[index]"] = await timed(search_tracks, repeat)
+            results["search_albums[index]"] = await timed(search_albums, repeat)
+
+        track = (await section.search_tracks(title=track_title(0), maxresults=1))[0]
+        album = (await section.search_albums(title=album_title(0), maxresults=1))[0]
+        playlist = await server.playlist(library.playlist_title(library.playlists[-1]))
+
+        async def embed_track(i):
+            await cog._build_embed_track(track)
+
+        async def embed_album(i):
+            await cog._build_embed_album(album)
+
+        async def embed_playlist(i):
+            await cog._build_embed_playlist(ctx, playlist)
+
+        results["build_embed_track"] = await timed(embed_track, repeat)
+        results["build_embed_album"] = await timed(embed_album, repeat)
+        results["build_embed_playlist"] = await timed(embed_playlist, repeat)
+
+        player = cog.players.get(GUILD_ID)
+
+        async def queue_all(container):
+            player.clear()
+            await cog._queue_container(ctx, container, time.perf_counter())
+            await asyncio.gather(*player._feeders)
+
+        async def queue_album(i):
+            await queue_all(album)
+
+        results["queue_album"] = await timed(queue_album, repeat)
+        for size in library.playlists:
+            playlist = await server.playlist(library.playlist_title(size))
+
+            async def queue_playlist(i):
+                await queue_all(playlist)
+
+            async def queue_playlist_first_page(i):
+                player.clear()
+                await cog._queue_container(ctx, playlist, time.perf_counter())
+                player.cancel_feeders()
+
+            results[f"queue_playlist[{size}]"] = await timed(queue_playlist, max(repeat // 4, 1))
+            results[f"queue_playlist_first_page[{size}]"] = await timed(
+                queue_playlist_first_page, repeat
+            )
+        player.clear()
+        cog.cog_unload()
+        await asyncio.sleep(0)
+    await runner.cleanup()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=10000, help="Size of the library.")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per benchmark.")
+    parser.add_argument("--no-index", action="store_true", help="Skip the local index runs.")
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=Path, help="JSON results to compare against.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.tracks, args.repeat, not args.no_index))
+    report = {
+        "commit": git_commit(),
+        "tracks": args.tracks,
+        "python": platform.python_version(),
+        "plexapi": plexapi.VERSION,
+        "results": results,
+    }
+    baseline = json.loads(args.baseline.read_text())["results"] if args.baseline else {}
+
+    print(f"{'benchmark':<34} {'median (ms)':>12} {'p95 (ms)':>10} {'vs baseline':>12}")
+    for name, stats in results.items():
+        change = ""
+        if name in baseline:
+            change = f"{stats['median_ms'] / baseline[name]['median_ms']:>11.2f}x"
+        print(f"{name:<34} {stats['median_ms']:>12.2f} {stats['p95_ms']:>10.2f} {change:>12}")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
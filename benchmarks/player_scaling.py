@@ -0,0 +1,70 @@
+"""Inter-track gap of the per-guild players as the number of guilds grows.
+
+Every simulated guild gets a fake voice client whose tracks end after a
+fixed duration, the gap is the time between a track ending and the next
+one being handed to the voice client.
+
+    python -m benchmarks.player_scaling --guilds 1 10 100 1000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from PlexMusic.player import PlayerManager
+
+
+async def run(guilds: int, tracks: int, duration: float) -> List[float]:
+    gaps: List[float] = []
+    ended_at: Dict[int, float] = {}
+    done = asyncio.Event()
+    remaining = guilds * tracks
+    loop = asyncio.get_running_loop()
+
+    async def play(guild_id: int, item, prepared):
+        nonlocal remaining
+        if guild_id in ended_at:
+            gaps.append(time.perf_counter() - ended_at.pop(guild_id))
+        remaining -= 1
+        # Jitter the length so guilds don't all finish in the same loop iteration.
+        loop.call_later(duration * random.uniform(0.5, 1.5), finish, guild_id)
+
+    def finish(guild_id: int):
+        # Mirrors `_toggle_next`, which discord.py calls from the player thread.
+        ended_at[guild_id] = time.perf_counter()
+        manager.notify_finished(guild_id)
+        if not remaining and len(ended_at) == guilds:
+            done.set()
+
+    manager = PlayerManager(play)
+    for guild_id in range(guilds):
+        player = manager.start(guild_id)
+        for item in range(tracks):
+            player.queue.put_nowait(item)
+    await done.wait()
+    manager.shutdown()
+    return gaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--tracks", type=int, default=10, help="Tracks queued per guild.")
+    parser.add_argument("--duration", type=float, default=0.05, help="Track length in seconds.")
+    args = parser.parse_args()
+
+    print(f"{'guilds':>8} {'median gap (ms)':>16} {'p99 gap (ms)':>13} {'max gap (ms)':>13}")
+    for guilds in args.guilds:
+        gaps = sorted(asyncio.run(run(guilds, args.tracks, args.duration)))
+        p99 = gaps[int(len(gaps) * 0.99) - 1] if len(gaps) > 1 else gaps[0]
+        print(
+            f"{guilds:>8} {statistics.median(gaps) * 1000:>16.3f} "
+            f"{p99 * 1000:>13.3f} {gaps[-1] * 1000:>13.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Memory held per queued track, full plexapi Tracks against queue entries.
+
+Tracks are built from the XML Plex returns for a playlist item, which is
+what used to sit in the queue until it was played.
+
+    python -m benchmarks.queue_memory --tracks 1000 10000
+"""
+
+import argparse
+import asyncio
+import gc
+import tracemalloc
+from typing import Callable, List
+from xml.etree import ElementTree
+
+from plexapi.audio import Track
+
+from PlexMusic.queue import PlayQueue, QueueEntry
+
+TRACK_XML = """
+<Track ratingKey="{key}" key="/library/metadata/{key}" parentRatingKey="{parent}"
+    grandparentRatingKey="{grandparent}" guid="plex://track/5d07cdf6403c640290f{key:06x}"
+    parentGuid="plex://album/5d07c1a1403c640290b{parent:06x}"
+    grandparentGuid="plex://artist/5d07bbfc403c6402904{grandparent:06x}" type="track"
+    title="Track number {key} of the playlist" grandparentKey="/library/metadata/{grandparent}"
+    parentKey="/library/metadata/{parent}" librarySectionTitle="Music" librarySectionID="3"
+    librarySectionKey="/library/sections/3" grandparentTitle="Some Artist {grandparent}"
+    parentTitle="Some Album {parent}" summary="" index="{index}" parentIndex="1"
+    ratingCount="1205" parentYear="2011" thumb="/library/metadata/{parent}/thumb/1609286512"
+    art="/library/metadata/{grandparent}/art/1609286512"
+    parentThumb="/library/metadata/{parent}/thumb/1609286512"
+    grandparentThumb="/library/metadata/{grandparent}/thumb/1609286512"
+    grandparentArt="/library/metadata/{grandparent}/art/1609286512" playlistItemID="{key}"
+    duration="234000" addedAt="1609286496" updatedAt="1609286512" musicAnalysisVersion="1">
+  <Media id="{key}" duration="234000" bitrate="320" audioChannels="2" audioCodec="mp3"
+      container="mp3">
+    <Part id="{key}" key="/library/parts/{key}/1609286496/file.mp3" duration="234000"
+        file="/data/music/Some Artist {grandparent}/Some Album {parent}/{index:02} Track.mp3"
+        size="9372480" container="mp3" hasThumbnail="1" />
+  </Media>
+</Track>
+"""
+
+
+def make_tracks(count: int, start: int = 0) -> List[Track]:
+    return [
+        Track(
+            None,
+            ElementTree.fromstring(
+                TRACK_XML.format(
+                    key=100000 + i,
+                    parent=50000 + i // 12,
+                    grandparent=20000 + i // 120,
+                    index=i % 12,
+                )
+            ),
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def measure(build: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    held = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'tracks':>8} {'Track (B/entry)':>16} {'QueueEntry (B/entry)':>21} {'ratio':>7}")
+    for count in args.tracks:
+
+        def tracks_queue():
+            queue = asyncio.Queue()
+            for track in make_tracks(count):
+                queue.put_nowait(track)
+            return queue
+
+        def entries_queue():
+            queue = PlayQueue()
+            # Tracks only live for the page they arrived in, like in `_track_pages`.
+            for start in range(0, count, 200):
+                for track in make_tracks(min(200, count - start), start):
+                    queue.append(QueueEntry.from_track(track))
+            return queue
+
+        full = measure(tracks_queue) / count
+        compact = measure(entries_queue) / count
+        print(f"{count:>8} {full:>16.0f} {compact:>21.0f} {full / compact:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Stutter and truncation of a track served by a flaky server, with and without read-ahead.
+
+Serves a generated sample from a local aiohttp server at `--speed` times
+real time, which stalls for `--stall` seconds halfway into the track and
+drops the connection three quarters in, the first time only. The track is
+decoded by FFmpeg reading the url directly, like `FFmpegPCMAudio(track_url)`,
+and through a `ReadAheadStream`. Frames are read at the pace of a voice
+client, a frame that isn't there within its 20ms is late and the time
+spent waiting for it is silence.
+
+Requires ffmpeg.
+
+    python -m benchmarks.read_ahead --duration 30 --stall 3
+"""
+
+import argparse
+import asyncio
+import re
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict
+
+from aiohttp import ClientSession, web
+from discord import AudioSource, FFmpegPCMAudio
+
+from PlexMusic.buffering import ReadAheadPCMAudio, ReadAheadStream
+
+BITRATE = 128
+FRAME = 0.02
+_RANGE_RE = re.compile(r"bytes=(\d+)-")
+
+
+def make_sample(directory: Path, duration: int) -> bytes:
+    path = directory / "sample.ogg"
+    signal = f"anoisesrc=color=pink:duration={duration}:sample_rate=48000"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", signal]
+        + ["-c:a", "libopus", "-b:a", f"{BITRATE}k", str(path)],
+        check=True,
+    )
+    return path.read_bytes()
+
+
+def flaky_app(data: bytes, stall: float, speed: float) -> web.Application:
+    """Serves `data` with range support, stalling and dropping the connection once each."""
+    faults = {"stall": len(data) // 2, "drop": len(data) * 3 // 4}
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        match = _RANGE_RE.match(request.headers.get("Range", ""))
+        start = int(match.group(1)) if match else 0
+        response = web.StreamResponse(status=206 if match else 200)
+        response.content_length = len(data) - start
+        if match:
+            response.headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+        await response.prepare(request)
+        position = start
+        while position < len(data):
+            end = min(position + 16 * 1024, len(data))
+            if (fault := faults.get("stall")) is not None and position <= fault < end:
+                del faults["stall"]
+                await asyncio.sleep(stall)
+            if (fault := faults.get("drop")) is not None and position <= fault < end:
+                del faults["drop"]
+                request.transport.close()
+                return response
+            await response.write(data[position:end])
+            await asyncio.sleep((end - position) / (BITRATE * 125) / speed)
+            position = end
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/track", handler)
+    return app
+
+
+def play(source: AudioSource) -> Dict[str, float]:
+    """Read frames at the pace of a voice client, counting the late ones."""
+    frames = late = silence = 0
+    start = time.perf_counter()
+    while True:
+        # Like discord.py's AudioPlayer, a late frame delays the ones after it.
+        delay = start + frames * FRAME - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            start -= delay
+        read_at = time.perf_counter()
+        if not source.read():
+            break
+        frames += 1
+        if (waited := time.perf_counter() - read_at) > FRAME:
+            late += 1
+            silence += waited
+    source.cleanup()
+    return {"seconds": frames * FRAME, "late": late, "silence": silence}
+
+
+async def run(
+    data: bytes, stall: float, speed: float, make: Callable[[str], AudioSource]
+) -> Dict[str, float]:
+    runner = web.AppRunner(flaky_app(data, stall, speed), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/track"
+    try:
+        source = make(url)
+        return await asyncio.get_running_loop().run_in_executor(None, play, source)
+    finally:
+        await runner.cleanup()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=int, default=30, help="Sample length in seconds.")
+    parser.add_argument("--stall", type=float, default=3, help="Seconds the server stalls.")
+    parser.add_argument("--speed", type=float, default=4, help="Serving speed, 1 is real time.")
+    parser.add_argument("--read-ahead", type=float, default=20, help="Read-ahead in seconds.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        data = make_sample(Path(directory), args.duration)
+    stats = Counter()
+    async with ClientSession() as session:
+        modes = {
+            "direct": lambda url: FFmpegPCMAudio(url),
+            "read-ahead": lambda url: ReadAheadPCMAudio(
+                ReadAheadStream(session, url, BITRATE, args.read_ahead, stats)
+            ),
+        }
+        print(f"{args.duration}s track, {args.stall}s stall and a dropped connection")
+        print(f"{'source':<11} {'played':>8} {'late frames':>12} {'silence':>9}")
+        for mode, make in modes.items():
+            result = await run(data, args.stall, args.speed, make)
+            print(
+                f"{mode:<11} {result['seconds']:>7.1f}s {result['late']:>12} "
+                f"{result['silence']:>8.2f}s"
+            )
+    print(f"read-ahead: {stats['reconnects']} reconnects, {stats['underruns']} underruns")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
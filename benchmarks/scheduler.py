@@ -0,0 +1,92 @@
+"""Wait of interactive Plex calls while another guild floods the same server.
+
+One guild queues `--flood` background calls, like queuing the rest of a
+huge playlist, while other guilds make a few interactive calls and a
+stream lookup for playback every so often. Every call sleeps `--latency`
+seconds in an executor of `--workers` threads, like a Plex request would.
+Without the scheduler every call waits in the thread pool's own queue in
+the order it was made, with it calls start by priority and guilds take
+turns.
+
+    python -m benchmarks.scheduler --flood 500 --workers 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+from PlexMusic.async_plex import PlexExecutor
+from PlexMusic.scheduling import Priority, request_context
+
+FLOODING_GUILD = 1
+GUILDS = (2, 3, 4)
+
+
+async def call(
+    executor: PlexExecutor, latency: float, guild_id: int, priority: Priority, waits: List[float]
+):
+    with request_context(guild_id=guild_id, priority=priority):
+        start = time.perf_counter()
+        await executor.run(time.sleep, latency, timeout=3600)
+        waits.append(time.perf_counter() - start - latency)
+
+
+async def run(args: argparse.Namespace, fair: bool) -> Dict[str, List[float]]:
+    executor = PlexExecutor("bench", args.workers, 3600)
+    if not fair:
+        # Let every call through to the thread pool, which runs them first come first served.
+        executor.scheduler.limit = 1 << 30
+    waits = {priority.name.lower(): [] for priority in Priority}
+    tasks = [
+        asyncio.create_task(
+            call(executor, args.latency, FLOODING_GUILD, Priority.BACKGROUND, waits["background"])
+        )
+        for _ in range(args.flood)
+    ]
+    for _ in range(args.rounds):
+        await asyncio.sleep(args.latency * 5)
+        for guild_id in GUILDS:
+            tasks.append(
+                asyncio.create_task(
+                    call(
+                        executor,
+                        args.latency,
+                        guild_id,
+                        Priority.INTERACTIVE,
+                        waits["interactive"],
+                    )
+                )
+            )
+        tasks.append(
+            asyncio.create_task(
+                call(executor, args.latency, GUILDS[0], Priority.PLAYBACK, waits["playback"])
+            )
+        )
+    await asyncio.gather(*tasks)
+    executor.shutdown()
+    return waits
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flood", type=int, default=500, help="Background calls of one guild.")
+    parser.add_argument("--rounds", type=int, default=10, help="Rounds of interactive calls.")
+    parser.add_argument("--workers", type=int, default=4, help="Threads per server.")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds a call takes.")
+    args = parser.parse_args()
+
+    print(f"{args.flood} background calls against {args.workers} workers")
+    print(f"{'mode':<6} {'priority':<12} {'calls':>6} {'p50':>9} {'max':>9}")
+    for mode, fair in (("fifo", False), ("fair", True)):
+        for priority, waits in (await run(args, fair)).items():
+            if waits:
+                print(
+                    f"{mode:<6} {priority:<12} {len(waits):>6} "
+                    f"{statistics.median(waits) * 1000:>7.0f}ms {max(waits) * 1000:>7.0f}ms"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
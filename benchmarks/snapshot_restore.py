@@ -0,0 +1,90 @@
+"""Time to restore the queues of many guilds from their snapshots.
+
+Writes the snapshots of `--guilds` guilds with `--queue` tracks queued each,
+followed by a few rounds of position records as if they had been playing.
+Then times loading the file, which is all the cog does on startup, and
+refilling the queue of a guild, which happens on its first command. Nothing
+talks to Plex, entries are only fetched from it once they are played.
+
+    python -m benchmarks.snapshot_restore --guilds 1000 --queue 200
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from PlexMusic.queue import PlayQueue, QueueEntry
+from PlexMusic.snapshots import SnapshotStore, full_record, position_record, restore_entries
+
+SERVERS = [SimpleNamespace(machineIdentifier=f"{i:040x}") for i in range(3)]
+
+
+def make_entry(guild_id: int, i: int) -> QueueEntry:
+    return QueueEntry(
+        SERVERS[i % len(SERVERS)],
+        guild_id * 100000 + i,
+        215000,
+        guild_id * 1000 + i // 12,
+        guild_id * 100 + i // 120,
+        f"Track {i} of guild {guild_id}",
+        guild_id + 1,
+    )
+
+
+async def run(guilds: int, queue: int, rounds: int, directory: Path) -> dict:
+    store = SnapshotStore(directory / "queues.jsonl")
+    queues = {g: [make_entry(g, i) for i in range(queue)] for g in range(guilds)}
+    await store.append(
+        [full_record(g, entries[1:], entries[0], 0, g, g) for g, entries in queues.items()]
+    )
+    for n in range(1, rounds + 1):
+        await store.append(
+            [position_record(g, 1, entries[n], 5000 * n, g, g) for g, entries in queues.items()]
+        )
+    size = store.path.stat().st_size
+    store.close([])
+
+    store = SnapshotStore(directory / "queues.jsonl")
+    servers = {s.machineIdentifier: s for s in SERVERS}
+    start = time.perf_counter()
+    stored = await store.load()
+    loaded = time.perf_counter()
+    restored = 0
+    for guild in stored.values():
+        snapshot = guild.snapshot()
+        play_queue = PlayQueue()
+        rows = [snapshot.current, *snapshot.queue]
+        for entry in restore_entries(snapshot, rows, servers):
+            play_queue.put_nowait(entry)
+        restored += len(play_queue)
+    done = time.perf_counter()
+    store.close([])
+    return {
+        "file_kb": size / 1024,
+        "load_ms": (loaded - start) * 1000,
+        "per_guild_ms": (done - loaded) * 1000 / len(stored),
+        "every_guild_ms": (done - loaded) * 1000,
+        "entries": restored,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=1000, help="Guilds with a queue.")
+    parser.add_argument("--queue", type=int, default=200, help="Tracks queued per guild.")
+    parser.add_argument("--rounds", type=int, default=10, help="Position records per guild.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = asyncio.run(run(args.guilds, args.queue, args.rounds, Path(directory)))
+    print(f"{args.guilds} guilds, {results['entries']} queued tracks")
+    print(f"snapshot file  {results['file_kb']:>10.0f} KB")
+    for name in ("load", "per_guild", "every_guild"):
+        print(f"{name:<14} {results[f'{name}_ms']:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
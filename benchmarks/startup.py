@@ -0,0 +1,69 @@
+"""Time to import the cog in a fresh interpreter, and the modules taking the longest.
+
+Every run imports `PlexMusic` in a new Python process, like a bot loading
+the cog for the first time, and parses the `-X importtime` report of the
+last run for the slowest top level imports. Modules Red already imports,
+like discord.py and aiohttp, are imported first so they aren't counted.
+
+    python -m benchmarks.startup --repeat 5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+PRELOADED = "import discord, aiohttp, redbot.core"
+IMPORT = "import time; start = time.perf_counter(); import PlexMusic; "
+REPORT = "print(time.perf_counter() - start)"
+
+
+def import_once() -> Tuple[float, str]:
+    """Seconds to import the cog and the importtime report of the run."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{PRELOADED}; {IMPORT}{REPORT}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.split()[-1]), result.stderr
+
+
+def slowest(report: str, count: int) -> List[Tuple[float, str]]:
+    """Cumulative milliseconds of the slowest packages PlexMusic imported, its own excluded."""
+    lines = report.splitlines()
+    # Everything after the preloaded modules was imported by the cog.
+    start = max(i for i, line in enumerate(lines) if line.rstrip().endswith("| redbot.core"))
+    imports = []
+    for line in lines[start + 1 :]:
+        if "|" not in line or line.startswith("import time: self"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Packages only, their submodules are part of their cumulative time.
+        if "." not in (name := name.strip()) and name != "PlexMusic":
+            imports.append((int(cumulative) / 1000, name))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to import in.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports listed.")
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.repeat):
+        seconds, report = import_once()
+        samples.append(seconds)
+    print(
+        f"import PlexMusic: median {statistics.median(samples) * 1000:.0f} ms, "
+        f"min {min(samples) * 1000:.0f} ms over {args.repeat} runs"
+    )
+    print(f"{'module':<40} {'cumulative (ms)':>16}")
+    for milliseconds, name in slowest(report, args.top):
+        print(f"{name:<40} {milliseconds:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""CPU seconds spent by the bot per hour of streamed audio, PCM against Opus mode.
+
+PCM mode decodes the track to PCM with FFmpeg and encodes every 20ms frame
+to Opus in the bot process, like discord.py does for `FFmpegPCMAudio`.
+Opus mode remuxes an Ogg Opus stream, as sent by the Plex transcoder, and
+hands the packets over as they are. Frames are read as fast as possible,
+the CPU time of the bot and of its FFmpeg children is measured separately.
+
+Requires ffmpeg and libopus.
+
+    python -m benchmarks.stream_cpu --duration 120 --bitrate 96
+"""
+
+import argparse
+import resource
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Callable, Tuple
+
+import discord
+import discord.opus
+from discord import FFmpegOpusAudio, FFmpegPCMAudio
+
+
+def make_sample(directory: Path, duration: int, bitrate: int) -> Tuple[Path, Path]:
+    """A lossless source track and the Ogg Opus transcode Plex would send for it."""
+    flac = directory / "sample.flac"
+    ogg = directory / "sample.ogg"
+    # Pink noise, so neither encoder gets an easy signal.
+    signal = (
+        f"anoisesrc=color=pink:duration={duration}:sample_rate=48000,"
+        "aformat=channel_layouts=stereo"
+    )
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", signal, str(flac)], check=True
+    )
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", str(flac)]
+        + ["-c:a", "libopus", "-b:a", f"{bitrate}k", str(ogg)],
+        check=True,
+    )
+    return flac, ogg
+
+
+def cpu_times() -> Tuple[float, float]:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def measure(build: Callable[[], discord.AudioSource], encode: bool) -> Tuple[float, float, int]:
+    encoder = discord.opus.Encoder() if encode else None
+    own_before, children_before = cpu_times()
+    source = build()
+    frames = 0
+    while data := source.read():
+        if encoder:
+            # What `VoiceClient.send_audio_packet` does for sources that aren't Opus.
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+        frames += 1
+    source.cleanup()
+    own_after, children_after = cpu_times()
+    return own_after - own_before, children_after - children_before, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=int, default=120, help="Sample length in seconds.")
+    parser.add_argument("--bitrate", type=int, default=96, help="Voice bitrate in kbps.")
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+
+    with tempfile.TemporaryDirectory() as directory:
+        flac, ogg = make_sample(Path(directory), args.duration, args.bitrate)
+        modes = {
+            "pcm": (lambda: FFmpegPCMAudio(str(flac)), True),
+            "opus": (lambda: FFmpegOpusAudio(str(ogg), bitrate=args.bitrate, codec="opus"), False),
+        }
+        print(f"{'mode':>6} {'bot (s/h)':>10} {'ffmpeg (s/h)':>13} {'total (s/h)':>12}")
+        for mode, (build, encode) in modes.items():
+            own, children, frames = measure(build, encode)
+            # Every frame is 20ms of audio.
+            scale = 3600 / (frames * 0.02)
+            print(
+                f"{mode:>6} {own * scale:>10.1f} {children * scale:>13.1f} "
+                f"{(own + children) * scale:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Latency of "did you mean" suggestions over a large library.
+
+Builds the title corpus of `--titles` synthetic tracks, as the cog does
+after every index sync, then times suggestions for exact titles, titles
+with one and two typos, and queries matching nothing. Each query is scored
+against the whole corpus, like a command that found nothing would be.
+
+    python -m benchmarks.suggestions --titles 100000
+"""
+
+import argparse
+import random
+import string
+import time
+from typing import Callable, Dict, List
+
+from PlexMusic.suggestions import TitleCorpus
+
+from .fake_plex import ALBUMS_PER_ARTIST, TRACKS_PER_ALBUM, SyntheticLibrary
+from .hot_paths import summarize
+
+
+def typo(title: str, count: int, rng: random.Random) -> str:
+    """`title` with `count` letters replaced, dropped or swapped."""
+    chars = list(title)
+    for _ in range(count):
+        i = rng.randrange(len(chars) - 1)
+        edit = rng.choice(("replace", "drop", "swap"))
+        if edit == "replace":
+            chars[i] = rng.choice(string.ascii_lowercase)
+        elif edit == "drop":
+            del chars[i]
+        else:
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return "".join(chars)
+
+
+def timed(corpus: TitleCorpus, queries: List[str]) -> Dict[str, float]:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        corpus.suggest(query)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--titles", type=int, default=100000, help="Tracks in the library.")
+    parser.add_argument("--repeat", type=int, default=50, help="Queries per kind.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    library = SyntheticLibrary(args.titles)
+    per_artist = TRACKS_PER_ALBUM * ALBUMS_PER_ARTIST
+    entries = [
+        (library.track_title(i), library.artist_title(i // per_artist)) for i in range(args.titles)
+    ]
+    start = time.perf_counter()
+    corpus = TitleCorpus(entries)
+    build = time.perf_counter() - start
+
+    titles = [library.track_title(rng.randrange(args.titles)) for _ in range(args.repeat)]
+    kinds: Dict[str, Callable[[str], str]] = {
+        "exact": lambda title: title.upper(),
+        "one typo": lambda title: typo(title, 1, rng),
+        "two typos": lambda title: typo(title, 2, rng),
+        "unrelated": lambda title: "".join(rng.choices(string.ascii_lowercase, k=12)),
+    }
+    found = {}
+    results = {}
+    for kind, make in kinds.items():
+        queries = [make(title) for title in titles]
+        results[kind] = timed(corpus, queries)
+        found[kind] = sum(
+            any(s.title == title for s in corpus.suggest(query))
+            for title, query in zip(titles, queries)
+        )
+
+    print(f"{len(corpus)} titles, corpus built in {build * 1000:.0f} ms")
+    print(f"{'query':<12} {'median (ms)':>12} {'p95 (ms)':>10} {'found':>9}")
+    for kind, stats in results.items():
+        print(
+            f"{kind:<12} {stats['median_ms']:>12.2f} {stats['p95_ms']:>10.2f} "
+            f"{found[kind]:>5}/{args.repeat}"
+        )
+
+
+if __name__ == "__main__":
+    main()
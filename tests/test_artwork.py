@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+from PlexMusic.artwork import ArtworkCache
+
+SERVER = SimpleNamespace(machineIdentifier="server")
+PATH = "/library/metadata/1/thumb/1612345678"
+
+
+def test_cancelled_caller_does_not_fail_the_shared_download(tmp_path):
+    async def run():
+        release = asyncio.Event()
+        loads = []
+        cache = ArtworkCache(session=None, path=tmp_path)
+
+        async def load(server, path, key):
+            loads.append(key)
+            await release.wait()
+            return b"art"
+
+        cache._load = load
+        first = asyncio.create_task(cache.get(SERVER, PATH))
+        second = asyncio.create_task(cache.get(SERVER, PATH))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return loads, await second, first.cancelled(), await cache.get(SERVER, PATH)
+
+    loads, shared, cancelled, cached = asyncio.run(run())
+    assert len(loads) == 1
+    assert shared == b"art" and cached == b"art"
+    assert cancelled
+
+
+def test_failed_download_is_no_art(tmp_path):
+    async def run():
+        cache = ArtworkCache(session=None, path=tmp_path)
+
+        async def load(server, path, key):
+            raise OSError
+
+        cache._load = load
+        return await cache.get(SERVER, PATH), cache._inflight
+
+    assert asyncio.run(run()) == (None, {})
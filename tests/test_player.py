@@ -0,0 +1,90 @@
+import asyncio
+
+from PlexMusic.player import PlayerManager
+
+
+class NotConnected(Exception):
+    pass
+
+
+def test_halts_and_keeps_the_queue_without_voice():
+    async def run():
+        played = []
+
+        async def play(guild_id, item, prepared):
+            played.append(item)
+            raise NotConnected
+
+        manager = PlayerManager(play, halt_on=(NotConnected,))
+        player = manager.get(1)
+        for item in range(3):
+            player.queue.put_nowait(item)
+        manager.start(1)
+        await asyncio.wait_for(player.task, 1)
+        return played, list(player.queue), player
+
+    played, queue, player = asyncio.run(run())
+    assert played == [0]
+    assert queue == [0, 1, 2]
+    assert not player.active and player.current is None
+
+
+def test_skips_items_that_fail_to_play():
+    async def run():
+        played = []
+
+        async def play(guild_id, item, prepared):
+            played.append(item)
+            if item == 0:
+                raise ValueError(item)
+            manager.notify_finished(guild_id)
+
+        manager = PlayerManager(play, halt_on=(NotConnected,))
+        player = manager.get(1)
+        for item in range(3):
+            player.queue.put_nowait(item)
+        manager.start(1)
+        while len(played) < 3:
+            await asyncio.sleep(0)
+        manager.shutdown()
+        return played
+
+    assert asyncio.run(run()) == [0, 1, 2]
+
+
+def test_clearing_while_preparing_drops_the_prepared_item():
+    async def run():
+        preparing, release = asyncio.Event(), asyncio.Event()
+        played, discarded = [], []
+
+        async def play(guild_id, item, prepared):
+            played.append(item)
+
+        async def prepare(guild_id, item):
+            preparing.set()
+            await release.wait()
+            return f"source of {item}"
+
+        manager = PlayerManager(
+            play,
+            prepare=prepare,
+            discard=discarded.append,
+            duration=lambda item: 10,
+            lookahead=10,
+        )
+        player = manager.get(1)
+        player.queue.put_nowait("first")
+        player.queue.put_nowait("cleared")
+        manager.start(1)
+        await preparing.wait()
+        player.clear()
+        release.set()
+        await asyncio.sleep(0.01)
+        next_item = player.next_item
+        manager.shutdown()
+        return played, discarded, next_item
+
+    played, discarded, next_item = asyncio.run(run())
+    assert played == ["first"]
+    assert discarded == ["source of cleared"]
+    assert next_item is None
@@ -0,0 +1,95 @@
+import asyncio
+import random
+
+import pytest
+
+from PlexMusic import queue as queue_module
+from PlexMusic.queue import PlayQueue
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Chunks of a few entries get split, emptied and compacted within a short run.
+    monkeypatch.setattr(queue_module, "CHUNK_SIZE", 4)
+
+
+def check(queue: PlayQueue, expected: list):
+    assert len(queue) == len(expected)
+    assert list(queue) == expected
+    assert [queue[i] for i in range(len(expected))] == expected
+    assert queue.empty() == (not expected)
+    assert sum(map(len, queue._chunks)) == len(expected)
+    assert queue._prefix(len(queue._chunks)) == len(expected)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_a_list(seed):
+    rng = random.Random(seed)
+    queue, expected = PlayQueue(), []
+    counter = 0
+    for _ in range(2000):
+        operation = rng.choice(
+            ["append", "append", "insert", "insert", "pop", "popleft", "move", "page"]
+        )
+        if operation == "append":
+            queue.append(counter)
+            expected.append(counter)
+            counter += 1
+        elif operation == "insert":
+            position = rng.randint(-2, len(expected) + 2)
+            queue.insert(position, counter)
+            expected.insert(max(position, 0), counter)
+            counter += 1
+        elif not expected:
+            continue
+        elif operation == "pop":
+            position = rng.randrange(len(expected))
+            assert queue.pop(position) == expected.pop(position)
+        elif operation == "popleft":
+            assert queue.get_nowait() == expected.pop(0)
+        elif operation == "move":
+            source = rng.randrange(len(expected))
+            destination = rng.randrange(len(expected))
+            queue.move(source, destination)
+            expected.insert(destination, expected.pop(source))
+        elif operation == "page":
+            per_page = rng.randint(1, 7)
+            page = rng.randrange(len(expected) // per_page + 2)
+            start = page * per_page
+            assert queue.page(page, per_page) == list(
+                enumerate(expected[start : start + per_page], start)
+            )
+        check(queue, expected)
+        if rng.random() < 0.005:
+            if rng.random() < 0.5:
+                queue.shuffle()
+                expected = list(queue)
+            else:
+                queue.clear()
+                expected = []
+            check(queue, expected)
+
+
+def test_out_of_range():
+    queue = PlayQueue()
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+    with pytest.raises(IndexError):
+        queue.popleft()
+    queue.append("a")
+    with pytest.raises(IndexError):
+        queue[1]
+    with pytest.raises(IndexError):
+        queue.pop(-1)
+
+
+def test_get_waits_for_an_entry():
+    async def run():
+        queue = PlayQueue()
+        getter = asyncio.create_task(queue.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        queue.put_nowait("a")
+        return await getter, queue.taken
+
+    assert asyncio.run(run()) == ("a", 1)
@@ -0,0 +1,67 @@
+import asyncio
+
+from PlexMusic.scheduling import FairScheduler, Priority, request_context
+
+
+def test_priorities_then_guilds_take_turns():
+    async def run():
+        scheduler, order = FairScheduler("server", 1), []
+        await scheduler.acquire()
+
+        async def request(guild_id, priority, tag):
+            with request_context(guild_id=guild_id, priority=priority):
+                async with scheduler.slot():
+                    order.append(tag)
+
+        tasks = [asyncio.create_task(request(1, Priority.BACKGROUND, f"1-{i}")) for i in range(3)]
+        tasks += [asyncio.create_task(request(2, Priority.BACKGROUND, f"2-{i}")) for i in range(2)]
+        tasks.append(asyncio.create_task(request(3, Priority.COSMETIC, "art")))
+        tasks.append(asyncio.create_task(request(3, Priority.PLAYBACK, "stream")))
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler.active
+
+    order, active = asyncio.run(run())
+    assert order == ["stream", "1-0", "2-0", "1-1", "2-1", "1-2", "art"]
+    assert active == 0
+
+
+def test_release_skips_a_waiter_cancelled_in_the_same_iteration():
+    async def run():
+        scheduler = FairScheduler("server", 1)
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        # Cancelling cancels its future at once, its own cleanup only runs after the release.
+        waiter.cancel()
+        scheduler.release()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.wait_for(scheduler.acquire(), 1)
+        return waiter.cancelled(), scheduler.active, scheduler.waiting()
+
+    cancelled, active, waiting = asyncio.run(run())
+    assert cancelled
+    assert active == 1
+    assert not any(waiting.values())
+
+
+def test_timed_out_waiter_gives_the_slot_back():
+    async def run():
+        scheduler = FairScheduler("server", 1)
+        await scheduler.acquire()
+        loop = asyncio.get_running_loop()
+        # Released from another thread right as the waiter times out, like PlexExecutor does.
+        loop.call_later(0.01, scheduler.release)
+        try:
+            await asyncio.wait_for(scheduler.acquire(), 0.01)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            # The release won the race, the slot was handed over before the timeout.
+            scheduler.release()
+        await asyncio.sleep(0.02)
+        await asyncio.wait_for(scheduler.acquire(), 1)
+        return scheduler.active
+
+    assert asyncio.run(run()) == 1
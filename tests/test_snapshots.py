@@ -0,0 +1,37 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from PlexMusic.queue import QueueEntry
+from PlexMusic.snapshots import SnapshotStore, full_record
+
+SERVER = SimpleNamespace(machineIdentifier="server")
+
+
+def test_close_returns_before_writing_and_the_next_store_waits(tmp_path, monkeypatch):
+    path = tmp_path / "queues.jsonl"
+    entries = [QueueEntry(SERVER, i, 1000, None, None, f"track {i}") for i in range(3)]
+    record = full_record(1, entries, None, 0, 2, 3)
+    append = SnapshotStore._append
+
+    def slow_append(self, records):
+        time.sleep(0.2)
+        append(self, records)
+
+    monkeypatch.setattr(SnapshotStore, "_append", slow_append)
+    started = time.perf_counter()
+    SnapshotStore(path).close([record])
+    closed_in = time.perf_counter() - started
+
+    async def reload():
+        store = SnapshotStore(path)
+        try:
+            return await store.load()
+        finally:
+            store.close([])
+
+    guilds = asyncio.run(reload())
+    assert closed_in < 0.1
+    snapshot = guilds[1].snapshot()
+    assert [row[1] for row in snapshot.queue] == [0, 1, 2]
+    assert snapshot.voice_channel_id == 2
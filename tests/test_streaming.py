@@ -0,0 +1,101 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import pytest
+from discord import FFmpegOpusAudio
+from discord.player import FFmpegAudio
+
+from PlexMusic.streaming import MODE_OPUS, StreamResolver
+
+
+@pytest.fixture
+def ffmpeg_args(monkeypatch):
+    """Arguments of every FFmpeg process the sources would have started."""
+    spawned = []
+
+    def spawn(self, args, **kwargs):
+        spawned.append(args)
+        return SimpleNamespace(
+            pid=0, returncode=0, stdout=io.BytesIO(), kill=lambda: None, poll=lambda: 0
+        )
+
+    monkeypatch.setattr(FFmpegAudio, "_spawn_process", spawn)
+    return spawned
+
+
+def make_track(codec: str, bitrate: int = 96):
+    server = SimpleNamespace(
+        machineIdentifier="server", url=lambda key, includeToken=False: f"http://plex{key}"
+    )
+    part = SimpleNamespace(key="/library/parts/1/file.ogg")
+    media = SimpleNamespace(audioCodec=codec, container="ogg", bitrate=bitrate, parts=[part])
+    return SimpleNamespace(key="/library/metadata/1", media=[media], _server=server)
+
+
+def codec_of(args) -> str:
+    return args[args.index("-c:a") + 1]
+
+
+def test_opus_direct_copies(ffmpeg_args):
+    resolver = StreamResolver(executors=None)
+    source = asyncio.run(resolver.source(make_track("opus"), MODE_OPUS, 96))
+    assert isinstance(source, FFmpegOpusAudio)
+    assert resolver.streams["opus-direct"] == 1
+    assert codec_of(ffmpeg_args[-1]) == "copy"
+
+
+def test_opus_transcode_copies(ffmpeg_args):
+    resolver = StreamResolver(executors=None)
+    resolver._opus_transcode["server"] = True
+    asyncio.run(resolver.source(make_track("flac"), MODE_OPUS, 96))
+    assert resolver.streams["opus-transcode"] == 1
+    assert codec_of(ffmpeg_args[-1]) == "copy"
+
+
+def test_cached_opus_copies_only_opus(ffmpeg_args):
+    resolver = StreamResolver(executors=None)
+    resolver._cached_source(make_track("opus"), "track.ogg", MODE_OPUS, 96, {})
+    assert codec_of(ffmpeg_args[-1]) == "copy"
+    resolver._cached_source(make_track("flac"), "track.flac", MODE_OPUS, 96, {})
+    assert codec_of(ffmpeg_args[-1]) == "libopus"
+
+
+class FlakyExecutors:
+    """Answers probes with the given results in turn, raising the exceptions among them."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.probes = 0
+
+    async def run_for(self, item, func, *args):
+        self.probes += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_failed_probe_is_retried_later():
+    async def run():
+        executors = FlakyExecutors(TimeoutError(), True)
+        resolver = StreamResolver(executors)
+        track = make_track("flac")
+        answers = [await resolver.supports_opus_transcode(track) for _ in range(2)]
+        resolver._probe_retry["server"] = 0
+        answers.append(await resolver.supports_opus_transcode(track))
+        answers.append(await resolver.supports_opus_transcode(track))
+        return answers, executors.probes
+
+    assert asyncio.run(run()) == ([False, False, True, True], 2)
+
+
+def test_refused_probe_is_final():
+    async def run():
+        executors = FlakyExecutors(False)
+        resolver = StreamResolver(executors)
+        track = make_track("flac")
+        answers = [await resolver.supports_opus_transcode(track) for _ in range(2)]
+        return answers, executors.probes, resolver._probe_retry
+
+    assert asyncio.run(run()) == ([False, False], 1, {})